@@ -0,0 +1,258 @@
+"""Micro-benchmarks for the Database and SubscriptionManager hot paths.
+
+Seeds a scratch database with the bot's real schema (so results carry over
+to data/bot.db) holding N users and N history rows for each requested size,
+then times register_user, get_user_preferences, add_tweet_history (plus
+the flush that writes it), get_user_history, get_user_subscription and
+set_premium_subscription:
+
+- single_writer: each operation run back to back on one connection, with
+  cached reads measured both cold (profile cache cleared) and warm
+- concurrent_readers: several connections reading histories, preferences
+  and tiers while one connection keeps writing
+
+Results go to stdout (or --output) as one JSON document per size, so runs
+can be diffed over time:
+
+    python -m benchmarks.db_bench --sizes 10000 1000000 10000000 --output bench.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+from models.database import Database
+from models.history_codec import pack_tweets
+from models.subscription import SubscriptionManager
+
+SEED_BATCH = 50000
+
+NICHES = ('SaaS', 'Marketing', 'Technology', 'Business', 'Other')
+TONES = ('Professional', 'Casual', 'Humorous', 'Educational')
+
+def seed(path: str, users: int, history_rows: int, premium_share: float = 0.2) -> None:
+    """Fill a migrated database with users, subscriptions and history rows."""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous=OFF')
+    preferences = [json.dumps({'niche': niche, 'tone': tone}) for niche in NICHES for tone in TONES]
+
+    for offset in range(0, users, SEED_BATCH):
+        conn.executemany(
+            'INSERT INTO users (user_id, username, first_name, preferences) VALUES (?, ?, ?, ?)',
+            (
+                (user_id, f'user{user_id}', 'Bench', random.choice(preferences) if user_id % 2 else None)
+                for user_id in range(offset, min(offset + SEED_BATCH, users))
+            )
+        )
+        conn.commit()
+
+    expires_at = datetime.utcnow() + timedelta(days=30)
+    premium = random.sample(range(users), int(users * premium_share))
+    for offset in range(0, len(premium), SEED_BATCH):
+        conn.executemany(
+            "INSERT INTO subscriptions (user_id, tier, expires_at) VALUES (?, 'premium', ?)",
+            ((user_id, expires_at) for user_id in premium[offset:offset + SEED_BATCH])
+        )
+        conn.commit()
+
+    tweets = pack_tweets(['benchmark tweet ' * 12] * 3)
+    start = int(time.time()) - history_rows
+    for offset in range(0, history_rows, SEED_BATCH):
+        conn.executemany(
+            '''
+            INSERT INTO tweet_history (user_id, created_at, topic, niche, tone, category, tweets)
+            VALUES (?, datetime(?, 'unixepoch'), 'benchmark topic', 'SaaS', 'Casual', NULL, ?)
+            ''',
+            (
+                (random.randrange(users), start + i, tweets)
+                for i in range(offset, min(offset + SEED_BATCH, history_rows))
+            )
+        )
+        conn.commit()
+
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+
+def summarize(samples: List[float], elapsed: float = None) -> Dict:
+    samples = sorted(samples)
+    result = {
+        'count': len(samples),
+        'p50_us': round(samples[len(samples) // 2] * 1e6, 1),
+        'p95_us': round(samples[int(len(samples) * 0.95)] * 1e6, 1),
+        'p99_us': round(samples[int(len(samples) * 0.99)] * 1e6, 1),
+        'max_us': round(samples[-1] * 1e6, 1)
+    }
+    if elapsed:
+        result['ops_per_second'] = round(len(samples) / elapsed)
+    return result
+
+async def time_operation(operation: Callable[[int], Awaitable], iterations: int,
+                         prepare: Callable[[int], None] = None) -> Dict:
+    """Time operation(i) for each iteration; prepare(i) runs untimed before it."""
+    samples = []
+    for i in range(iterations):
+        if prepare:
+            prepare(i)
+        started = time.perf_counter()
+        await operation(i)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+async def single_writer(db: Database, users: int, iterations: int) -> Dict:
+    subscriptions = SubscriptionManager(db)
+    user_ids = [random.randrange(users) for _ in range(iterations)]
+    new_ids = range(users, users + iterations)
+    forget = lambda i: db.profiles.invalidate(user_ids[i])
+
+    results = {
+        'register_user_new': await time_operation(
+            lambda i: db.register_user(new_ids[i], f'new{i}', 'Bench'), iterations),
+        'register_user_existing': await time_operation(
+            lambda i: db.register_user(user_ids[i], f'user{user_ids[i]}', 'Bench'), iterations),
+        'get_user_preferences_cold': await time_operation(
+            lambda i: db.get_user_preferences(user_ids[i]), iterations, forget),
+        'get_user_preferences_warm': await time_operation(
+            lambda i: db.get_user_preferences(user_ids[i]), iterations),
+        'get_user_subscription_cold': await time_operation(
+            lambda i: subscriptions.get_user_subscription(user_ids[i]), iterations, forget),
+        'get_user_subscription_warm': await time_operation(
+            lambda i: subscriptions.get_user_subscription(user_ids[i]), iterations),
+        'set_premium_subscription': await time_operation(
+            lambda i: subscriptions.set_premium_subscription(user_ids[i]), iterations),
+        'get_user_history': await time_operation(
+            lambda i: db.get_user_history(user_ids[i]), iterations),
+    }
+
+    # History writes are buffered, so time queueing and the batched flush separately
+    input_data = {'topic': 'benchmark topic', 'niche': 'SaaS', 'tone': 'Casual'}
+    tweets = ['benchmark tweet ' * 12] * 3
+    db.writes.max_pending = iterations + 1
+    results['add_tweet_history'] = await time_operation(
+        lambda i: db.add_tweet_history(user_ids[i], input_data, tweets), iterations)
+    started = time.perf_counter()
+    await db.flush()
+    elapsed = time.perf_counter() - started
+    results['flush_history'] = {
+        'rows': iterations,
+        'seconds': round(elapsed, 4),
+        'rows_per_second': round(iterations / elapsed)
+    }
+    return results
+
+async def concurrent_readers(path: str, users: int, readers: int, duration: float) -> Dict:
+    """Run reader connections against one writer connection for duration seconds."""
+    writer_db = Database(path)
+    reader_dbs = [Database(path) for _ in range(readers)]
+    await asyncio.gather(writer_db.connect(), *(db.connect() for db in reader_dbs))
+    deadline = time.monotonic() + duration
+    read_samples: List[float] = []
+    write_samples: List[float] = []
+
+    async def reader(db: Database):
+        subscriptions = SubscriptionManager(db)
+        while time.monotonic() < deadline:
+            user_id = random.randrange(users)
+            # Always go to SQLite; the profile cache would hide contention
+            db.profiles.invalidate(user_id)
+            started = time.perf_counter()
+            await db.get_user_history(user_id)
+            await db.get_user_preferences(user_id)
+            await subscriptions.get_user_subscription(user_id)
+            read_samples.append(time.perf_counter() - started)
+
+    async def writer():
+        subscriptions = SubscriptionManager(writer_db)
+        input_data = {'topic': 'benchmark topic', 'niche': 'SaaS', 'tone': 'Casual'}
+        while time.monotonic() < deadline:
+            user_id = random.randrange(users)
+            started = time.perf_counter()
+            await writer_db.register_user(user_id, f'user{user_id}', 'Bench')
+            await subscriptions.set_premium_subscription(user_id)
+            await writer_db.add_tweet_history(user_id, input_data, ['benchmark tweet'] * 3)
+            await writer_db.flush()
+            write_samples.append(time.perf_counter() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(writer(), *(reader(db) for db in reader_dbs))
+    elapsed = time.monotonic() - started
+    await asyncio.gather(writer_db.close(), *(db.close() for db in reader_dbs))
+    return {
+        'readers': readers,
+        'seconds': round(elapsed, 2),
+        'read_request': summarize(read_samples, elapsed),
+        'write_request': summarize(write_samples, elapsed)
+    }
+
+def environment() -> Dict:
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'git_revision': revision,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z'
+    }
+
+async def run_size(directory: str, size: int, iterations: int, readers: int, duration: float) -> Dict:
+    path = os.path.join(directory, f'bench-{size}.db')
+    db = Database(path)
+    await db.connect()
+    await db.close()
+
+    started = time.perf_counter()
+    seed(path, size, size)
+    seed_seconds = time.perf_counter() - started
+
+    db = Database(path)
+    await db.connect()
+    writer_results = await single_writer(db, size, iterations)
+    await db.close()
+
+    return {
+        'benchmark': 'db_bench',
+        'users': size,
+        'history_rows': size,
+        'seed_seconds': round(seed_seconds, 1),
+        'database_bytes': os.path.getsize(path),
+        'environment': environment(),
+        'single_writer': writer_results,
+        'concurrent_readers': await concurrent_readers(path, size, readers, duration)
+    }
+
+async def run(sizes: List[int], iterations: int, readers: int, duration: float, output) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sorted(sizes):
+            result = await run_size(directory, size, iterations, readers, duration)
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            os.remove(os.path.join(directory, f'bench-{size}.db'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                        help='users and history rows to seed, e.g. 10000 1000000 10000000')
+    parser.add_argument('--iterations', type=int, default=1000, help='calls timed per operation')
+    parser.add_argument('--readers', type=int, default=4, help='reader connections in the concurrent run')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of the concurrent run')
+    parser.add_argument('--output', help='append results to this JSON lines file instead of stdout')
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, 'a') as output:
+            asyncio.run(run(args.sizes, args.iterations, args.readers, args.duration, output))
+    else:
+        asyncio.run(run(args.sizes, args.iterations, args.readers, args.duration, sys.stdout))
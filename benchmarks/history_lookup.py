@@ -0,0 +1,87 @@
+"""Benchmark per-user history lookups as tweet_history grows.
+
+Seeds a scratch database to each requested size and times
+Database.get_user_history for random users, with and without the
+(user_id, created_at DESC) index, so the effect of the index is visible:
+
+    python -m benchmarks.history_lookup --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from models.database import Database
+from models.history_codec import pack_tweets
+
+HISTORY_INDEX = 'idx_tweet_history_user_created'
+
+def seed(path: str, start: int, stop: int, users: int) -> None:
+    """Insert history rows with ids in [start, stop) spread over the given users."""
+    tweets = pack_tweets(['x' * 200] * 3)
+    conn = sqlite3.connect(path)
+    batch = 50000
+    for offset in range(start, stop, batch):
+        conn.executemany(
+            '''
+            INSERT INTO tweet_history (id, user_id, created_at, topic, niche, tone, category, tweets)
+            VALUES (?, ?, datetime(1700000000 + ?, 'unixepoch'), 'benchmark topic', 'SaaS', 'Casual', NULL, ?)
+            ''',
+            (
+                (i + 1, random.randrange(users), i, tweets)
+                for i in range(offset, min(offset + batch, stop))
+            )
+        )
+        conn.commit()
+    conn.close()
+
+async def time_lookups(db: Database, users: int, lookups: int) -> dict:
+    samples = []
+    for _ in range(lookups):
+        user_id = random.randrange(users)
+        started = time.perf_counter()
+        await db.get_user_history(user_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95)], 3)
+    }
+
+async def run(sizes, users: int, lookups: int, compare: bool) -> list:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        db = Database(path)
+        conn = await db.connect()
+        seeded = 0
+        for size in sorted(sizes):
+            await db.close()
+            seed(path, seeded, size, users)
+            seeded = size
+            conn = await db.connect()
+
+            result = {'rows': size, 'indexed': await time_lookups(db, users, lookups)}
+            if compare:
+                await conn.execute(f'DROP INDEX {HISTORY_INDEX}')
+                result['unindexed'] = await time_lookups(db, users, max(10, lookups // 20))
+                await conn.execute(
+                    f'CREATE INDEX {HISTORY_INDEX} ON tweet_history (user_id, created_at DESC, id DESC)'
+                )
+            results.append(result)
+            print(json.dumps(result))
+        await db.close()
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=500)
+    parser.add_argument('--no-compare', action='store_true', help="skip the unindexed run")
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.users, args.lookups, not args.no_compare))
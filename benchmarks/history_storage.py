@@ -0,0 +1,77 @@
+"""Report tweet_history bytes per row before and after the compact storage migration.
+
+Builds a scratch database in the legacy layout (JSON input_data and
+generated_tweets), fills it with synthetic generations, then applies the
+compaction migration and compares file sizes after VACUUM:
+
+    python -m benchmarks.history_storage --rows 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import aiosqlite
+from models.migrations import migrate, LEGACY_HISTORY_VERSION
+
+WORDS = (
+    "startup growth product users launch team build ship feedback customers "
+    "AI data cloud pricing churn retention marketing content strategy insight "
+    "today lesson learned mistake win founders remote hiring culture scale"
+).split()
+NICHES = ['SaaS', 'Marketing', 'Technology', 'Business', 'Other']
+TONES = ['Professional', 'Casual', 'Humorous', 'Educational']
+
+def fake_tweet() -> str:
+    text = ' '.join(random.choice(WORDS) for _ in range(random.randint(25, 40)))
+    return f"{text[:230].capitalize()} 🚀 #{random.choice(WORDS)} #{random.choice(WORDS)}"
+
+def legacy_row(user_id: int):
+    input_data = {
+        'topic': ' '.join(random.choice(WORDS) for _ in range(4)),
+        'niche': random.choice(NICHES),
+        'tone': random.choice(TONES)
+    }
+    tweets = [fake_tweet() for _ in range(random.choice([1, 1, 3, 5]))]
+    return user_id, json.dumps(input_data), json.dumps(tweets)
+
+async def table_bytes(conn: aiosqlite.Connection, path: str) -> int:
+    await conn.execute('VACUUM')
+    return os.path.getsize(path)
+
+async def run(rows: int, users: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        conn = await aiosqlite.connect(path)
+        try:
+            await migrate(conn, target=LEGACY_HISTORY_VERSION)
+            empty = await table_bytes(conn, path)
+
+            for offset in range(0, rows, 10000):
+                await conn.executemany(
+                    'INSERT INTO tweet_history (user_id, input_data, generated_tweets) VALUES (?, ?, ?)',
+                    [legacy_row(random.randrange(users)) for _ in range(min(10000, rows - offset))]
+                )
+                await conn.commit()
+            before = await table_bytes(conn, path)
+
+            await migrate(conn)
+            after = await table_bytes(conn, path)
+        finally:
+            await conn.close()
+
+    result = {
+        'rows': rows,
+        'bytes_per_row_before': round((before - empty) / rows, 1),
+        'bytes_per_row_after': round((after - empty) / rows, 1)
+    }
+    result['reduction'] = round(1 - result['bytes_per_row_after'] / result['bytes_per_row_before'], 3)
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=5000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.rows, args.users))))
@@ -0,0 +1,49 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+import os
+import json
+from datetime import datetime, timedelta
+from services.scheduler import scheduler
+from services.deepseek_service import generation_cache, router
+from services.resilience import upstream
+from services.model_selection import model_selector
+from services.usage import usage_meter
+
+# Telegram user ids allowed to use operator commands
+ADMIN_USER_IDS = {
+    int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip()
+}
+
+def is_admin(user_id: int) -> bool:
+    """Check whether a user may use operator commands."""
+    return user_id in ADMIN_USER_IDS
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show LLM queue and cache statistics to operators."""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    stats = {
+        'scheduler': scheduler.stats(),
+        'upstream': upstream.stats(),
+        'providers': router.stats(),
+        'models': model_selector.stats(),
+        'generation_cache': generation_cache.stats(),
+        'profile_cache': context.bot_data['db'].profiles.stats(),
+        'last_maintenance': context.bot_data.get('maintenance_report')
+    }
+    await update.message.reply_text(json.dumps(stats, indent=2))
+
+async def usage_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the top token spenders and cost per command to operators.
+
+    Usage: /usage [days] -- defaults to the last 7 days, including today.
+    """
+    if not is_admin(update.effective_user.id):
+        return
+    
+    days = int(context.args[0]) if context.args and context.args[0].isdigit() else 7
+    since_day = (datetime.utcnow() - timedelta(days=max(days, 1) - 1)).strftime('%Y-%m-%d')
+    report = await usage_meter.report(since_day)
+    report['since'] = since_day
+    await update.message.reply_text(json.dumps(report, indent=2))
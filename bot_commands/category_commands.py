@@ -2,11 +2,11 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, CommandHandler
 from utils.categories import TweetCategory, CATEGORY_DESCRIPTIONS, get_category_prompt
 from services.deepseek_service import generate_tweets
-from models.database import Database
+from services.cache import make_cache_key
+from services.streaming import StreamingReply
 from utils.exceptions import ValidationError
 from utils.validation import validate_topic
-
-db = Database()
+from utils.rate_limit import rate_limited
 
 async def categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show available tweet categories."""
@@ -41,7 +41,7 @@ async def handle_category_selection(update: Update, context: ContextTypes.DEFAUL
     
     # Get user preferences
     user_id = update.effective_user.id
-    preferences = db.get_user_preferences(user_id)
+    preferences = await context.bot_data['db'].get_user_preferences(user_id)
     if preferences:
         niche = preferences.get('niche', 'General')
         tone = preferences.get('tone', 'Professional')
@@ -60,6 +60,9 @@ async def handle_category_selection(update: Update, context: ContextTypes.DEFAUL
     # Set up for the next message to be handled by generate_category_tweet
     context.user_data['awaiting_topic'] = True
 
+@rate_limited(
+    when=lambda update, context: context.user_data.get('selected_category')
+)
 async def handle_topic(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the topic input for a category."""
     topic = update.message.text
@@ -73,13 +76,33 @@ async def handle_topic(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         topic = validate_topic(topic)
-        prompt = get_category_prompt(category, topic)
         
-        # Pass update and context to generate_tweets
-        tweets = await generate_tweets(prompt, update=update, context=context)
+        # Get user preferences
+        user_id = update.effective_user.id
+        preferences = await context.bot_data['db'].get_user_preferences(user_id)
+        if preferences:
+            niche = preferences.get('niche', 'General')
+            tone = preferences.get('tone', 'Professional')
+        else:
+            niche = 'General'
+            tone = 'Professional'
+        
+        prompt = get_category_prompt(category, topic, niche, tone)
+        
+        # Stream the generation into a single reply message
+        tier = await context.bot_data['subscription_manager'].get_user_subscription(user_id)
+        reply = StreamingReply(update, context)
+        tweets = await generate_tweets(
+            prompt,
+            reply=reply,
+            cache_key=make_cache_key(topic, niche, tone, category.value, tier=tier.value),
+            tier=tier,
+            user_id=user_id,
+            command='category'
+        )
         
         response = "\n\n".join(f"{i+1}. {tweet}" for i, tweet in enumerate(tweets))
-        await update.message.reply_text(
+        await reply.finish(
             f"Here are your {category.value} tweets about {topic}:\n\n{response}"
         )
         
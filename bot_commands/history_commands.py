@@ -1,23 +1,33 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from models.database import Database
 from datetime import datetime
 import json
 
-db = Database()
+# Entries shown per history page
+HISTORY_PAGE_SIZE = 5
 
-async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show user's tweet generation history."""
-    user_id = update.effective_user.id
-    history = db.get_user_history(user_id)
+async def _history_page(context: ContextTypes.DEFAULT_TYPE, user_id: int, **cursor):
+    """Fetch a page of history plus whether older and newer pages exist."""
+    db = context.bot_data['db']
+    # Ask for one extra row to learn whether there is a page beyond this one
+    history = await db.get_user_history(user_id, limit=HISTORY_PAGE_SIZE + 1, **cursor)
     
-    if not history:
-        await update.message.reply_text(
-            "You haven't generated any tweets yet. Use /generate to create some!"
+    if 'after_id' in cursor:
+        has_newer = len(history) > HISTORY_PAGE_SIZE
+        history = history[-HISTORY_PAGE_SIZE:]
+        has_older = bool(history) and bool(
+            await db.get_user_history(user_id, limit=1, before_id=history[-1]['id'])
         )
-        return
-    
-    # Create a formatted message with the history
+    else:
+        has_older = len(history) > HISTORY_PAGE_SIZE
+        history = history[:HISTORY_PAGE_SIZE]
+        has_newer = bool(cursor) and bool(history) and bool(
+            await db.get_user_history(user_id, limit=1, after_id=history[0]['id'])
+        )
+    return history, has_older, has_newer
+
+def _format_history_page(history, has_older: bool, has_newer: bool):
+    """Build the history list message and its keyboard."""
     message = "*Your Recent Tweet History*\n\n"
     for i, entry in enumerate(history, 1):
         input_data = entry['input_data']
@@ -30,15 +40,44 @@ async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message += f"Category: {input_data['category']}\n"
         message += f"First tweet: {tweets[0][:100]}...\n\n"
     
-    # Add buttons to view full details of each entry
+    # Add buttons to view full details of each entry; they carry the entry id
+    # and the first id on the page so "Back" can return to this page
+    page_id = history[0]['id']
     keyboard = []
-    for i in range(len(history)):
+    for i, entry in enumerate(history, 1):
         keyboard.append([InlineKeyboardButton(
-            f"View Full Entry #{i+1}",
-            callback_data=f"history_view_{i}"
+            f"View Full Entry #{i}",
+            callback_data=f"history_view_{entry['id']}_{page_id}"
         )])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    navigation = []
+    if has_newer:
+        navigation.append(InlineKeyboardButton(
+            "« Newer",
+            callback_data=f"history_newer_{page_id}"
+        ))
+    if has_older:
+        navigation.append(InlineKeyboardButton(
+            "Older »",
+            callback_data=f"history_older_{history[-1]['id']}"
+        ))
+    if navigation:
+        keyboard.append(navigation)
+    
+    return message, InlineKeyboardMarkup(keyboard)
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show user's tweet generation history."""
+    user_id = update.effective_user.id
+    history, has_older, has_newer = await _history_page(context, user_id)
+    
+    if not history:
+        await update.message.reply_text(
+            "You haven't generated any tweets yet. Use /generate to create some!"
+        )
+        return
+    
+    message, reply_markup = _format_history_page(history, has_older, has_newer)
     
     await update.message.reply_text(
         message,
@@ -51,16 +90,22 @@ async def view_history_entry(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    # Extract entry index from callback data
-    entry_index = int(query.data.split('_')[-1])
+    # Extract entry id and the page it was opened from
     user_id = update.effective_user.id
-    history = db.get_user_history(user_id)
+    parts = query.data.split('_')[2:]
+    if len(parts) == 1:
+        # Buttons sent before entries carried their id hold a position on the first page
+        history, _, _ = await _history_page(context, user_id)
+        index = int(parts[0])
+        entry_id, page_id = (history[index]['id'], history[0]['id']) if index < len(history) else (0, 0)
+    else:
+        entry_id, page_id = (int(part) for part in parts)
+    entry = await context.bot_data['db'].get_history_entry(user_id, entry_id)
     
-    if not history or entry_index >= len(history):
+    if not entry:
         await query.message.edit_text("Entry not found.")
         return
     
-    entry = history[entry_index]
     input_data = entry['input_data']
     tweets = entry['generated_tweets']
     created_at = datetime.strptime(entry['created_at'], '%Y-%m-%d %H:%M:%S')
@@ -81,7 +126,7 @@ async def view_history_entry(update: Update, context: ContextTypes.DEFAULT_TYPE)
         message += f"\n{i}. {tweet}\n"
     
     # Add back button
-    keyboard = [[InlineKeyboardButton("« Back to History", callback_data="history_back")]]
+    keyboard = [[InlineKeyboardButton("« Back to History", callback_data=f"history_page_{page_id}")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.message.edit_text(
@@ -91,9 +136,32 @@ async def view_history_entry(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
 
 async def back_to_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Return to the main history view."""
+    """Show another history page: back from an entry, or older/newer navigation."""
     query = update.callback_query
     await query.answer()
     
-    # Recreate the history view
-    await history_command(update, context) 
\ No newline at end of file
+    if query.data == 'history_back':
+        # Sent by entries opened before pages had ids; show the first page
+        cursor = {}
+    else:
+        _, direction, cursor_id = query.data.split('_')
+        cursor = {
+            'page': {'start_id': int(cursor_id)},
+            'older': {'before_id': int(cursor_id)},
+            'newer': {'after_id': int(cursor_id)}
+        }[direction]
+    
+    user_id = update.effective_user.id
+    history, has_older, has_newer = await _history_page(context, user_id, **cursor)
+    
+    if not history:
+        await query.message.edit_text("No more entries.")
+        return
+    
+    message, reply_markup = _format_history_page(history, has_older, has_newer)
+    
+    await query.message.edit_text(
+        message,
+        reply_markup=reply_markup,
+        parse_mode='Markdown'
+    )
@@ -1,6 +1,5 @@
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, filters
-from models.database import Database
 
 # Conversation states
 CHOOSING_NICHE = 0
@@ -10,8 +9,6 @@ CHOOSING_TONE = 1
 NICHES = ['SaaS', 'Marketing', 'Technology', 'Business', 'Other']
 TONES = ['Professional', 'Casual', 'Humorous', 'Educational']
 
-db = Database()
-
 async def start_preferences(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the preferences setting conversation."""
     keyboard = [[niche] for niche in NICHES]
@@ -45,7 +42,7 @@ async def save_tone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'tone': update.message.text
     }
     
-    db.set_user_preferences(user_id, preferences)
+    await context.bot_data['db'].set_user_preferences(user_id, preferences)
     
     await update.message.reply_text(
         f"Perfect! Your preferences have been saved:\n"
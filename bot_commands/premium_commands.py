@@ -1,20 +1,19 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler
-from models.subscription import SubscriptionTier, SubscriptionManager
-from services.deepseek_service import generate_tweets
-from models.database import Database
+from models.subscription import SubscriptionTier
+from services import thread_service
+from services.cache import make_cache_key
+from services.streaming import StreamingReply
+from utils.rate_limit import rate_limited
 
 # Conversation states
 THREAD_TOPIC = 0
 THREAD_LENGTH = 1
 
-db = Database()
-subscription_manager = SubscriptionManager(db)
-
 async def premium_features(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show available premium features."""
     user_id = update.effective_user.id
-    tier = subscription_manager.get_user_subscription(user_id)
+    tier = await context.bot_data['subscription_manager'].get_user_subscription(user_id)
     
     if tier == SubscriptionTier.FREE:
         message = (
@@ -44,7 +43,7 @@ async def premium_features(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def start_thread_generation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the thread generation process."""
     user_id = update.effective_user.id
-    tier = subscription_manager.get_user_subscription(user_id)
+    tier = await context.bot_data['subscription_manager'].get_user_subscription(user_id)
     
     if tier != SubscriptionTier.PREMIUM:
         await update.message.reply_text(
@@ -81,6 +80,7 @@ async def get_thread_length(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return THREAD_LENGTH
 
+@rate_limited()
 async def generate_thread(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Generate the Twitter thread."""
     query = update.callback_query
@@ -88,21 +88,26 @@ async def generate_thread(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     thread_length = int(query.data.split('_')[1])
     topic = context.user_data['thread_topic']
+    tier = await context.bot_data['subscription_manager'].get_user_subscription(update.effective_user.id)
     
-    prompt = (
-        f"Generate a coherent Twitter thread with {thread_length} tweets about {topic}. "
-        f"Make sure the tweets flow naturally and build upon each other. "
-        f"Number each tweet and ensure they're connected logically."
+    # Show the outline and then each tweet in the message that held the length keyboard
+    reply = StreamingReply(update, context, message=query.message, placeholder="🧵 Outlining your thread...")
+    tweets = await thread_service.generate_thread(
+        topic,
+        thread_length,
+        reply=reply,
+        # Threads written before the outline pipeline were independent tweets; don't serve those
+        cache_key=make_cache_key(topic, category='outlined_thread', length=thread_length, tier=tier.value),
+        tier=tier,
+        user_id=update.effective_user.id
     )
     
-    tweets = await generate_tweets(prompt, n=thread_length)
-    
     # Format the thread
     response = "*Your Twitter Thread*\n\n"
     for i, tweet in enumerate(tweets, 1):
         response += f"*Tweet {i}:*\n{tweet}\n\n"
     
-    await query.message.edit_text(
+    await reply.finish(
         response,
         parse_mode='Markdown'
     )
@@ -118,7 +123,7 @@ async def cancel_thread(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def check_subscription_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Check and inform user about their subscription status."""
     user_id = update.effective_user.id
-    tier = subscription_manager.get_user_subscription(user_id)
+    tier = await context.bot_data['subscription_manager'].get_user_subscription(user_id)
     
     if tier == SubscriptionTier.PREMIUM:
         await update.message.reply_text(
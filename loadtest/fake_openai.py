@@ -0,0 +1,242 @@
+"""A local OpenAI-compatible chat completions server for load tests.
+
+Answers POST /v1/chat/completions (plain and streamed, any ``n``) with
+canned tweets after a configurable latency, and fails a configurable share
+of requests. Requests for an "N-point outline" (the thread pipeline's first
+step) get N numbered lines instead. Point the bot at it with OPENAI_BASE_URL:
+
+    python -m loadtest.fake_openai --port 8089 --latency-median 2 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python main.py
+
+Faults for exercising the bot's retries, hedging and circuit breaker:
+
+    --error-status 429          rate limit answers (with Retry-After: 1)
+    --slow-rate 0.05            5% of requests take --slow-factor times longer
+    --stall-rate 0.01           1% of requests never answer
+    --outage 20:30              every request fails from 20s to 50s after start
+
+--model-latency gpt-3.5-turbo-1106=0.25 makes requests for that model four
+times faster than the median, to exercise the bot's model selection.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+import time
+import uuid
+from typing import Dict
+import tornado.web
+from tornado.httpserver import HTTPServer
+
+logger = logging.getLogger(__name__)
+
+TWEET_WORDS = (
+    'ship', 'growth', 'users', 'build', 'launch', 'feedback', 'metrics', 'simple',
+    'product', 'team', 'focus', 'learn', 'scale', 'customers', 'iterate', 'today'
+)
+
+OUTLINE_REQUEST = re.compile(r'(\d+)-point outline')
+
+class BackendProfile:
+    """Latency and failure behaviour of the fake backend.
+
+    Total response time is log-normal around latency_median seconds (sigma
+    controls the tail); streamed responses spend first_token_share of it
+    before the first chunk and spread the rest across the chunks. A request
+    fails with error_status with probability error_rate, and every request
+    does during the outage window (outage_duration seconds, starting
+    outage_start seconds after the server starts). slow_rate of
+    requests take slow_factor times longer and stall_rate of them never
+    answer. model_latency scales the response time of requests for the
+    given models.
+    """
+
+    def __init__(self, latency_median: float = 1.5, latency_sigma: float = 0.4,
+                 first_token_share: float = 0.3, error_rate: float = 0.0,
+                 error_status: int = 500, tokens_per_tweet: int = 40,
+                 slow_rate: float = 0.0, slow_factor: float = 10.0, stall_rate: float = 0.0,
+                 outage_start: float = 0.0, outage_duration: float = 0.0,
+                 model_latency: Dict[str, float] = None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.first_token_share = first_token_share
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.tokens_per_tweet = tokens_per_tweet
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.stall_rate = stall_rate
+        self.outage_start = outage_start
+        self.outage_duration = outage_duration
+        self.model_latency = model_latency or {}
+        self.started_at = time.monotonic()
+
+    def latency(self, model: str = None) -> float:
+        latency = random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+        latency *= self.model_latency.get(model, 1.0)
+        if random.random() < self.slow_rate:
+            latency *= self.slow_factor
+        return latency
+
+    def in_outage(self) -> bool:
+        elapsed = time.monotonic() - self.started_at
+        return self.outage_start <= elapsed < self.outage_start + self.outage_duration
+
+    def fails(self) -> bool:
+        return self.in_outage() or random.random() < self.error_rate
+
+    def stalls(self) -> bool:
+        return random.random() < self.stall_rate
+
+def _tweet(words: int) -> str:
+    return ' '.join(random.choice(TWEET_WORDS) for _ in range(words)).capitalize() + '.'
+
+def _content(request: dict, words: int) -> str:
+    """A canned answer to the request's last message."""
+    messages = request.get('messages') or [{}]
+    outline = OUTLINE_REQUEST.search(messages[-1].get('content', ''))
+    if outline:
+        return '\n'.join(f'{i}. {_tweet(8)}' for i in range(1, int(outline.group(1)) + 1))
+    return _tweet(words)
+
+def _usage(request: dict, completion_tokens: int) -> dict:
+    prompt_tokens = sum(len(message.get('content', '')) for message in request.get('messages', [])) // 4
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens
+    }
+
+class ChatCompletionsHandler(tornado.web.RequestHandler):
+    def initialize(self, profile: BackendProfile):
+        self.profile = profile
+
+    async def post(self):
+        request = json.loads(self.request.body)
+        n = int(request.get('n') or 1)
+        model = request.get('model', 'gpt-4')
+        latency = self.profile.latency(model)
+
+        if self.profile.stalls():
+            # Hold the connection until the client gives up
+            await asyncio.sleep(3600)
+            return
+
+        if self.profile.fails():
+            await asyncio.sleep(latency * self.profile.first_token_share)
+            self.set_status(self.profile.error_status)
+            if self.profile.error_status == 429:
+                self.set_header('Retry-After', '1')
+            self.write({'error': {'message': 'Injected failure', 'type': 'server_error'}})
+            return
+
+        tweets = [_content(request, self.profile.tokens_per_tweet // 2) for _ in range(n)]
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        created = int(time.time())
+
+        if not request.get('stream'):
+            await asyncio.sleep(latency)
+            self.write({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [
+                    {'index': i, 'message': {'role': 'assistant', 'content': tweet}, 'finish_reason': 'stop'}
+                    for i, tweet in enumerate(tweets)
+                ],
+                'usage': _usage(request, self.profile.tokens_per_tweet * n)
+            })
+            return
+
+        self.set_header('Content-Type', 'text/event-stream')
+        self.set_header('Cache-Control', 'no-cache')
+        await asyncio.sleep(latency * self.profile.first_token_share)
+        words = [tweet.split() for tweet in tweets]
+        # Interleave the choices like real n > 1 streams, keeping each one's words in order
+        order = [i for i, choice_words in enumerate(words) for _ in choice_words]
+        random.shuffle(order)
+        position = [0] * n
+        delay = latency * (1 - self.profile.first_token_share) / max(len(order), 1)
+        for i in order:
+            self._event(completion_id, created, model, i, {'content': words[i][position[i]] + ' '})
+            position[i] += 1
+            await self.flush()
+            await asyncio.sleep(delay)
+        for i in range(n):
+            self._event(completion_id, created, model, i, {}, finish_reason='stop')
+        self.write('data: [DONE]\n\n')
+
+    def _event(self, completion_id: str, created: int, model: str, index: int,
+               delta: dict, finish_reason: str = None):
+        self.write('data: ' + json.dumps({
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': model,
+            'choices': [{'index': index, 'delta': delta, 'finish_reason': finish_reason}]
+        }) + '\n\n')
+
+def build_app(profile: BackendProfile) -> tornado.web.Application:
+    return tornado.web.Application([
+        (r'/v1/chat/completions', ChatCompletionsHandler, {'profile': profile}),
+    ])
+
+async def serve(port: int, profile: BackendProfile, listen: str = '127.0.0.1') -> None:
+    """Serve until cancelled."""
+    profile.started_at = time.monotonic()
+    server = HTTPServer(build_app(profile))
+    server.listen(port, address=listen)
+    logger.info(f"Fake OpenAI backend on http://{listen}:{port}/v1")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.stop()
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--latency-median', type=float, default=1.5, help='median response time (s)')
+    parser.add_argument('--latency-sigma', type=float, default=0.4, help='log-normal sigma of response time')
+    parser.add_argument('--first-token-share', type=float, default=0.3,
+                        help='share of the response time spent before the first streamed chunk')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests that fail')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of failed requests')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='share of requests that are slow')
+    parser.add_argument('--slow-factor', type=float, default=10.0, help='latency multiplier of slow requests')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='share of requests that never answer')
+    parser.add_argument('--outage', default='0:0',
+                        help='START:DURATION seconds after start during which every request fails')
+    parser.add_argument('--model-latency', action='append', default=[], metavar='MODEL=FACTOR',
+                        help='response time multiplier for requests for MODEL (repeatable)')
+
+def profile_from_args(args: argparse.Namespace) -> BackendProfile:
+    outage_start, outage_duration = (float(value) for value in args.outage.split(':'))
+    return BackendProfile(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        first_token_share=args.first_token_share,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        slow_rate=args.slow_rate,
+        slow_factor=args.slow_factor,
+        stall_rate=args.stall_rate,
+        outage_start=outage_start,
+        outage_duration=outage_duration,
+        model_latency={
+            model: float(factor) for model, factor in (value.split('=') for value in args.model_latency)
+        }
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listen', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args.port, profile_from_args(args), args.listen))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""Load test the bot's real handlers offline.
+
+Starts the fake OpenAI backend (loadtest/fake_openai.py) in a separate
+process, builds the real Application from main.build_application with a
+scratch database and a recording Bot API stub, and has N virtual users run
+/generate, /categories (pick a category, send a topic), /history and
+/thread (topic, length) flows against it. Prints a JSON report with
+throughput, p50/p95/p99 latency per step and event loop lag:
+
+    python -m loadtest.run --users 50 --duration 60 --latency-median 2
+    python -m loadtest.run --users 500 --duration 120 --error-rate 0.05
+    LLM_REQUEST_TIMEOUT=5 python -m loadtest.run --stall-rate 0.02 --outage 20:15
+
+--extra-backend starts more fake backends, each with its own median
+latency and no faults, and configures them as extra providers so the
+report shows how the router splits traffic between them:
+
+    python -m loadtest.run --latency-median 2 --extra-backend 0.5 --error-rate 0.1
+
+Model selection shows when the fake models differ in speed, e.g. with a
+tight latency SLO:
+
+    LLM_LATENCY_SLO=3 LLM_SLO_WINDOW=10 python -m loadtest.run --latency-median 2 \
+        --model-latency gpt-4-1106-preview=0.5 --model-latency gpt-3.5-turbo-1106=0.25
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+from telegram import Update
+from loadtest.fake_openai import BackendProfile, add_profile_arguments, profile_from_args, serve
+from loadtest.telegram_stub import RecordingRequest
+
+FIRST_USER_ID = 10_000_000
+
+TOPICS = (
+    'remote work', 'pricing pages', 'cold email', 'product launches', 'onboarding',
+    'churn', 'hiring engineers', 'open source', 'fundraising', 'customer interviews'
+)
+
+THREAD_LENGTHS = (3, 5, 7, 10)
+
+def percentile(samples: List[float], share: float) -> float:
+    """Nearest-rank percentile of already sorted samples."""
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * share))]
+
+def summarize(samples: List[float]) -> Dict:
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 1),
+        'max_ms': round(samples[-1] * 1000, 1) if samples else 0.0
+    }
+
+class SyntheticUpdates:
+    """Build Bot API update JSON for a virtual user."""
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, user_id: int):
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': f'load{user_id}'}
+        self.chat = {'id': user_id, 'type': 'private', 'first_name': self.user['first_name']}
+        self._message_ids = itertools.count(1)
+
+    def message(self, text: str) -> Dict:
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': self.chat,
+            'from': self.user,
+            'text': text
+        }
+        if text.startswith('/'):
+            command = text.split()[0]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return {'update_id': next(self._update_ids), 'message': message}
+
+    def callback(self, data: str) -> Dict:
+        update_id = next(self._update_ids)
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': self.user,
+                'chat_instance': str(self.user['id']),
+                'data': data,
+                'message': {
+                    'message_id': next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': self.chat,
+                    'from': {'id': 1, 'is_bot': True, 'first_name': 'LoadTest'},
+                    'text': 'menu'
+                }
+            }
+        }
+
+def scenario_steps(name: str, updates: SyntheticUpdates, categories: List[str],
+                   premium: bool) -> List[tuple]:
+    """Return the (step label, update JSON) pairs of one flow."""
+    topic = f'{random.choice(TOPICS)} #{random.randrange(1_000_000)}'
+    if name == 'generate':
+        return [('/generate', updates.message(f'/generate {topic}'))]
+    if name == 'categories':
+        return [
+            ('/categories', updates.message('/categories')),
+            ('category_select', updates.callback(f'category_{random.choice(categories)}')),
+            ('category_topic', updates.message(topic)),
+        ]
+    if name == 'history':
+        return [('/history', updates.message('/history'))]
+    if name == 'thread':
+        if not premium:
+            # Free users are turned away after /thread, so the flow ends there
+            return [('/thread', updates.message('/thread'))]
+        return [
+            ('/thread', updates.message('/thread')),
+            ('thread_topic', updates.message(topic)),
+            ('thread_length', updates.callback(f'thread_{random.choice(THREAD_LENGTHS)}')),
+        ]
+    raise ValueError(f'Unknown scenario {name}')
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.loop_lag: List[float] = []
+        self.completed = 0
+
+    async def monitor_loop_lag(self, stop: asyncio.Event, interval: float = 0.05):
+        """Sample how late the event loop wakes a sleeping task."""
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(max(0.0, time.perf_counter() - started - interval))
+
+    async def record_error(self, update, context):
+        self.errors[type(context.error).__name__] += 1
+
+    async def virtual_user(self, app, user_id: int, premium: bool, deadline: float,
+                           mix: Dict[str, float], categories: List[str]):
+        updates = SyntheticUpdates(user_id)
+        names, weights = list(mix), list(mix.values())
+        await asyncio.sleep(random.uniform(0, self.args.ramp_up))
+        while time.monotonic() < deadline:
+            scenario = random.choices(names, weights)[0]
+            for label, data in scenario_steps(scenario, updates, categories, premium):
+                update = Update.de_json(data, app.bot)
+                started = time.perf_counter()
+                await app.process_update(update)
+                self.latencies[label].append(time.perf_counter() - started)
+                self.completed += 1
+                await asyncio.sleep(random.expovariate(1 / self.args.step_delay))
+            await asyncio.sleep(random.expovariate(1 / self.args.think_time))
+
+    async def run(self, directory: str) -> Dict:
+        # main reads its configuration at import time, after configure_environment()
+        import main
+        from models.database import Database
+        from services.deepseek_service import router
+        from services.model_selection import model_selector
+        from services.resilience import upstream
+        from utils.categories import TweetCategory
+
+        request = RecordingRequest(record=bool(self.args.calls_file))
+        app = main.build_application(
+            '1:loadtest',
+            Database(os.path.join(directory, 'bot.db')),
+            receive_updates=False,
+            request=request
+        )
+        app.add_error_handler(self.record_error)
+        await app.initialize()
+        await app.post_init(app)
+        await app.start()
+
+        user_ids = [FIRST_USER_ID + i for i in range(self.args.users)]
+        db = app.bot_data['db']
+        for user_id in user_ids:
+            await db.register_user(user_id, first_name=f'load{user_id}')
+        premium_ids = set(random.sample(user_ids, int(len(user_ids) * self.args.premium_share)))
+        for user_id in premium_ids:
+            await app.bot_data['subscription_manager'].set_premium_subscription(user_id)
+
+        stop = asyncio.Event()
+        lag_monitor = asyncio.create_task(self.monitor_loop_lag(stop))
+        started = time.monotonic()
+        deadline = started + self.args.duration
+        categories = [category.value for category in TweetCategory]
+        await asyncio.gather(*(
+            self.virtual_user(app, user_id, user_id in premium_ids, deadline, parse_mix(self.args.mix), categories)
+            for user_id in user_ids
+        ))
+        elapsed = time.monotonic() - started
+        stop.set()
+        await lag_monitor
+
+        await app.stop()
+        await app.shutdown()
+        await app.post_shutdown(app)
+
+        if self.args.calls_file:
+            with open(self.args.calls_file, 'w') as f:
+                for method, parameters, timestamp in request.calls:
+                    f.write(json.dumps({'method': method, 'parameters': parameters, 'time': timestamp},
+                                       default=str) + '\n')
+
+        return {
+            'users': self.args.users,
+            'seconds': round(elapsed, 1),
+            'updates': self.completed,
+            'updates_per_second': round(self.completed / elapsed, 2),
+            'steps': {label: summarize(samples) for label, samples in sorted(self.latencies.items())},
+            'errors': dict(self.errors),
+            'loop_lag': summarize(self.loop_lag),
+            'upstream': upstream.stats(),
+            'providers': router.stats()['providers'],
+            'models': model_selector.stats(),
+            'telegram_calls': dict(request.counts)
+        }
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _run_backend(port: int, profile: BackendProfile) -> None:
+    asyncio.run(serve(port, profile))
+
+def _wait_for_port(port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Fake backend did not start on port {port}')
+
+def configure_environment(port: int, extra_ports: List[int] = ()) -> None:
+    """Point the bot at the fake backends and lift per-user limits."""
+    os.environ['OPENAI_API_KEY'] = 'loadtest'
+    os.environ['OPENAI_BASE_URL'] = f'http://127.0.0.1:{port}/v1'
+    if extra_ports:
+        names = [f'extra{i}' for i in range(1, len(extra_ports) + 1)]
+        os.environ['LLM_PROVIDERS'] = ','.join(['openai', *names])
+        for name, extra_port in zip(names, extra_ports):
+            os.environ[f'LLM_{name.upper()}_BASE_URL'] = f'http://127.0.0.1:{extra_port}/v1'
+            os.environ[f'LLM_{name.upper()}_API_KEY'] = 'loadtest'
+    # Virtual users act far faster than people; don't let rate limits hide the load
+    os.environ.setdefault('RATE_LIMIT_FREE', '1000000:1000000')
+    os.environ.setdefault('RATE_LIMIT_PREMIUM', '1000000:1000000')
+    os.environ.setdefault('STREAM_EDIT_INTERVAL', '1.0')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to generate load for')
+    parser.add_argument('--ramp-up', type=float, default=5, help='seconds over which users start')
+    parser.add_argument('--think-time', type=float, default=2.0, help='mean pause between flows (s)')
+    parser.add_argument('--step-delay', type=float, default=0.5, help='mean pause between steps of a flow (s)')
+    parser.add_argument('--mix', default='generate=4,categories=3,history=2,thread=1',
+                        help='relative weight of each flow')
+    parser.add_argument('--premium-share', type=float, default=0.3,
+                        help='share of users with an active premium subscription')
+    parser.add_argument('--calls-file', help='write every recorded Bot API call to this JSON lines file')
+    parser.add_argument('--extra-backend', type=float, action='append', default=[], metavar='LATENCY',
+                        help='start another fault-free backend with this median latency as an extra '
+                             'provider (repeatable)')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    profile = profile_from_args(args)
+    profiles = [profile] + [
+        BackendProfile(latency_median=median, latency_sigma=args.latency_sigma, model_latency=profile.model_latency)
+        for median in args.extra_backend
+    ]
+    ports = [_free_port() for _ in profiles]
+    backends = [
+        multiprocessing.get_context('spawn').Process(target=_run_backend, args=(port, profile), daemon=True)
+        for port, profile in zip(ports, profiles)
+    ]
+    for backend in backends:
+        backend.start()
+    try:
+        for port in ports:
+            _wait_for_port(port)
+        configure_environment(ports[0], ports[1:])
+        with tempfile.TemporaryDirectory() as directory:
+            report = asyncio.run(LoadTest(args).run(directory))
+    finally:
+        for backend in backends:
+            backend.terminate()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
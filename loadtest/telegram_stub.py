@@ -0,0 +1,57 @@
+"""A Bot API stand-in that answers locally and records every outbound call."""
+import json
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'}
+
+# Bot API methods whose result is the Message that was sent or edited
+MESSAGE_METHODS = frozenset({
+    'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'sendPhoto',
+    'sendDocument', 'sendInvoice', 'forwardMessage', 'copyMessage'
+})
+
+class RecordingRequest(BaseRequest):
+    """Answer Bot API calls with plausible results instead of going to Telegram.
+
+    Every call is appended to ``calls`` as (method, parameters, timestamp)
+    unless record=False; ``counts`` tallies calls per method either way.
+    """
+
+    def __init__(self, record: bool = True):
+        self.record = record
+        self.calls: List[tuple] = []
+        self.counts: Counter = Counter()
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        self.counts[api_method] += 1
+        if self.record:
+            self.calls.append((api_method, parameters, time.time()))
+        return 200, json.dumps({'ok': True, 'result': self._result(api_method, parameters)}).encode()
+
+    def _result(self, api_method: str, parameters: Dict):
+        if api_method == 'getMe':
+            return BOT_USER
+        if api_method in MESSAGE_METHODS:
+            self._message_id += 1
+            chat_id = parameters.get('chat_id', 0)
+            return {
+                'message_id': parameters.get('message_id', self._message_id),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': parameters.get('text', '')
+            }
+        return True
@@ -1,13 +1,34 @@
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, ConversationHandler, MessageHandler, filters, CallbackQueryHandler, PreCheckoutQueryHandler
+from telegram import Bot, Update
+from telegram.request import BaseRequest
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, ContextTypes, ConversationHandler, MessageHandler, filters, CallbackQueryHandler, PreCheckoutQueryHandler
 import os
 from dotenv import load_dotenv
-from services.deepseek_service import generate_tweets
+from services.deepseek_service import generate_tweets, generation_cache
+from services.usage import usage_meter
+from services.cache import make_cache_key
+from services.streaming import StreamingReply
+from services.webhook_server import serve_webhook
+from services.sharding import ShardedDispatcher
+from services.instrumentation import (
+    InstrumentedRequest,
+    instrument_handlers,
+    start_metrics_server,
+    METRICS_PORT
+)
 from bot_commands.preferences import (
     start_preferences, save_niche, save_tone, cancel,
     CHOOSING_NICHE, CHOOSING_TONE, NICHES, TONES
 )
 from models.database import Database
+from models.write_buffer import FLUSH_INTERVAL
+from models.subscription import (
+    SubscriptionManager,
+    SubscriptionTier,
+    HISTORY_ARCHIVE_DAYS,
+    HISTORY_RETENTION_DAYS
+)
+from models.maintenance import run_maintenance
+from models.persistence import BotData, SQLitePersistence
 from bot_commands.category_commands import (
     categories, 
     handle_category_selection, 
@@ -40,18 +61,28 @@ from services.payment_service import (
     handle_successful_payment,
     precheckout_callback
 )
+from bot_commands.admin_commands import stats_command, usage_command
 from utils.error_handler import handle_error
 from utils.validation import validate_topic
+from utils.rate_limit import rate_limited, rate_limiter
+import argparse
+import asyncio
 import logging
 import logging.handlers
 
 load_dotenv()
 
-db = Database()
+logger = logging.getLogger(__name__)
+
+# Keep generated tweets across restarts unless disabled
+GENERATION_CACHE_PERSIST = os.getenv("GENERATION_CACHE_PERSIST", "true").lower() == "true"
 
+@rate_limited()
 async def generate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Generate tweets with error handling."""
     try:
+        db = context.bot_data['db']
+        subscription_manager = context.bot_data['subscription_manager']
         user_id = update.effective_user.id
         user_input = " ".join(context.args)
         
@@ -59,10 +90,11 @@ async def generate(update: Update, context: ContextTypes.DEFAULT_TYPE):
         topic = validate_topic(user_input)
         
         # Update user's last active timestamp
-        db.update_last_active(user_id)
+        await db.update_last_active(user_id)
+        tier = await subscription_manager.get_user_subscription(user_id)
         
         # Get user preferences
-        preferences = db.get_user_preferences(user_id)
+        preferences = await db.get_user_preferences(user_id)
         if preferences:
             niche = preferences.get('niche', 'General')
             tone = preferences.get('tone', 'Professional')
@@ -75,8 +107,16 @@ async def generate(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"for the {niche} niche in a {tone} tone."
         )
         
-        # Pass update and context to generate_tweets
-        tweets = await generate_tweets(prompt, update=update, context=context)
+        # Stream the generation into a single reply message
+        reply = StreamingReply(update, context)
+        tweets = await generate_tweets(
+            prompt,
+            reply=reply,
+            cache_key=make_cache_key(topic, niche, tone, tier=tier.value),
+            tier=tier,
+            user_id=user_id,
+            command='generate'
+        )
         
         # Store in history
         input_data = {
@@ -84,17 +124,43 @@ async def generate(update: Update, context: ContextTypes.DEFAULT_TYPE):
             'niche': niche,
             'tone': tone
         }
-        db.add_tweet_history(user_id, input_data, tweets)
+        await db.add_tweet_history(user_id, input_data, tweets)
         
         response = "\n\n".join(tweets)
-        await update.message.reply_text(f"Here is your tweet:\n\n{response}")
+        await reply.finish(f"Here is your tweet:\n\n{response}")
         
     except Exception as e:
         # Let the error handler deal with it
         raise
 
+async def persist_rate_limits(context: ContextTypes.DEFAULT_TYPE):
+    """Periodically save changed rate limit buckets."""
+    await context.bot_data['db'].save_rate_limits(rate_limiter.pop_dirty())
+
+async def flush_writes(context: ContextTypes.DEFAULT_TYPE):
+    """Periodically commit buffered activity and history writes."""
+    await context.bot_data['db'].flush()
+
+async def database_maintenance(context: ContextTypes.DEFAULT_TYPE):
+    """Archive and prune history, then reclaim space and refresh statistics."""
+    report = await run_maintenance(
+        context.bot_data['db'],
+        free_retention_days=HISTORY_RETENTION_DAYS[SubscriptionTier.FREE],
+        premium_retention_days=HISTORY_RETENTION_DAYS[SubscriptionTier.PREMIUM],
+        free_archive_days=HISTORY_ARCHIVE_DAYS[SubscriptionTier.FREE],
+        premium_archive_days=HISTORY_ARCHIVE_DAYS[SubscriptionTier.PREMIUM]
+    )
+    context.bot_data['maintenance_report'] = report
+    logger.info(f"Database maintenance finished: {report}")
+
+async def on_shutdown(application: Application):
+    """Save state that is only kept in memory."""
+    db = application.bot_data['db']
+    await db.save_rate_limits(rate_limiter.pop_dirty())
+    await db.close()
+
 # Set up logging
-def setup_logging():
+def setup_logging(log_file: str = 'logs/bot.log'):
     # Create logs directory if it doesn't exist
     os.makedirs('logs', exist_ok=True)
     
@@ -108,7 +174,7 @@ def setup_logging():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         handlers=[
             logging.handlers.RotatingFileHandler(
-                'logs/bot.log',
+                log_file,
                 maxBytes=1024*1024,
                 backupCount=5
             ),
@@ -116,12 +182,53 @@ def setup_logging():
         ]
     )
 
-if __name__ == "__main__":
-    setup_logging()
-    logger = logging.getLogger(__name__)
-    logger.info("Starting bot application")
+def build_application(token: str, db: Database, shard: int = 0, shards: int = 1,
+                      receive_updates: bool = True, request: BaseRequest = None) -> Application:
+    """Build the bot application with all handlers, sharing one database.
+
+    Sharded workers pass their shard index and count, and receive_updates=False
+    since the dispatcher fetches updates for them. Only shard 0 schedules
+    database maintenance. request replaces the HTTP transport to the Bot API
+    (the load test harness passes a local stub); either way it is wrapped to
+    record Bot API latency. With METRICS_PORT set, /metrics is served on
+    METRICS_PORT + shard.
+    """
+    async def on_startup(application: Application):
+        """Open the shared database once and make it available to handlers."""
+        await db.connect()
+        application.bot_data['db'] = db
+        application.bot_data['subscription_manager'] = SubscriptionManager(db)
+        if GENERATION_CACHE_PERSIST:
+            generation_cache.attach_database(db)
+        usage_meter.attach_database(db)
+        rate_limiter.load(await db.load_rate_limits())
+        if METRICS_PORT:
+            start_metrics_server(int(METRICS_PORT) + shard)
+    
+    # Process updates concurrently so one chat's generation doesn't block the others
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .concurrent_updates(True)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .persistence(SQLitePersistence(db, shard=shard, shards=shards))
+        .context_types(ContextTypes(bot_data=BotData))
+    )
+    if not receive_updates:
+        builder = builder.updater(None)
+    builder = builder.request(InstrumentedRequest(request))
+    app = builder.build()
     
-    app = ApplicationBuilder().token(os.getenv("TELEGRAM_BOT_TOKEN")).build()
+    # Save rate limit counters and buffered writes periodically
+    app.job_queue.run_repeating(persist_rate_limits, interval=60, first=60)
+    app.job_queue.run_repeating(flush_writes, interval=FLUSH_INTERVAL, first=FLUSH_INTERVAL)
+    if shard == 0:
+        app.job_queue.run_repeating(
+            database_maintenance,
+            interval=float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "6")) * 60 * 60,
+            first=10 * 60
+        )
     
     # Add error handler
     app.add_error_handler(handle_error)
@@ -136,17 +243,15 @@ if __name__ == "__main__":
             CHOOSING_NICHE: [MessageHandler(filters.Text(NICHES), save_niche)],
             CHOOSING_TONE: [MessageHandler(filters.Text(TONES), save_tone)],
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name="preferences",
+        persistent=True
     )
     app.add_handler(preferences_handler)
     
     # Add category-related handlers
     app.add_handler(CommandHandler("categories", categories))
     app.add_handler(CallbackQueryHandler(handle_category_selection, pattern="^category_"))
-    app.add_handler(MessageHandler(
-        filters.TEXT & ~filters.COMMAND & filters.UpdateType.MESSAGE,
-        handle_topic
-    ))
     
     # Add help command handlers
     app.add_handler(CommandHandler("help", help_command))
@@ -166,11 +271,11 @@ if __name__ == "__main__":
     app.add_handler(CommandHandler("history", history_command))
     app.add_handler(CallbackQueryHandler(
         view_history_entry,
-        pattern="^history_view_[0-9]+$"
+        pattern="^history_view_[0-9]+(_[0-9]+)?$"
     ))
     app.add_handler(CallbackQueryHandler(
         back_to_history,
-        pattern="^history_back$"
+        pattern="^history_((page|older|newer)_[0-9]+|back)$"
     ))
     
     # Add premium feature handlers
@@ -183,7 +288,9 @@ if __name__ == "__main__":
             THREAD_TOPIC: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_thread_length)],
             THREAD_LENGTH: [CallbackQueryHandler(generate_thread, pattern='^thread_[0-9]+$')]
         },
-        fallbacks=[CommandHandler('cancel', cancel_thread)]
+        fallbacks=[CommandHandler('cancel', cancel_thread)],
+        name="thread",
+        persistent=True
     )
     app.add_handler(thread_handler)
     
@@ -202,4 +309,88 @@ if __name__ == "__main__":
     # Add subscription status handler
     app.add_handler(CommandHandler("status", check_subscription_status))
     
-    app.run_polling() 
\ No newline at end of file
+    # Add operator handlers
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CommandHandler("usage", usage_command))
+    
+    # Add the category topic handler last: it takes any plain text, so the
+    # conversations above must get the chance to claim a message first
+    app.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & filters.UpdateType.MESSAGE,
+        handle_topic
+    ))
+    
+    # Time every handler, including conversation steps
+    instrument_handlers(app)
+    
+    return app
+
+def build_worker_application(index: int, workers: int) -> Application:
+    """Build the application run by one sharded worker process."""
+    setup_logging(f'logs/bot-worker{index}.log')
+    return build_application(
+        os.getenv("TELEGRAM_BOT_TOKEN"),
+        Database(),
+        shard=index,
+        shards=workers,
+        receive_updates=False
+    )
+
+async def prepare_database():
+    """Apply migrations once, before workers open the database concurrently."""
+    db = Database()
+    await db.connect()
+    await db.close()
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options; webhook settings default to the environment."""
+    parser = argparse.ArgumentParser(description="Run the tweet generator bot")
+    parser.add_argument("--mode", choices=("polling", "webhook"),
+                        default=os.getenv("BOT_MODE", "polling"),
+                        help="receive updates by long polling (default) or via a webhook")
+    parser.add_argument("--listen", default=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+                        help="address the webhook server binds to")
+    parser.add_argument("--port", type=int, default=int(os.getenv("WEBHOOK_PORT", "8443")),
+                        help="port the webhook server binds to")
+    parser.add_argument("--url-path", default=os.getenv("WEBHOOK_PATH", "telegram"),
+                        help="path Telegram POSTs updates to")
+    parser.add_argument("--webhook-url", default=os.getenv("WEBHOOK_URL"),
+                        help="public base URL to register with Telegram; omit to test locally")
+    parser.add_argument("--secret-token", default=os.getenv("WEBHOOK_SECRET_TOKEN"),
+                        help="secret Telegram must send in the X-Telegram-Bot-Api-Secret-Token header")
+    parser.add_argument("--max-connections", type=int,
+                        default=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")),
+                        help="maximum simultaneous connections Telegram opens to the webhook")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BOT_WORKERS", "1")),
+                        help="worker processes to shard users across; 1 runs everything in-process")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    setup_logging()
+    logger = logging.getLogger(__name__)
+    logger.info("Starting bot application")
+    
+    args = parse_args()
+    webhook_options = dict(
+        listen=args.listen,
+        port=args.port,
+        url_path=args.url_path,
+        webhook_url=args.webhook_url,
+        secret_token=args.secret_token,
+        max_connections=args.max_connections
+    )
+    
+    if args.workers > 1:
+        asyncio.run(prepare_database())
+        dispatcher = ShardedDispatcher(build_worker_application, args.workers)
+        dispatcher.run(
+            Bot(os.getenv("TELEGRAM_BOT_TOKEN")),
+            args.mode,
+            **(webhook_options if args.mode == "webhook" else {})
+        )
+    else:
+        app = build_application(os.getenv("TELEGRAM_BOT_TOKEN"), Database())
+        if args.mode == "webhook":
+            asyncio.run(serve_webhook(app, **webhook_options))
+        else:
+            app.run_polling()
\ No newline at end of file
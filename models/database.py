@@ -1,74 +1,194 @@
-import sqlite3
+import asyncio
+import aiosqlite
 import json
-from typing import Optional, Dict, List
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Dict, List, Iterable
 import os
 from utils.exceptions import DatabaseError
+from models.write_buffer import WriteBehindBuffer
+from models.migrations import migrate, HISTORY_TABLE_SQL, HISTORY_INDEX_SQL
+from models.history_codec import unpack_tweets, join_input
+from models.maintenance import enable_incremental_vacuum, ACTIVE_PREMIUM_USERS_SQL
+from models.profile_cache import UserProfileCache, MISSING
+from utils.metrics import DB_DURATION, timed
 import logging
 
 logger = logging.getLogger(__name__)
 
+DB_PATH = 'data/bot.db'
+
+# Connection tuning applied once when the shared connection is opened
+BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '20000'))
+MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+
 class Database:
-    def __init__(self):
-        try:
-            # Ensure the data directory exists
-            os.makedirs('data', exist_ok=True)
-            self.conn = sqlite3.connect('data/bot.db')
-            self.create_tables()
-        except Exception as e:
-            logger.error(f"Database initialization error: {e}")
-            raise DatabaseError("Could not initialize database")
-
-    def create_tables(self):
-        """Create necessary tables with error handling."""
+    """Async access to the bot's SQLite database.
+
+    Statements run on aiosqlite's background thread, so disk I/O and commits
+    never block the event loop. The connection is opened lazily on first use.
+    One instance is shared by the whole process (see main.build_application)
+    and handlers reach it through ``context.bot_data['db']``.
+
+    Activity, history and token usage writes go through a write-behind buffer
+    and are committed in batches by flush(). Old history rows are moved to a separate
+    archive file (attached as ``archive``) so the hot database stays small. Preferences and subscription tiers are
+    served from an in-process profile cache kept current by write-through.
+    """
+
+    def __init__(self, path: str = DB_PATH, archive_path: str = None):
+        self.path = path
+        self.archive_path = archive_path or os.path.join(os.path.dirname(path), 'archive.db')
+        self.conn: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        # Every coroutine shares the connection, so its open transaction too
+        self._write_lock = asyncio.Lock()
+        self.writes = WriteBehindBuffer()
+        self.profiles = UserProfileCache()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> aiosqlite.Connection:
+        """Open the connection and create tables if that hasn't happened yet."""
+        if self.conn:
+            return self.conn
+        async with self._connect_lock:
+            if self.conn:
+                return self.conn
+            try:
+                # Ensure the data directory exists
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                conn = await aiosqlite.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000)
+                await self.configure(conn)
+                await self.create_tables(conn)
+                await self.attach_archive(conn)
+                self.conn = conn
+            except Exception as e:
+                logger.error(f"Database initialization error: {e}")
+                raise DatabaseError("Could not initialize database")
+        return self.conn
+
+    async def close(self) -> None:
+        """Flush pending writes and close the connection."""
+        if self.conn:
+            await self.flush()
+            await self.conn.close()
+            self.conn = None
+
+    @timed(DB_DURATION, 'flush')
+    async def flush(self) -> None:
+        """Write all buffered activity, history and usage rows in a single transaction."""
+        async with self._flush_lock:
+            if not self.writes.pending:
+                return
+            last_active, history, usage = self.writes.drain()
+            try:
+                async with self.transaction() as conn:
+                    await conn.executemany('''
+                    UPDATE users SET last_active = ? WHERE user_id = ?
+                    ''', last_active)
+                    await conn.executemany('''
+                    INSERT INTO tweet_history
+                        (user_id, created_at, topic, niche, tone, category, tweets)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', history)
+                    await conn.executemany('''
+                    INSERT INTO token_usage
+                        (user_id, day, command, requests, prompt_tokens, completion_tokens, cost_usd)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id, day, command) DO UPDATE SET
+                        requests = requests + excluded.requests,
+                        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                        completion_tokens = completion_tokens + excluded.completion_tokens,
+                        cost_usd = cost_usd + excluded.cost_usd
+                    ''', usage)
+            except aiosqlite.Error as e:
+                logger.error(f"Flush error, keeping {len(last_active) + len(history) + len(usage)} writes: {e}")
+                self.writes.restore(last_active, history, usage)
+
+    def _maybe_flush(self) -> None:
+        """Start a background flush once the buffer reaches its size threshold."""
+        if self.writes.full and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Hold the write lock while the block's statements run, then commit them.
+
+        The connection is shared by every coroutine, so without the lock one
+        caller's commit or rollback would also take in another's half-done
+        writes. The block is rolled back if it raises.
+        """
+        conn = await self.connect()
+        async with self._write_lock:
+            try:
+                yield conn
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+    async def execute(self, sql: str, parameters: Iterable = ()) -> None:
+        """Run a single write statement and commit it."""
+        async with self.transaction() as conn:
+            await conn.execute(sql, parameters)
+
+    async def executemany(self, sql: str, rows: Iterable[Iterable]) -> None:
+        """Run a write statement for many rows in a single transaction."""
+        async with self.transaction() as conn:
+            await conn.executemany(sql, rows)
+
+    async def fetchone(self, sql: str, parameters: Iterable = ()) -> Optional[tuple]:
+        """Run a query and return its first row."""
+        conn = await self.connect()
+        async with conn.execute(sql, parameters) as cursor:
+            return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, parameters: Iterable = ()) -> List[tuple]:
+        """Run a query and return all rows."""
+        conn = await self.connect()
+        async with conn.execute(sql, parameters) as cursor:
+            return await cursor.fetchall()
+
+    async def configure(self, conn: aiosqlite.Connection):
+        """Tune the connection for many concurrent readers and frequent small writes."""
+        # Only possible before the file's header is written, so ahead of the journal mode
+        await enable_incremental_vacuum(conn)
+        await conn.execute('PRAGMA journal_mode=WAL')
+        await conn.execute('PRAGMA synchronous=NORMAL')
+        await conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        # Negative cache_size is in KiB rather than pages
+        await conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        await conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        await conn.execute('PRAGMA temp_store=MEMORY')
+
+    async def create_tables(self, conn: aiosqlite.Connection):
+        """Bring the schema up to date with error handling."""
         try:
-            cursor = self.conn.cursor()
-            
-            # Users table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                preferences TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            ''')
-            
-            # Tweet history table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tweet_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                input_data TEXT,
-                generated_tweets TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-            ''')
-            
-            # Subscriptions table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS subscriptions (
-                user_id INTEGER PRIMARY KEY,
-                tier TEXT NOT NULL,
-                expires_at TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-            ''')
-            
-            self.conn.commit()
-        except sqlite3.Error as e:
+            await migrate(conn)
+        except aiosqlite.Error as e:
             logger.error(f"Table creation error: {e}")
             raise DatabaseError("Could not create database tables")
 
-    def register_user(self, user_id: int, username: str = None, 
+    async def attach_archive(self, conn: aiosqlite.Connection):
+        """Attach the history archive file, creating its table if needed."""
+        try:
+            await conn.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+            await enable_incremental_vacuum(conn, 'archive')
+            await conn.execute('PRAGMA archive.journal_mode=WAL')
+            await conn.execute(HISTORY_TABLE_SQL.format(table='archive.tweet_history'))
+            await conn.execute(HISTORY_INDEX_SQL.format(prefix='archive.'))
+            await conn.commit()
+        except aiosqlite.Error as e:
+            logger.error(f"Archive attach error: {e}")
+            raise DatabaseError("Could not open history archive")
+
+    @timed(DB_DURATION, 'register_user')
+    async def register_user(self, user_id: int, username: str = None,
                      first_name: str = None, last_name: str = None) -> None:
         """Register or update user information."""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
+            await self.execute('''
             INSERT INTO users (user_id, username, first_name, last_name)
             VALUES (?, ?, ?, ?)
             ON CONFLICT(user_id) DO UPDATE SET
@@ -78,39 +198,27 @@ class Database:
                 last_active = CURRENT_TIMESTAMP
             ''', (user_id, username, first_name, last_name,
                  username, first_name, last_name))
-            self.conn.commit()
-        except sqlite3.Error as e:
+        except aiosqlite.Error as e:
             logger.error(f"User registration error: {e}")
             raise DatabaseError("Could not register user")
 
-    def update_last_active(self, user_id: int) -> None:
-        """Update user's last active timestamp."""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-            UPDATE users 
-            SET last_active = CURRENT_TIMESTAMP 
-            WHERE user_id = ?
-            ''', (user_id,))
-            self.conn.commit()
-        except sqlite3.Error as e:
-            logger.error(f"Update last active error: {e}")
-            # Don't raise error for this non-critical operation
-            pass
+    async def update_last_active(self, user_id: int) -> None:
+        """Update user's last active timestamp (buffered)."""
+        self.writes.touch(user_id)
+        self._maybe_flush()
 
-    def get_user_info(self, user_id: int) -> Optional[Dict]:
+    @timed(DB_DURATION, 'get_user_info')
+    async def get_user_info(self, user_id: int) -> Optional[Dict]:
         """Get user information."""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
+            result = await self.fetchone('''
             SELECT username, first_name, last_name, preferences, created_at, last_active
             FROM users WHERE user_id = ?
             ''', (user_id,))
-            result = cursor.fetchone()
-            
+
             if not result:
                 return None
-                
+
             return {
                 'username': result[0],
                 'first_name': result[1],
@@ -119,63 +227,254 @@ class Database:
                 'created_at': result[4],
                 'last_active': result[5]
             }
-        except sqlite3.Error as e:
+        except aiosqlite.Error as e:
             logger.error(f"Get user info error: {e}")
             raise DatabaseError("Could not retrieve user information")
 
-    def get_user_preferences(self, user_id: int) -> Optional[Dict]:
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT preferences FROM users WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        if result and result[0]:
-            return json.loads(result[0])
-        return None
+    @timed(DB_DURATION, 'get_user_preferences')
+    async def get_user_preferences(self, user_id: int) -> Optional[Dict]:
+        cached = self.profiles.get_preferences(user_id)
+        if cached is not MISSING:
+            return dict(cached) if cached else None
+
+        result = await self.fetchone('SELECT preferences FROM users WHERE user_id = ?', (user_id,))
+        preferences = json.loads(result[0]) if result and result[0] else None
+        self.profiles.set_preferences(user_id, preferences)
+        return dict(preferences) if preferences else None
 
-    def set_user_preferences(self, user_id: int, preferences: Dict):
-        cursor = self.conn.cursor()
+    @timed(DB_DURATION, 'set_user_preferences')
+    async def set_user_preferences(self, user_id: int, preferences: Dict):
         preferences_json = json.dumps(preferences)
-        cursor.execute('''
+        await self.execute('''
         INSERT INTO users (user_id, preferences) VALUES (?, ?)
         ON CONFLICT(user_id) DO UPDATE SET preferences = ?
         ''', (user_id, preferences_json, preferences_json))
-        self.conn.commit()
-
-    def add_tweet_history(self, user_id: int, input_data: dict, generated_tweets: list):
-        """Store generated tweets in history."""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tweet_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            input_data TEXT,
-            generated_tweets TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        self.profiles.set_preferences(user_id, dict(preferences))
+
+    async def add_tweet_history(self, user_id: int, input_data: dict, generated_tweets: list):
+        """Store generated tweets in history (buffered)."""
+        self.writes.add_history(user_id, input_data, generated_tweets)
+        self._maybe_flush()
+
+    @timed(DB_DURATION, 'get_user_history')
+    async def get_user_history(self, user_id: int, limit: int = 5, before_id: int = None,
+                               after_id: int = None, start_id: int = None) -> List[Dict]:
+        """Retrieve a page of the user's tweet history, newest first.
+
+        Pages are keyed on (created_at, id) rather than OFFSET, so every page
+        costs one index range scan per file however deep it is:
+        before_id -- entries older than that entry
+        after_id -- entries newer than that entry
+        start_id -- that entry and the ones older than it
+
+        Pages read through to the archive, so archived entries stay browsable
+        for as long as retention keeps them.
+        """
+        # Make sure the user sees their own entries that are still buffered
+        if self.writes.has_history_for(user_id):
+            await self.flush()
+
+        cursor_id = before_id or after_id or start_id
+        condition, order, parameters = '', 'DESC', (user_id,)
+        if cursor_id is not None:
+            # The cursor entry may have moved to the archive since the page was shown
+            position = await self.fetchone('''
+            SELECT created_at, id FROM main.tweet_history WHERE id = ?
+            UNION ALL
+            SELECT created_at, id FROM archive.tweet_history WHERE id = ?
+            LIMIT 1
+            ''', (cursor_id, cursor_id))
+            if position is None:
+                return []
+            if after_id is not None:
+                condition, order = 'AND (created_at, id) > (?, ?)', 'ASC'
+            elif before_id is not None:
+                condition = 'AND (created_at, id) < (?, ?)'
+            else:
+                condition = 'AND (created_at, id) <= (?, ?)'
+            parameters = (user_id, *position)
+
+        page = f'''
+        SELECT id, created_at, topic, niche, tone, category, tweets
+        FROM {{table}}
+        WHERE user_id = ? {condition}
+        ORDER BY created_at {order}, id {order}
+        LIMIT ?
+        '''
+        rows = await self.fetchall(f'''
+        SELECT * FROM ({page.format(table='main.tweet_history')})
+        UNION ALL
+        SELECT * FROM ({page.format(table='archive.tweet_history')})
+        ORDER BY created_at {order}, id {order}
+        LIMIT ?
+        ''', (*parameters, limit, *parameters, limit, limit))
+        if order == 'ASC':
+            rows.reverse()
+
+        return [self._history_entry(row) for row in rows]
+
+    @timed(DB_DURATION, 'get_history_entry')
+    async def get_history_entry(self, user_id: int, entry_id: int) -> Optional[Dict]:
+        """Retrieve a single history entry by id, if it belongs to the user, hot or archived."""
+        row = await self.fetchone('''
+        SELECT id, created_at, topic, niche, tone, category, tweets
+        FROM main.tweet_history
+        WHERE id = ? AND user_id = ?
+        UNION ALL
+        SELECT id, created_at, topic, niche, tone, category, tweets
+        FROM archive.tweet_history
+        WHERE id = ? AND user_id = ?
+        LIMIT 1
+        ''', (entry_id, user_id, entry_id, user_id))
+        return self._history_entry(row) if row else None
+
+    @staticmethod
+    def _history_entry(row: tuple) -> Dict:
+        return {
+            'id': row[0],
+            'input_data': join_input(row[2:6]),
+            'generated_tweets': unpack_tweets(row[6]),
+            'created_at': row[1]
+        }
+
+    @timed(DB_DURATION, 'archive_history')
+    async def archive_history(self, free_days: int, premium_days: int, batch_size: int = 500) -> int:
+        """Move history older than each tier's hot window into the archive file.
+
+        Rows move in small batches, each its own short transaction, so live
+        traffic never waits long on the write lock. Returns the number of rows
+        moved.
+        """
+        await self.flush()
+        moved = 0
+        windows = (
+            (f'user_id IN ({ACTIVE_PREMIUM_USERS_SQL})', premium_days),
+            (f'user_id NOT IN ({ACTIVE_PREMIUM_USERS_SQL})', free_days)
         )
-        ''')
-        
-        cursor.execute('''
-        INSERT INTO tweet_history (user_id, input_data, generated_tweets)
-        VALUES (?, ?, ?)
-        ''', (user_id, json.dumps(input_data), json.dumps(generated_tweets)))
-        self.conn.commit()
-
-    def get_user_history(self, user_id: int, limit: int = 5) -> List[Dict]:
-        """Retrieve user's tweet history."""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT input_data, generated_tweets, created_at
-        FROM tweet_history
-        WHERE user_id = ?
-        ORDER BY created_at DESC
+        for tier_condition, days in windows:
+            while True:
+                try:
+                    async with self.transaction() as conn:
+                        async with conn.execute(f'''
+                        SELECT id FROM main.tweet_history
+                        WHERE created_at < datetime('now', ?) AND {tier_condition}
+                        LIMIT ?
+                        ''', (f'-{int(days)} days', batch_size)) as cursor:
+                            ids = [row[0] for row in await cursor.fetchall()]
+                        if ids:
+                            placeholders = ','.join('?' * len(ids))
+                            await conn.execute(f'''
+                            INSERT OR IGNORE INTO archive.tweet_history
+                            SELECT * FROM main.tweet_history WHERE id IN ({placeholders})
+                            ''', ids)
+                            await conn.execute(
+                                f'DELETE FROM main.tweet_history WHERE id IN ({placeholders})', ids
+                            )
+                except aiosqlite.Error as e:
+                    logger.error(f"History archive error: {e}")
+                    raise DatabaseError("Could not archive history")
+                if not ids:
+                    break
+                moved += len(ids)
+                # Let handlers get at the connection between batches
+                await asyncio.sleep(0)
+        return moved
+
+    def add_token_usage(self, user_id: int, command: str, prompt_tokens: int, completion_tokens: int,
+                        cost: float = 0.0) -> None:
+        """Count one completion's tokens and cost in USD against the user and command (buffered)."""
+        self.writes.add_usage(user_id, command, prompt_tokens, completion_tokens, cost)
+        self._maybe_flush()
+
+    @timed(DB_DURATION, 'get_token_spend')
+    async def get_token_spend(self, user_id: int, since_day: str) -> int:
+        """Total tokens the user has spent from since_day (YYYY-MM-DD) on, including unflushed usage."""
+        result = await self.fetchone('''
+        SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0)
+        FROM token_usage WHERE user_id = ? AND day >= ?
+        ''', (user_id, since_day))
+        return result[0] + self.writes.pending_usage_for(user_id, since_day)
+
+    @timed(DB_DURATION, 'get_top_spenders')
+    async def get_top_spenders(self, since_day: str, limit: int = 10) -> List[tuple]:
+        """Return (user_id, requests, prompt_tokens, completion_tokens, cost_usd) rows, biggest spenders first."""
+        return await self.fetchall('''
+        SELECT user_id, SUM(requests), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost_usd)
+        FROM token_usage WHERE day >= ?
+        GROUP BY user_id
+        ORDER BY SUM(prompt_tokens + completion_tokens) DESC
         LIMIT ?
-        ''', (user_id, limit))
-        
-        history = []
-        for row in cursor.fetchall():
-            history.append({
-                'input_data': json.loads(row[0]),
-                'generated_tweets': json.loads(row[1]),
-                'created_at': row[2]
-            })
-        return history 
\ No newline at end of file
+        ''', (since_day, limit))
+
+    @timed(DB_DURATION, 'get_command_usage')
+    async def get_command_usage(self, since_day: str) -> List[tuple]:
+        """Return (command, users, requests, prompt_tokens, completion_tokens, cost_usd) rows per command."""
+        return await self.fetchall('''
+        SELECT command, COUNT(DISTINCT user_id), SUM(requests), SUM(prompt_tokens), SUM(completion_tokens),
+            SUM(cost_usd)
+        FROM token_usage WHERE day >= ?
+        GROUP BY command
+        ORDER BY SUM(prompt_tokens + completion_tokens) DESC
+        ''', (since_day,))
+
+    @timed(DB_DURATION, 'get_cached_generation')
+    async def get_cached_generation(self, cache_key: str) -> Optional[Dict]:
+        """Retrieve a persisted generation cache entry."""
+        result = await self.fetchone('''
+        SELECT variants, expires_at FROM generation_cache WHERE cache_key = ?
+        ''', (cache_key,))
+        if not result:
+            return None
+        return {
+            'variants': json.loads(result[0]),
+            'expires_at': result[1]
+        }
+
+    @timed(DB_DURATION, 'set_cached_generation')
+    async def set_cached_generation(self, cache_key: str, variants: List[List[str]], expires_at: float):
+        """Persist a generation cache entry."""
+        variants_json = json.dumps(variants)
+        await self.execute('''
+        INSERT INTO generation_cache (cache_key, variants, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(cache_key) DO UPDATE SET variants = ?, expires_at = ?
+        ''', (cache_key, variants_json, expires_at, variants_json, expires_at))
+
+    @timed(DB_DURATION, 'load_rate_limits')
+    async def load_rate_limits(self) -> List[tuple]:
+        """Retrieve persisted rate limit buckets as (user_id, tokens, updated_at) rows."""
+        return await self.fetchall('SELECT user_id, tokens, updated_at FROM rate_limits')
+
+    @timed(DB_DURATION, 'save_rate_limits')
+    async def save_rate_limits(self, rows: List[tuple]):
+        """Persist changed rate limit buckets in a single transaction."""
+        if not rows:
+            return
+        await self.executemany('''
+        INSERT INTO rate_limits (user_id, tokens, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+        ''', rows)
+
+class SyncDatabase:
+    """Blocking wrapper around Database for scripts that don't run an event loop.
+
+    Every coroutine method of Database is available under the same name and
+    runs to completion on a private event loop.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self._loop = asyncio.new_event_loop()
+        self._db = Database(path)
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._loop.run_until_complete(attr(*args, **kwargs))
+        return call
+
+    def close(self) -> None:
+        """Close the connection and the private event loop."""
+        self._loop.run_until_complete(self._db.close())
+        self._loop.close()
@@ -0,0 +1,25 @@
+import json
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# Input parameters stored in their own columns rather than a JSON blob
+INPUT_FIELDS = ('topic', 'niche', 'tone', 'category')
+
+def pack_tweets(tweets: List[str]) -> bytes:
+    """Serialize generated tweets into a compact zlib-compressed blob."""
+    return zlib.compress(json.dumps(tweets, separators=(',', ':')).encode('utf-8'))
+
+def unpack_tweets(blob: bytes) -> List[str]:
+    """Reverse pack_tweets."""
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+def split_input(input_data: Dict) -> Tuple[Optional[str], ...]:
+    """Spread the generation input over the typed history columns."""
+    return tuple(
+        str(input_data[field]) if input_data.get(field) is not None else None
+        for field in INPUT_FIELDS
+    )
+
+def join_input(values: Tuple[Optional[str], ...]) -> Dict:
+    """Rebuild the input_data dict from the typed history columns."""
+    return {field: value for field, value in zip(INPUT_FIELDS, values) if value is not None}
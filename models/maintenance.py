@@ -0,0 +1,161 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+import aiosqlite
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted / pages freed per transaction, and the pause between them,
+# so maintenance never holds the write lock long enough to stall handlers
+MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '500'))
+VACUUM_PAGES_PER_STEP = int(os.getenv('MAINTENANCE_VACUUM_PAGES', '1000'))
+MAINTENANCE_PAUSE = float(os.getenv('MAINTENANCE_PAUSE', '0.05'))
+
+# Rows ANALYZE samples per index; keeps it fast on large tables
+ANALYSIS_LIMIT = 1000
+
+# Matches users whose premium subscription is currently active
+ACTIVE_PREMIUM_USERS_SQL = '''
+SELECT user_id FROM subscriptions
+WHERE tier = 'premium' AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+'''
+
+async def enable_incremental_vacuum(conn: aiosqlite.Connection, schema: str = 'main') -> None:
+    """Ask for incremental auto-vacuum, which only takes effect on a new, empty file.
+
+    Must run before the file's journal mode is set. Existing files are
+    rebuilt offline instead (see convert_to_incremental_vacuum), since the
+    full VACUUM that takes rewrites the whole file while holding it locked.
+    """
+    await conn.execute(f'PRAGMA {schema}.auto_vacuum=INCREMENTAL')
+    async with conn.execute(f'PRAGMA {schema}.auto_vacuum') as cursor:
+        mode = (await cursor.fetchone())[0]
+    if mode != 2:
+        logger.warning(
+            f"Database {schema} is not in incremental auto-vacuum mode, so maintenance can't "
+            f"return free pages; stop the bot and run python -m models.maintenance <file> once"
+        )
+
+async def convert_to_incremental_vacuum(path: str) -> bool:
+    """Rebuild a database file in incremental auto-vacuum mode; returns False if it already was.
+
+    Runs a full VACUUM, which rewrites the file and needs about as much free
+    disk space again, so only use it while nothing else has the file open.
+    """
+    async with aiosqlite.connect(path) as conn:
+        async with conn.execute('PRAGMA auto_vacuum') as cursor:
+            if (await cursor.fetchone())[0] == 2:
+                return False
+        await conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        await conn.execute('VACUUM')
+    return True
+
+async def _delete_in_batches(db, table: str, condition: str, parameters=()) -> int:
+    """Delete matching rows a batch at a time, each batch in its own transaction."""
+    deleted = 0
+    while True:
+        async with db.transaction() as conn:
+            cursor = await conn.execute(
+                f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {condition} LIMIT ?)',
+                (*parameters, MAINTENANCE_BATCH_SIZE)
+            )
+            count = cursor.rowcount
+            await cursor.close()
+        deleted += count
+        if count < MAINTENANCE_BATCH_SIZE:
+            return deleted
+        await asyncio.sleep(MAINTENANCE_PAUSE)
+
+async def _incremental_vacuum(db, schema: str) -> int:
+    """Return free pages to the filesystem a step at a time; returns pages reclaimed."""
+    conn = await db.connect()
+    async with conn.execute(f'PRAGMA {schema}.page_count') as cursor:
+        before = (await cursor.fetchone())[0]
+    previous_free = None
+    while True:
+        async with conn.execute(f'PRAGMA {schema}.freelist_count') as cursor:
+            free = (await cursor.fetchone())[0]
+        # Stop when done, or if the file isn't in incremental mode and nothing moves
+        if not free or free == previous_free:
+            break
+        previous_free = free
+        # Each sqlite3_step of this pragma frees one page and execute() only steps
+        # once, so run it through executescript, which steps it to completion; that
+        # commits whatever transaction is open, so only while no one else has one
+        async with db.transaction():
+            await conn.executescript(f'PRAGMA {schema}.incremental_vacuum({VACUUM_PAGES_PER_STEP});')
+        await asyncio.sleep(MAINTENANCE_PAUSE)
+    async with conn.execute(f'PRAGMA {schema}.page_count') as cursor:
+        after = (await cursor.fetchone())[0]
+    return before - after
+
+async def run_maintenance(db, free_retention_days: int, premium_retention_days: int,
+                          free_archive_days: int, premium_archive_days: int) -> Dict:
+    """Archive, prune, vacuum and analyze the bot databases.
+
+    History is first moved out of the hot database per tier (see
+    Database.archive_history), then rows past each tier's retention limit are
+    deleted from both files. Expired subscriptions, generation cache entries
+    and idle rate limit buckets are dropped as well. Returns a report of the
+    rows and pages reclaimed.
+    """
+    started = time.monotonic()
+    report = {
+        'archived_rows': await db.archive_history(free_archive_days, premium_archive_days),
+        'deleted_rows': {},
+        'reclaimed_pages': {}
+    }
+
+    for schema in ('main', 'archive'):
+        deleted = 0
+        for tier_condition, days in (
+            (f'user_id IN ({ACTIVE_PREMIUM_USERS_SQL})', premium_retention_days),
+            (f'user_id NOT IN ({ACTIVE_PREMIUM_USERS_SQL})', free_retention_days)
+        ):
+            deleted += await _delete_in_batches(
+                db,
+                f'{schema}.tweet_history',
+                f"created_at < datetime('now', ?) AND {tier_condition}",
+                (f'-{int(days)} days',)
+            )
+        report['deleted_rows'][f'{schema}.tweet_history'] = deleted
+
+    report['deleted_rows']['subscriptions'] = await _delete_in_batches(
+        db, 'main.subscriptions', 'expires_at IS NOT NULL AND expires_at <= CURRENT_TIMESTAMP'
+    )
+    report['deleted_rows']['generation_cache'] = await _delete_in_batches(
+        db, 'main.generation_cache', 'expires_at <= ?', (time.time(),)
+    )
+    # A bucket idle for a day has refilled completely, so it carries no state
+    report['deleted_rows']['rate_limits'] = await _delete_in_batches(
+        db, 'main.rate_limits', 'updated_at <= ?', (time.time() - 24 * 60 * 60,)
+    )
+
+    for schema in ('main', 'archive'):
+        report['reclaimed_pages'][schema] = await _incremental_vacuum(db, schema)
+
+    async with db.transaction() as conn:
+        await conn.execute(f'PRAGMA analysis_limit={ANALYSIS_LIMIT}')
+        await conn.execute('ANALYZE')
+
+    report['duration_seconds'] = round(time.monotonic() - started, 2)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Switch database files to incremental auto-vacuum. Stop the bot first.'
+    )
+    parser.add_argument('paths', nargs='+', help='database files, e.g. data/bot.db data/archive.db')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    for path in args.paths:
+        if asyncio.run(convert_to_incremental_vacuum(path)):
+            logger.info(f"Rebuilt {path} with incremental auto-vacuum")
+        else:
+            logger.info(f"{path} already uses incremental auto-vacuum")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+import json
+import aiosqlite
+import logging
+from typing import Awaitable, Callable, List, Union
+from models.history_codec import pack_tweets, split_input
+
+logger = logging.getLogger(__name__)
+
+# Rows read per batch when rewriting large tables. This bounds memory only:
+# migrate() runs each migration in one transaction, so a rewrite still holds
+# the write lock until it finishes; run large upgrades while the bot is down
+MIGRATION_BATCH_SIZE = 5000
+
+# Compact tweet history layout, shared by the hot database and the archive
+HISTORY_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    topic TEXT,
+    niche TEXT,
+    tone TEXT,
+    category TEXT,
+    tweets BLOB NOT NULL
+)
+'''
+
+HISTORY_INDEX_SQL = '''
+CREATE INDEX IF NOT EXISTS {prefix}idx_tweet_history_user_created
+ON tweet_history (user_id, created_at DESC, id DESC)
+'''
+
+async def _compact_tweet_history(conn: aiosqlite.Connection) -> None:
+    """Rewrite tweet_history into typed input columns and a compressed tweets blob."""
+    await conn.execute(HISTORY_TABLE_SQL.format(table='tweet_history_compact'))
+
+    last_id = 0
+    while True:
+        async with conn.execute('''
+        SELECT id, user_id, created_at, input_data, generated_tweets
+        FROM tweet_history WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, MIGRATION_BATCH_SIZE)) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            break
+
+        await conn.executemany('''
+        INSERT INTO tweet_history_compact
+            (id, user_id, created_at, topic, niche, tone, category, tweets)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (
+                row_id, user_id, created_at,
+                *split_input(json.loads(input_data) if input_data else {}),
+                pack_tweets(json.loads(generated_tweets) if generated_tweets else [])
+            )
+            for row_id, user_id, created_at, input_data, generated_tweets in rows
+        ])
+        last_id = rows[-1][0]
+        logger.info(f"Compacted tweet_history up to id {last_id}")
+
+    await conn.execute('DROP TABLE tweet_history')
+    await conn.execute('ALTER TABLE tweet_history_compact RENAME TO tweet_history')
+    await conn.execute(HISTORY_INDEX_SQL.format(prefix=''))
+
+# Schema migrations, applied in order. The database's PRAGMA user_version
+# records how many have run, so each one executes exactly once per file.
+# Never edit a released migration; append a new one instead.
+Migration = Union[str, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+MIGRATIONS: List[List[Migration]] = [
+    # 1: initial schema
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            preferences TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS tweet_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            input_data TEXT,
+            generated_tweets TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            user_id INTEGER PRIMARY KEY,
+            tier TEXT NOT NULL,
+            expires_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            user_id INTEGER PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS generation_cache (
+            cache_key TEXT PRIMARY KEY,
+            variants TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        ''',
+    ],
+    # 2: indexes for per-user history lookups and subscription expiry scans
+    [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_tweet_history_user_created
+        ON tweet_history (user_id, created_at DESC, id DESC)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_expires_at
+        ON subscriptions (expires_at)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_generation_cache_expires_at
+        ON generation_cache (expires_at)
+        ''',
+        'ANALYZE',
+    ],
+    # 3: compact history rows (typed input columns, zlib-compressed tweets)
+    [
+        _compact_tweet_history,
+    ],
+    # 4: pickled handler state for SQLitePersistence
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chat_data (
+            chat_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bot_data (
+            shard INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            name TEXT NOT NULL,
+            conversation_key TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            state BLOB NOT NULL,
+            PRIMARY KEY (name, conversation_key)
+        )
+        ''',
+    ],
+    # 5: daily token usage aggregates per user and command
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS token_usage (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            command TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, command)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_token_usage_day
+        ON token_usage (day)
+        ''',
+    ],
+    # 6: spend per usage row, since providers are priced differently; earlier
+    # rows were all GPT-4 (USD 0.03 / 0.06 per 1000 tokens)
+    [
+        'ALTER TABLE token_usage ADD COLUMN cost_usd REAL NOT NULL DEFAULT 0',
+        '''
+        UPDATE token_usage
+        SET cost_usd = (prompt_tokens * 0.03 + completion_tokens * 0.06) / 1000
+        ''',
+    ],
+    # 7: subscription expiry in UTC, like the CURRENT_TIMESTAMP it is compared
+    # against; it used to be written in the host's local time
+    [
+        '''
+        UPDATE subscriptions SET expires_at = datetime(expires_at, 'utc')
+        WHERE expires_at IS NOT NULL
+        ''',
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Last schema version that stores history as JSON (migration 3 compacts it)
+LEGACY_HISTORY_VERSION = 2
+
+async def migrate(conn: aiosqlite.Connection, target: int = SCHEMA_VERSION) -> int:
+    """Apply pending migrations up to target, each in its own transaction.
+
+    Returns the schema version the database ends up at.
+    """
+    async with conn.execute('PRAGMA user_version') as cursor:
+        version = (await cursor.fetchone())[0]
+
+    if version > SCHEMA_VERSION:
+        logger.warning(f"Database schema version {version} is newer than this code ({SCHEMA_VERSION})")
+        return version
+
+    for number, statements in enumerate(MIGRATIONS[version:target], start=version + 1):
+        logger.info(f"Applying database migration {number}")
+        try:
+            await conn.execute('BEGIN')
+            for statement in statements:
+                if callable(statement):
+                    await statement(conn)
+                else:
+                    await conn.execute(statement)
+            # PRAGMA doesn't take bound parameters; the value is our own integer
+            await conn.execute(f'PRAGMA user_version = {number}')
+            await conn.commit()
+        except aiosqlite.Error:
+            await conn.rollback()
+            raise
+    return max(version, target)
@@ -0,0 +1,206 @@
+import os
+import json
+import pickle
+import asyncio
+import hashlib
+import logging
+import aiosqlite
+from copy import deepcopy
+from typing import Any, Dict, Optional, Tuple, Union
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+ConversationKey = Tuple[Union[int, str], ...]
+
+# Seconds between the application's persistence runs; a crash loses at most this much
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', '30'))
+
+class BotData(dict):
+    """bot_data that leaves process-local services out of copies.
+
+    The application deep-copies bot_data before persisting it, and the shared
+    Database and SubscriptionManager can't be copied or pickled, so they are
+    dropped from the copy and set again by post_init on startup.
+    """
+
+    TRANSIENT_KEYS = frozenset({'db', 'subscription_manager'})
+
+    def __deepcopy__(self, memo):
+        copy = BotData()
+        for key, value in self.items():
+            if key not in self.TRANSIENT_KEYS:
+                copy[key] = deepcopy(value, memo)
+        return copy
+
+def _pack(data: Any) -> bytes:
+    return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+class SQLitePersistence(BasePersistence):
+    """Store conversations, user_data, chat_data and bot_data in the bot database.
+
+    Each user's data is pickled into its own row, and a row is only written
+    when its pickle differs from what was last loaded or written, so a
+    persistence run costs one small write per user that actually changed.
+    Writes queued by one run are committed together.
+
+    user_data and chat_data are loaded lazily: the application starts with
+    nothing in memory and a user's row is read the first time one of their
+    updates reaches a handler (refresh_user_data). Conversation states are
+    loaded up front, as ConversationHandler requires, but only for the
+    conversations still in progress.
+
+    With sharded workers, each worker passes its shard index and the shard
+    count and loads only the conversations of the users routed to it; bot_data
+    is kept per shard. All workers share the same tables.
+    """
+
+    def __init__(self, db, shard: int = 0, shards: int = 1,
+                 update_interval: float = PERSISTENCE_UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db = db
+        self.shard = shard
+        self.shards = shards
+        # Digest of the stored pickle per (kind, id); also marks rows already loaded
+        self._digests: Dict[Tuple[str, Any], Optional[bytes]] = {}
+        self._pending: Dict[Tuple[str, Any], Tuple[str, tuple]] = {}
+        self._write_lock = asyncio.Lock()
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        # Loaded per user on first use, see refresh_user_data
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return {}
+
+    async def get_bot_data(self) -> BotData:
+        row = await self.db.fetchone('SELECT data FROM bot_data WHERE shard = ?', (self.shard,))
+        if not row:
+            return BotData()
+        self._digests[('bot', self.shard)] = _digest(row[0])
+        return BotData(pickle.loads(row[0]))
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[ConversationKey, object]:
+        rows = await self.db.fetchall('''
+        SELECT conversation_key, state FROM conversations
+        WHERE name = ? AND abs(user_id) % ? = ?
+        ''', (name, self.shards, self.shard))
+        conversations = {}
+        for key, state in rows:
+            self._digests[('conversation', (name, key))] = _digest(state)
+            conversations[tuple(json.loads(key))] = pickle.loads(state)
+        return conversations
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        stored_key = json.dumps(list(key))
+        if new_state is None:
+            self._queue(('conversation', (name, stored_key)), None,
+                        'DELETE FROM conversations WHERE name = ? AND conversation_key = ?',
+                        (name, stored_key))
+        else:
+            blob = _pack(new_state)
+            self._queue(('conversation', (name, stored_key)), blob, '''
+            INSERT INTO conversations (name, conversation_key, user_id, state) VALUES (?, ?, ?, ?)
+            ON CONFLICT (name, conversation_key) DO UPDATE SET state = excluded.state
+            ''', (name, stored_key, key[-1], blob))
+        await self._write()
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        self._queue_data('user', 'user_data', 'user_id', user_id, data)
+        await self._write()
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        self._queue_data('chat', 'chat_data', 'chat_id', chat_id, data)
+        await self._write()
+
+    async def update_bot_data(self, data: BotData) -> None:
+        self._queue_data('bot', 'bot_data', 'shard', self.shard, data)
+        await self._write()
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._queue(('user', user_id), None, 'DELETE FROM user_data WHERE user_id = ?', (user_id,))
+        await self._write()
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._queue(('chat', chat_id), None, 'DELETE FROM chat_data WHERE chat_id = ?', (chat_id,))
+        await self._write()
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        await self._load_into('user', 'user_data', 'user_id', user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        await self._load_into('chat', 'chat_data', 'chat_id', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: BotData) -> None:
+        # bot_data is loaded once at startup and owned by this process after that
+        pass
+
+    async def flush(self) -> None:
+        await self._write()
+
+    async def _load_into(self, kind: str, table: str, column: str, key: int, data: Dict) -> None:
+        """Read a row into its in-memory dict the first time it is needed."""
+        if (kind, key) in self._digests:
+            return
+        row = await self.db.fetchone(f'SELECT data FROM {table} WHERE {column} = ?', (key,))
+        if (kind, key) in self._digests:
+            # Loaded by a concurrent update while we were waiting
+            return
+        self._digests[(kind, key)] = _digest(row[0]) if row else None
+        if row:
+            for name, value in pickle.loads(row[0]).items():
+                # Keep anything a handler already set for this user
+                data.setdefault(name, value)
+
+    def _queue_data(self, kind: str, table: str, column: str, key: int, data: Dict) -> None:
+        if not data:
+            self._queue((kind, key), None, f'DELETE FROM {table} WHERE {column} = ?', (key,))
+            return
+        blob = _pack(data)
+        self._queue((kind, key), blob, f'''
+        INSERT INTO {table} ({column}, data, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT ({column}) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        ''', (key, blob))
+
+    def _queue(self, key: Tuple[str, Any], blob: Optional[bytes], sql: str, parameters: tuple) -> None:
+        """Queue a write unless the row already holds exactly this value."""
+        digest = _digest(blob) if blob is not None else None
+        if key in self._digests and self._digests[key] == digest and key not in self._pending:
+            return
+        self._digests[key] = digest
+        self._pending[key] = (sql, parameters)
+
+    async def _write(self) -> None:
+        """Commit everything queued so far in one transaction.
+
+        The application runs all updates of a persistence run concurrently;
+        the first to get the lock writes what the others queued meanwhile.
+        """
+        async with self._write_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            statements: Dict[str, list] = {}
+            for sql, parameters in pending.values():
+                statements.setdefault(sql, []).append(parameters)
+
+            try:
+                async with self.db.transaction() as conn:
+                    for sql, rows in statements.items():
+                        await conn.executemany(sql, rows)
+            except aiosqlite.Error as e:
+                logger.error(f"Persistence write error, retrying {len(pending)} rows next run: {e}")
+                for key, write in pending.items():
+                    self._pending.setdefault(key, write)
@@ -0,0 +1,79 @@
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# Number of users whose profile is kept in memory
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '10000'))
+
+# Returned by get_* when nothing is cached for the user
+MISSING = object()
+
+class UserProfileCache:
+    """Bounded LRU cache of per-user preferences and subscription tier.
+
+    Entries are kept current by write-through from Database.set_user_preferences
+    and SubscriptionManager.set_premium_subscription, so they never go stale
+    within a process. A cached tier carries its expiry time and stops being
+    served the moment it is reached.
+    """
+
+    def __init__(self, max_size: int = PROFILE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._profiles: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+
+    def get_preferences(self, user_id: int):
+        """Return the cached preferences (possibly None), or MISSING."""
+        return self._get(user_id, 'preferences')
+
+    def set_preferences(self, user_id: int, preferences: Optional[Dict]) -> None:
+        self._set(user_id, 'preferences', preferences)
+
+    def get_tier(self, user_id: int, now: datetime = None):
+        """Return the cached (tier, expires_at) pair, or MISSING if absent or expired."""
+        cached = self._get(user_id, 'tier')
+        if cached is MISSING:
+            return MISSING
+        _, expires_at = cached
+        if expires_at is not None and expires_at <= (now or datetime.utcnow()):
+            # Count the lookup as a miss so the caller reloads the tier
+            self.hits -= 1
+            self.misses += 1
+            self._profiles[user_id].pop('tier', None)
+            return MISSING
+        return cached
+
+    def set_tier(self, user_id: int, tier, expires_at: Optional[datetime]) -> None:
+        self._set(user_id, 'tier', (tier, expires_at))
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget everything cached for a user."""
+        self._profiles.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._profiles),
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def _get(self, user_id: int, field: str):
+        profile = self._profiles.get(user_id)
+        if profile is None or field not in profile:
+            self.misses += 1
+            return MISSING
+        self._profiles.move_to_end(user_id)
+        self.hits += 1
+        return profile[field]
+
+    def _set(self, user_id: int, field: str, value) -> None:
+        profile = self._profiles.setdefault(user_id, {})
+        profile[field] = value
+        self._profiles.move_to_end(user_id)
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
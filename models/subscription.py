@@ -1,49 +1,49 @@
+import os
 from enum import Enum
-from typing import Optional
+from typing import Optional, Tuple
 from datetime import datetime, timedelta
 import json
+from models.profile_cache import MISSING
+from utils.metrics import DB_DURATION, timed
 
 class SubscriptionTier(Enum):
     FREE = "free"
     PREMIUM = "premium"
 
+# Days a tier's history stays in the hot database before moving to the archive
+HISTORY_ARCHIVE_DAYS = {
+    SubscriptionTier.FREE: int(os.getenv('HISTORY_ARCHIVE_DAYS_FREE', '30')),
+    SubscriptionTier.PREMIUM: int(os.getenv('HISTORY_ARCHIVE_DAYS_PREMIUM', '365'))
+}
+
+# Days a tier's history is kept at all, hot or archived, before it is deleted
+HISTORY_RETENTION_DAYS = {
+    SubscriptionTier.FREE: int(os.getenv('HISTORY_RETENTION_DAYS_FREE', '90')),
+    SubscriptionTier.PREMIUM: int(os.getenv('HISTORY_RETENTION_DAYS_PREMIUM', '730'))
+}
+
 class SubscriptionManager:
     def __init__(self, db):
         self.db = db
-        self.setup_subscription_table()
     
-    def setup_subscription_table(self):
-        """Create subscription table if it doesn't exist."""
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS subscriptions (
-            user_id INTEGER PRIMARY KEY,
-            tier TEXT NOT NULL,
-            expires_at TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-        ''')
-        self.db.conn.commit()
-    
-    def get_user_subscription(self, user_id: int) -> SubscriptionTier:
+    @timed(DB_DURATION, 'get_user_subscription')
+    async def get_user_subscription(self, user_id: int) -> SubscriptionTier:
         """Get user's current subscription tier."""
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-        SELECT tier, expires_at FROM subscriptions 
-        WHERE user_id = ? AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
-        ''', (user_id,))
-        result = cursor.fetchone()
+        cached = self.db.profiles.get_tier(user_id)
+        if cached is not MISSING:
+            return cached[0]
         
-        if not result:
-            return SubscriptionTier.FREE
-        return SubscriptionTier(result[0])
+        tier, expires_at = await self._load_subscription(user_id)
+        self.db.profiles.set_tier(user_id, tier, expires_at)
+        return tier
     
-    def set_premium_subscription(self, user_id: int, duration_days: int = 30):
+    @timed(DB_DURATION, 'set_premium_subscription')
+    async def set_premium_subscription(self, user_id: int, duration_days: int = 30):
         """Set or extend premium subscription."""
-        cursor = self.db.conn.cursor()
-        expires_at = datetime.now() + timedelta(days=duration_days)
+        # UTC, like the CURRENT_TIMESTAMP it is compared against
+        expires_at = datetime.utcnow() + timedelta(days=duration_days)
         
-        cursor.execute('''
+        await self.db.execute('''
         INSERT INTO subscriptions (user_id, tier, expires_at)
         VALUES (?, ?, ?)
         ON CONFLICT(user_id) DO UPDATE SET 
@@ -56,4 +56,19 @@ class SubscriptionManager:
             SubscriptionTier.PREMIUM.value,
             expires_at
         ))
-        self.db.conn.commit() 
\ No newline at end of file
+        
+        # Write through to the profile cache with the resulting expiry
+        tier, expires_at = await self._load_subscription(user_id)
+        self.db.profiles.set_tier(user_id, tier, expires_at)
+    
+    async def _load_subscription(self, user_id: int) -> Tuple[SubscriptionTier, Optional[datetime]]:
+        """Read the user's active tier and its expiry time from the database."""
+        result = await self.db.fetchone('''
+        SELECT tier, expires_at FROM subscriptions 
+        WHERE user_id = ? AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+        ''', (user_id,))
+        
+        if not result:
+            return SubscriptionTier.FREE, None
+        expires_at = datetime.fromisoformat(result[1]) if result[1] else None
+        return SubscriptionTier(result[0]), expires_at
\ No newline at end of file
@@ -0,0 +1,93 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Tuple
+from models.history_codec import pack_tweets, split_input
+
+# Flush once this many writes are pending, or every FLUSH_INTERVAL seconds
+MAX_PENDING_WRITES = int(os.getenv('DB_MAX_PENDING_WRITES', '200'))
+FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '2.0'))
+
+def _timestamp() -> str:
+    """Current UTC time in the format SQLite's CURRENT_TIMESTAMP produces."""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+def usage_day() -> str:
+    """Current UTC day, the granularity token usage is aggregated at."""
+    return datetime.utcnow().strftime('%Y-%m-%d')
+
+class WriteBehindBuffer:
+    """In-memory queue of low-value writes that are flushed in batches.
+
+    ``last_active`` updates are coalesced per user so only the latest
+    timestamp is written, and history rows are queued with the time they were
+    generated so the stored ``created_at`` doesn't depend on when they flush.
+    Token usage and its cost are summed per (user, day, command) and written
+    as upserts.
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING_WRITES):
+        self.max_pending = max_pending
+        self.last_active: Dict[int, str] = {}
+        self.history: List[tuple] = []
+        # (user_id, day, command) -> [requests, prompt_tokens, completion_tokens, cost_usd]
+        self.usage: Dict[Tuple[int, str, str], list] = {}
+
+    def touch(self, user_id: int) -> None:
+        """Record that a user was active just now."""
+        self.last_active[user_id] = _timestamp()
+
+    def add_history(self, user_id: int, input_data: dict, generated_tweets: list) -> None:
+        """Queue a history row in its stored (compact) form."""
+        self.history.append(
+            (user_id, _timestamp(), *split_input(input_data), pack_tweets(generated_tweets))
+        )
+
+    def add_usage(self, user_id: int, command: str, prompt_tokens: int, completion_tokens: int,
+                  cost: float = 0.0) -> None:
+        """Add one completion's tokens and cost to the user's running total for today."""
+        totals = self.usage.setdefault((user_id, usage_day(), command), [0, 0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += prompt_tokens
+        totals[2] += completion_tokens
+        totals[3] += cost
+
+    def pending_usage_for(self, user_id: int, since_day: str) -> int:
+        """Tokens the user spent since since_day that haven't been written yet."""
+        return sum(
+            totals[1] + totals[2]
+            for (pending_user, day, _), totals in self.usage.items()
+            if pending_user == user_id and day >= since_day
+        )
+
+    def has_history_for(self, user_id: int) -> bool:
+        """Check whether a user has history rows that haven't been written yet."""
+        return any(row[0] == user_id for row in self.history)
+
+    @property
+    def pending(self) -> int:
+        return len(self.last_active) + len(self.history) + len(self.usage)
+
+    @property
+    def full(self) -> bool:
+        return self.pending >= self.max_pending
+
+    def drain(self) -> Tuple[List[Tuple[str, int]], List[tuple], List[tuple]]:
+        """Take everything pending, leaving the buffer empty."""
+        last_active = [(timestamp, user_id) for user_id, timestamp in self.last_active.items()]
+        history = self.history
+        usage = [(*key, *totals) for key, totals in self.usage.items()]
+        self.last_active = {}
+        self.history = []
+        self.usage = {}
+        return last_active, history, usage
+
+    def restore(self, last_active: List[Tuple[str, int]], history: List[tuple], usage: List[tuple]) -> None:
+        """Put back writes from a failed flush without overwriting newer ones."""
+        for timestamp, user_id in last_active:
+            if timestamp > self.last_active.get(user_id, ''):
+                self.last_active[user_id] = timestamp
+        self.history = history + self.history
+        for user_id, day, command, *amounts in usage:
+            totals = self.usage.setdefault((user_id, day, command), [0, 0, 0, 0.0])
+            for i, amount in enumerate(amounts):
+                totals[i] += amount
@@ -0,0 +1,151 @@
+import hashlib
+import re
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class _CacheEntry:
+    __slots__ = ('variants', 'expires_at', 'cursor')
+
+    def __init__(self, variants: List[List[str]], expires_at: float):
+        self.variants = variants
+        self.expires_at = expires_at
+        self.cursor = 0
+
+def make_cache_key(
+    topic: str,
+    niche: str = None,
+    tone: str = None,
+    category: str = None,
+    length: int = 1,
+    tier: str = None
+) -> str:
+    """Build a normalized cache key from the generation parameters.
+
+    The subscription tier is part of the key because it picks the model
+    (services.model_selection), so tiers never share each other's output.
+    """
+    # Case, surrounding punctuation and repeated whitespace don't change the request
+    normalized_topic = re.sub(r'\s+', ' ', topic.lower()).strip(' .!?,;:"\'')
+    parts = [
+        normalized_topic,
+        (niche or '').lower(),
+        (tone or '').lower(),
+        (category or '').lower(),
+        str(length),
+        (tier or '').lower()
+    ]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+class GenerationCache:
+    """TTL + LRU cache of generated tweets with an optional SQLite tier.
+
+    Each key holds up to ``variants`` distinct generations. Lookups count as
+    misses until that many variants exist, after which hits rotate through them
+    so users asking about the same topic don't all receive identical text.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: int = 3600, variants: int = 2, db=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.db = db
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+
+    def attach_database(self, db) -> None:
+        """Persist cache entries in the given database so they survive restarts."""
+        self.db = db
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        """Return a cached variant for the key, or None on a miss."""
+        entry = await self._load(key)
+        if entry is None or len(entry.variants) < self.variants:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        tweets = entry.variants[entry.cursor % len(entry.variants)]
+        entry.cursor += 1
+        self.hits += 1
+        return list(tweets)
+
+    async def get_stale(self, key: str) -> Optional[List[str]]:
+        """Return any stored variant for the key, even expired or short of variants.
+
+        For degraded service while the upstream is down; doesn't count as a hit.
+        """
+        entry = self._entries.get(key)
+        if entry is None and self.db:
+            try:
+                cached = await self.db.get_cached_generation(key)
+            except Exception as e:
+                logger.error(f"Could not read cache entry: {e}")
+                return None
+            if cached:
+                entry = _CacheEntry(cached['variants'], cached['expires_at'])
+        if entry is None or not entry.variants:
+            return None
+        tweets = entry.variants[entry.cursor % len(entry.variants)]
+        entry.cursor += 1
+        return list(tweets)
+
+    async def put(self, key: str, tweets: List[str]) -> None:
+        """Add a generated variant for the key."""
+        entry = await self._load(key)
+        if entry is None:
+            entry = _CacheEntry([], time.time() + self.ttl)
+            self._entries[key] = entry
+        if tweets in entry.variants:
+            return
+
+        entry.variants.append(list(tweets))
+        del entry.variants[:-self.variants]
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+        if self.db:
+            try:
+                await self.db.set_cached_generation(key, entry.variants, entry.expires_at)
+            except Exception as e:
+                logger.error(f"Could not persist cache entry: {e}")
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    async def _load(self, key: str) -> Optional[_CacheEntry]:
+        """Find a live entry in memory, falling back to the SQLite tier."""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                return entry
+            del self._entries[key]
+
+        if not self.db:
+            return None
+        try:
+            cached = await self.db.get_cached_generation(key)
+        except Exception as e:
+            logger.error(f"Could not read cache entry: {e}")
+            return None
+        if not cached or cached['expires_at'] <= now:
+            return None
+
+        entry = _CacheEntry(cached['variants'], cached['expires_at'])
+        self._entries[key] = entry
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
@@ -1,16 +1,48 @@
 import os
-from typing import List
+import time
+import asyncio
+from typing import Awaitable, Callable, List, Optional
 import logging
-from openai import OpenAI
-from utils.exceptions import OpenAIError
-from telegram import Update
-from telegram.ext import ContextTypes
+from contextlib import asynccontextmanager
+from openai import BadRequestError
+from utils.exceptions import OpenAIError, BudgetExceededError, UpstreamUnavailableError
+from services.cache import GenerationCache
+from services.streaming import StreamingReply
+from services.scheduler import SchedulerSlot, scheduler
+from services.resilience import upstream, LLM_REQUEST_TIMEOUT
+from services.usage import usage_meter, billing_account
+from services.providers import MODEL_LEVELS, Provider, current_command, router_from_env
+from services.model_selection import model_selector
+from models.subscription import SubscriptionTier
+from utils.metrics import (
+    GENERATION_DURATION,
+    LLM_QUEUE_WAIT,
+    LLM_REQUESTS,
+    LLM_TOKENS,
+    LLM_UPSTREAM_DURATION
+)
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY")
+# OpenAI-compatible providers (LLM_PROVIDERS, default just OpenAI) and the
+# router that picks one per request; OPENAI_BASE_URL points the default
+# provider at any compatible server, such as loadtest/fake_openai.py
+router = router_from_env(timeout=LLM_REQUEST_TIMEOUT)
+
+# Maximum number of completions in flight at once for a single generate_tweets call
+MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENT_REQUESTS", "5"))
+
+# Request all n tweets in one completion instead of n separate ones
+BATCH_GENERATION = os.getenv("OPENAI_BATCH_GENERATION", "true").lower() == "true"
+
+# Stream completions into the reply message as tokens arrive
+STREAM_GENERATION = os.getenv("OPENAI_STREAM_GENERATION", "true").lower() == "true"
+
+# Shared cache of generated tweets, keyed on the normalized request parameters
+generation_cache = GenerationCache(
+    max_size=int(os.getenv("GENERATION_CACHE_SIZE", "1000")),
+    ttl=int(os.getenv("GENERATION_CACHE_TTL", "3600")),
+    variants=int(os.getenv("GENERATION_CACHE_VARIANTS", "2"))
 )
 
 SYSTEM_PROMPT = """You are an expert social media strategist and conversational AI specializing in Tweet generation.
@@ -27,32 +59,344 @@ Transform a given headline or question into a single, engaging tweet that:
 
 Important: Generate only ONE tweet, formatted to be easily readable and under 280 characters. The tweet should feel like it's coming from a real person having a conversation."""
 
-async def generate_tweets(
-    prompt: str,
+def _clean_tweet(content: Optional[str]) -> Optional[str]:
+    """Normalize a completion into tweet text, or None if it is unusable."""
+    if not content:
+        return None
+    tweet = content.strip()
+    # Remove any numbering or bullet points that might have been added
+    tweet = tweet.lstrip('123456789.- ').strip()
+    return tweet or None
+
+def _estimate_tokens(user_prompt: str, n: int = 1, system_prompt: str = SYSTEM_PROMPT,
+                     max_tokens: int = 280) -> int:
+    """Roughly estimate the tokens a request will consume (about 4 characters per token)."""
+    return (len(system_prompt) + len(user_prompt)) // 4 + max_tokens * n
+
+@asynccontextmanager
+async def _request_slot(
+    semaphore: asyncio.Semaphore,
+    tier: SubscriptionTier,
+    user_prompt: str,
     n: int = 1,
-    update: Update = None,
-    context: ContextTypes.DEFAULT_TYPE = None
+    system_prompt: str = SYSTEM_PROMPT,
+    max_tokens: int = 280
+):
+    """Hold a per-call slot and a global scheduler slot for one upstream request.
+
+    Yields the model level to request, chosen once the request is admitted
+    so its queue wait counts, and the scheduler slot to hand to
+    _create_completion; the whole time inside is reported to the model
+    selector for its latency SLO.
+    """
+    started = time.perf_counter()
+    estimate = _estimate_tokens(user_prompt, n, system_prompt, max_tokens)
+    async with semaphore, scheduler.slot(tier, estimate) as slot:
+        queue_wait = time.perf_counter() - started
+        LLM_QUEUE_WAIT.labels(tier.value).observe(queue_wait)
+        try:
+            yield model_selector.choose(tier, current_command.get(), queue_wait), slot
+        finally:
+            model_selector.observe(time.perf_counter() - started)
+
+def _record_usage(provider: Provider, level: str, prompt_tokens: int, completion_tokens: int) -> None:
+    """Count a completion's tokens in the metrics and against the billed user."""
+    LLM_TOKENS.labels('prompt').inc(prompt_tokens)
+    LLM_TOKENS.labels('completion').inc(completion_tokens)
+    account = billing_account.get()
+    if account:
+        usage_meter.record(*account, prompt_tokens, completion_tokens,
+                           provider.cost(prompt_tokens, completion_tokens, level))
+
+async def _create_completion(user_prompt: str, n: int = 1, stream: bool = False,
+                             system_prompt: str = SYSTEM_PROMPT, max_tokens: int = 280,
+                             temperature: float = 0.8, level: str = MODEL_LEVELS[0],
+                             slot: SchedulerSlot = None):
+    """Send one chat completion request asking for n candidate tweets from the level's model.
+
+    Returns the provider that answered and its response. Plain requests are
+    timed here; a stream is timed by its consumer, since the request only
+    ends with its last chunk, and the consumer must release the provider
+    with router.release() once it is done. Failed attempts are retried by
+    the upstream guard, and slow plain requests hedged; a stream is only
+    retried until it starts. Every attempt is routed afresh, so retries and
+    hedges move to another provider when that one is doing better. The
+    scheduler slot, if given, is handed back while backing off between
+    attempts.
+    """
+    mode = 'stream' if stream else 'batch' if n > 1 else 'single'
+    started = time.perf_counter()
+    try:
+        provider, response = await upstream.call(
+            lambda: _send_completion(user_prompt, n, stream, system_prompt, max_tokens, temperature, level),
+            hedge=not stream,
+            backoff=slot.paused if slot else None
+        )
+    except Exception:
+        LLM_REQUESTS.labels(mode, 'error').inc()
+        raise
+    if not stream:
+        LLM_UPSTREAM_DURATION.labels(mode).observe(time.perf_counter() - started)
+        LLM_REQUESTS.labels(mode, 'ok').inc()
+        if response.usage:
+            _record_usage(provider, level, response.usage.prompt_tokens, response.usage.completion_tokens)
+    return provider, response
+
+async def _send_completion(user_prompt: str, n: int, stream: bool, system_prompt: str,
+                           max_tokens: int, temperature: float, level: str):
+    """Send one attempt to the provider the router picks, feeding its latency and error averages."""
+    provider = await router.acquire(stream, current_command.get(), level)
+    started = time.perf_counter()
+    try:
+        response = await _request(provider, user_prompt, n, stream, system_prompt, max_tokens, temperature, level)
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            # Timed out or beaten by a hedge: it took at least this long
+            provider.observe(time.perf_counter() - started, stream, ok=True, level=level)
+        else:
+            # A rejected request says nothing about the provider's health
+            provider.observe(time.perf_counter() - started, stream, ok=isinstance(e, BadRequestError), level=level)
+        await router.release(provider)
+        raise
+    provider.observe(time.perf_counter() - started, stream, ok=True, level=level)
+    if not stream:
+        await router.release(provider)
+    return provider, response
+
+async def _request(provider: Provider, user_prompt: str, n: int, stream: bool, system_prompt: str,
+                   max_tokens: int, temperature: float, level: str):
+    return await provider.client.chat.completions.create(
+        model=provider.models[level],
+        messages=[
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": user_prompt
+            }
+        ],
+        n=n,
+        stream=stream,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        presence_penalty=0.3,
+        frequency_penalty=0.3
+    )
+
+async def complete(
+    system_prompt: str,
+    user_prompt: str,
+    semaphore: asyncio.Semaphore,
+    tier: SubscriptionTier = SubscriptionTier.FREE,
+    max_tokens: int = 280,
+    temperature: float = 0.8
+) -> Optional[str]:
+    """Run one completion with a custom system prompt through the scheduler.
+
+    Returns the completion text, or None if it came back empty or filtered.
+    Tokens are billed like generate_tweets' own requests.
+    """
+    async with _request_slot(semaphore, tier, user_prompt, 1, system_prompt, max_tokens) as (level, slot):
+        _, response = await _create_completion(
+            user_prompt,
+            system_prompt=system_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            level=level,
+            slot=slot
+        )
+    choice = response.choices[0]
+    if choice.finish_reason == "content_filter" or not choice.message.content:
+        return None
+    return choice.message.content.strip()
+
+async def _generate_single_tweet(
+    user_prompt: str,
+    semaphore: asyncio.Semaphore,
+    tier: SubscriptionTier
+) -> str:
+    """Request a single tweet completion without blocking the event loop."""
+    async with _request_slot(semaphore, tier, user_prompt) as (level, slot):
+        _, response = await _create_completion(user_prompt, level=level, slot=slot)
+
+    tweet = _clean_tweet(response.choices[0].message.content)
+    if not tweet:
+        raise OpenAIError("Empty completion returned")
+    return tweet
+
+async def _generate_batch(
+    user_prompt: str,
+    n: int,
+    semaphore: asyncio.Semaphore,
+    tier: SubscriptionTier
+) -> List[Optional[str]]:
+    """Request n tweets in a single completion, leaving None where a choice is unusable."""
+    async with _request_slot(semaphore, tier, user_prompt, n) as (level, slot):
+        _, response = await _create_completion(user_prompt, n=n, level=level, slot=slot)
+
+    tweets: List[Optional[str]] = [None] * n
+    for choice in response.choices:
+        if choice.index >= n or choice.finish_reason == "content_filter":
+            continue
+        tweets[choice.index] = _clean_tweet(choice.message.content)
+    return tweets
+
+async def _stream_batch(
+    user_prompt: str,
+    n: int,
+    semaphore: asyncio.Semaphore,
+    tier: SubscriptionTier,
+    reply: StreamingReply
+) -> List[Optional[str]]:
+    """Stream n tweets from a single completion, showing partial text as it arrives."""
+    parts: List[List[str]] = [[] for _ in range(n)]
+    filtered = set()
+    async with _request_slot(semaphore, tier, user_prompt, n) as (level, slot):
+        started = time.perf_counter()
+        provider, stream = await _create_completion(user_prompt, n=n, stream=True, level=level, slot=slot)
+        try:
+            async for chunk in stream:
+                for choice in chunk.choices:
+                    if choice.index >= n:
+                        continue
+                    if choice.delta.content:
+                        parts[choice.index].append(choice.delta.content)
+                    if choice.finish_reason == "content_filter":
+                        filtered.add(choice.index)
+                await reply.update_text(
+                    "\n\n".join("".join(part).strip() for part in parts if part)
+                )
+        except Exception:
+            LLM_REQUESTS.labels('stream', 'error').inc()
+            raise
+        finally:
+            try:
+                # The SDK's stream has no close() of its own; this frees the
+                # HTTP connection when the stream ends early or is cancelled
+                await stream.response.aclose()
+            finally:
+                await router.release(provider)
+        LLM_UPSTREAM_DURATION.labels('stream').observe(time.perf_counter() - started)
+        LLM_REQUESTS.labels('stream', 'ok').inc()
+        # Streamed responses carry no usage block, so estimate from the text
+        _record_usage(
+            provider,
+            level,
+            (len(SYSTEM_PROMPT) + len(user_prompt)) // 4,
+            sum(len("".join(part)) for part in parts) // 4
+        )
+
+    return [
+        None if i in filtered else _clean_tweet("".join(part))
+        for i, part in enumerate(parts)
+    ]
+
+async def serve_degraded(cache_key: Optional[str]) -> List[str]:
+    """Answer while the upstream is down: a stale cached result, or UpstreamUnavailableError."""
+    if cache_key:
+        stale = await generation_cache.get_stale(cache_key)
+        if stale:
+            logger.info("Upstream unavailable, serving stale cached result")
+            return stale
+    raise UpstreamUnavailableError("AI provider unavailable", retry_after=upstream.breaker.retry_after)
+
+async def run_generation(
+    produce: Callable[[], Awaitable[List[str]]],
+    description: str,
+    command: Optional[str] = None,
+    reply: StreamingReply = None,
+    cache_key: str = None,
+    tier: SubscriptionTier = SubscriptionTier.FREE,
+    user_id: int = None,
+    source: str = 'api',
+    cacheable: Callable[[List[str]], bool] = bool
 ) -> List[str]:
-    """Generate tweets using OpenAI API."""
+    """Run one user-facing generation around produce(), which makes the API calls.
+
+    Everything generations share happens here:
+    - A result cached under cache_key is served without calling the API.
+    - While the upstream circuit is open, stale cached results are served
+      if there are any, else UpstreamUnavailableError is raised straight
+      away. The same happens if produce() fails because the circuit opened
+      while it ran.
+    - When a user_id is given, BudgetExceededError is raised before calling
+      the API if the user's tier budget is used up. Otherwise the tokens
+      used are billed to that user and the command.
+    - The command also selects the providers the router may use
+      (LLM_ROUTE_<COMMAND>) and the model policy entry.
+    - The reply's placeholder is shown before produce() runs and removed if
+      it fails.
+    - Results for which cacheable() is true are cached.
+    - The duration is recorded under source, and errors other than
+      OpenAIError are wrapped in one.
+    """
+    started = time.perf_counter()
+    billing = None
+    routing = current_command.set(command)
     try:
-        logger.info(f"Attempting to generate {n} tweets")
-        
-        # Start typing animation if update and context are provided
-        typing_message = None
-        if update and context:
-            typing_message = await update.message.reply_text("🤔 Generating tweets...")
-            await context.bot.send_chat_action(
-                chat_id=update.effective_chat.id,
-                action="typing"
-            )
-        
-        if not os.getenv("OPENAI_API_KEY"):
-            logger.error("OPENAI_API_KEY not found in environment variables")
-            if typing_message:
-                await typing_message.delete()
+        if cache_key:
+            cached = await generation_cache.get(cache_key)
+            if cached:
+                logger.info(f"Serving {description} from cache")
+                GENERATION_DURATION.labels('cache').observe(time.perf_counter() - started)
+                return cached
+
+        logger.info(f"Attempting to generate {description}")
+
+        if not router.providers:
+            logger.error("No LLM provider has an API key configured")
             raise OpenAIError("API key not configured")
 
-        user_prompt = f"""Create ONE engaging tweet about the headline: {prompt}
+        if not upstream.breaker.is_open:
+            if user_id is not None:
+                await usage_meter.check(user_id, tier)
+                billing = billing_account.set((user_id, command or 'other'))
+
+            # Show the placeholder and typing animation if a reply is provided
+            if reply:
+                await reply.start()
+
+            try:
+                result = await produce()
+            except OpenAIError:
+                if not upstream.breaker.is_open:
+                    raise
+                logger.warning(f"Upstream became unavailable while generating {description}")
+            else:
+                if cache_key and cacheable(result):
+                    await generation_cache.put(cache_key, result)
+                GENERATION_DURATION.labels(source).observe(time.perf_counter() - started)
+                return result
+
+        result = await serve_degraded(cache_key)
+        GENERATION_DURATION.labels('degraded').observe(time.perf_counter() - started)
+        return result
+
+    except BudgetExceededError:
+        GENERATION_DURATION.labels('budget').observe(time.perf_counter() - started)
+        raise
+
+    except Exception as e:
+        GENERATION_DURATION.labels('error').observe(time.perf_counter() - started)
+        # Make sure to remove the placeholder if there's an error
+        if reply:
+            await reply.fail()
+        logger.error(f"Error generating {description}: {str(e)}", exc_info=True)
+        if isinstance(e, OpenAIError):
+            raise
+        raise OpenAIError(f"Error generating {description}: {str(e)}")
+
+    finally:
+        current_command.reset(routing)
+        if billing:
+            billing_account.reset(billing)
+
+async def _produce_tweets(prompt: str, n: int, reply: Optional[StreamingReply], batch: bool,
+                          tier: SubscriptionTier) -> List[str]:
+    """Request n tweets about prompt, retrying unusable batch choices individually."""
+    user_prompt = f"""Create ONE engaging tweet about the headline: {prompt}
 
 Your tweet should:
 - Hook the reader in the first few words
@@ -61,56 +405,73 @@ Your tweet should:
 
 Important: Generate only ONE tweet, under 280 characters."""
 
-        tweets = []
-        for i in range(n):
-            try:
-                # Update typing message with progress for multiple tweets
-                if typing_message and n > 1:
-                    await typing_message.edit_text(f"🤔 Generating tweet {i+1} of {n}...")
-                    await context.bot.send_chat_action(
-                        chat_id=update.effective_chat.id,
-                        action="typing"
-                    )
-
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": SYSTEM_PROMPT
-                        },
-                        {
-                            "role": "user",
-                            "content": user_prompt
-                        }
-                    ],
-                    temperature=0.8,
-                    max_tokens=280,
-                    presence_penalty=0.3,
-                    frequency_penalty=0.3
-                )
-                
-                tweet = response.choices[0].message.content.strip()
-                # Remove any numbering or bullet points that might have been added
-                tweet = tweet.lstrip('123456789.- ').strip()
-                tweets.append(tweet)
-                    
-            except Exception as e:
-                logger.error(f"Error in request: {str(e)}")
+    semaphore = asyncio.Semaphore(max(1, MAX_CONCURRENT_REQUESTS))
+
+    tweets: List[Optional[str]] = [None] * n
+    if batch or n == 1:
+        try:
+            if reply and STREAM_GENERATION:
+                tweets = await _stream_batch(user_prompt, n, semaphore, tier, reply)
+            elif n > 1:
+                tweets = await _generate_batch(user_prompt, n, semaphore, tier)
+        except Exception as e:
+            logger.error(f"Error in batch request: {str(e)}")
+
+    # Fan the remaining completions out concurrently, capped by a semaphore
+    missing = [i for i, tweet in enumerate(tweets) if tweet is None]
+    if missing:
+        logger.info(f"Requesting {len(missing)} of {n} tweets individually")
+        results = await asyncio.gather(
+            *(_generate_single_tweet(user_prompt, semaphore, tier) for _ in missing),
+            return_exceptions=True
+        )
+        for i, result in zip(missing, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error in request: {str(result)}")
                 continue
-        
-        # Delete the typing message
-        if typing_message:
-            await typing_message.delete()
-        
-        if not tweets:
-            return ["Sorry, could not generate tweets at this time."]
-            
-        return tweets
-            
-    except Exception as e:
-        # Make sure to delete typing message if there's an error
-        if typing_message:
-            await typing_message.delete()
-        logger.error(f"Error generating tweets: {str(e)}", exc_info=True)
-        raise OpenAIError(f"Error generating tweets: {str(e)}")
+            tweets[i] = result
+
+    tweets = [tweet for tweet in tweets if tweet]
+    if not tweets:
+        raise OpenAIError("No usable completions")
+    return tweets
+
+async def generate_tweets(
+    prompt: str,
+    n: int = 1,
+    reply: StreamingReply = None,
+    batch: bool = BATCH_GENERATION,
+    cache_key: str = None,
+    tier: SubscriptionTier = SubscriptionTier.FREE,
+    user_id: int = None,
+    command: str = None
+) -> List[str]:
+    """Generate tweets using OpenAI API.
+
+    In batch mode all n tweets are requested in a single completion using the
+    API's ``n`` parameter, so the prompt is only sent (and billed) once. Only
+    the choices that come back unusable are retried as individual requests.
+
+    When a reply is given, streaming edits it with the partial tweets as
+    tokens arrive; the caller is expected to finish() the reply with the
+    formatted result.
+
+    Every upstream request goes through the global scheduler, which admits
+    premium requests ahead of free ones within the shared rate limit, and the
+    upstream guard (services.resilience). Each request asks for the model that
+    services.model_selection picks for the tier, command and current latency.
+
+    Caching (only complete sets of n tweets are stored), degraded answers
+    while the upstream is down, budgets and billing work as described in
+    run_generation().
+    """
+    return await run_generation(
+        lambda: _produce_tweets(prompt, n, reply, batch, tier),
+        f"{n} tweets",
+        command=command,
+        reply=reply,
+        cache_key=cache_key,
+        tier=tier,
+        user_id=user_id,
+        cacheable=lambda tweets: len(tweets) == n
+    )
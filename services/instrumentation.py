@@ -0,0 +1,126 @@
+import os
+import time
+import logging
+import functools
+from typing import Optional
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram.ext import Application, ConversationHandler
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+from services.scheduler import scheduler
+from utils.metrics import (
+    Gauge,
+    HANDLER_DURATION,
+    HANDLER_ERRORS,
+    TELEGRAM_DURATION,
+    TELEGRAM_ERRORS,
+    render
+)
+
+logger = logging.getLogger(__name__)
+
+# Port of the /metrics endpoint; unset disables it. Sharded workers add their index.
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '0.0.0.0')
+
+LLM_QUEUE_DEPTH = Gauge('llm_queue_depth', 'Requests waiting for a scheduler slot', ['tier'])
+LLM_ACTIVE = Gauge('llm_active_requests', 'Completion requests currently holding a scheduler slot')
+LLM_TOKENS_AVAILABLE = Gauge('llm_tokens_available', 'Tokens left in the scheduler budget this minute')
+
+def _instrument_callback(callback):
+    """Wrap a handler callback to record its duration and exceptions."""
+    name = getattr(callback, '__name__', type(callback).__name__)
+    duration = HANDLER_DURATION.labels(name)
+    errors = HANDLER_ERRORS.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - started)
+    return wrapper
+
+def _instrument_handler(handler) -> None:
+    if isinstance(handler, ConversationHandler):
+        for nested in (
+            *handler.entry_points,
+            *(h for handlers in handler.states.values() for h in handlers),
+            *handler.fallbacks
+        ):
+            _instrument_handler(nested)
+    elif hasattr(handler, 'callback'):
+        handler.callback = _instrument_callback(handler.callback)
+
+def instrument_handlers(application: Application) -> None:
+    """Record latency and errors of every handler registered on the application.
+
+    Call once, after all handlers are added; conversation steps are
+    instrumented individually.
+    """
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler)
+
+class InstrumentedRequest(BaseRequest):
+    """Bot API transport that times every call and counts failures per method."""
+
+    def __init__(self, request: Optional[BaseRequest] = None):
+        # Same pool size the ApplicationBuilder gives its default request
+        self.request = request or HTTPXRequest(connection_pool_size=256)
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        await self.request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE, pool_timeout=BaseRequest.DEFAULT_NONE):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await self.request.do_request(
+                url, method, request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout
+            )
+        except Exception as e:
+            TELEGRAM_ERRORS.labels(api_method, type(e).__name__).inc()
+            raise
+        finally:
+            TELEGRAM_DURATION.labels(api_method).observe(time.perf_counter() - started)
+        if status >= 400:
+            TELEGRAM_ERRORS.labels(api_method, str(status)).inc()
+        return status, payload
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Serve all metrics in Prometheus text format."""
+
+    def get(self):
+        # Scheduler state is sampled at scrape time rather than on every request
+        stats = scheduler.stats()
+        for tier, queued in stats['queued'].items():
+            LLM_QUEUE_DEPTH.labels(tier).set(queued)
+        LLM_ACTIVE.set(stats['active'])
+        LLM_TOKENS_AVAILABLE.set(stats['tokens_available'])
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(render())
+
+def start_metrics_server(port: int, listen: str = METRICS_LISTEN) -> HTTPServer:
+    """Serve /metrics on its own port from the running event loop."""
+    server = HTTPServer(tornado.web.Application([(r'/metrics', MetricsHandler)]))
+    server.listen(port, address=listen)
+    logger.info(f"Serving metrics on {listen}:{port}/metrics")
+    return server
@@ -0,0 +1,124 @@
+import os
+import time
+import logging
+from collections import deque
+from typing import Dict, Optional
+from models.subscription import SubscriptionTier
+from services.providers import MODEL_LEVELS
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+def _parse_policy(value: str) -> Dict[str, str]:
+    """Parse a "tier=level,tier:command=level" model policy setting."""
+    policy = {}
+    for entry in value.split(','):
+        if not entry.strip():
+            continue
+        key, level = (part.strip().lower() for part in entry.split('='))
+        if level not in MODEL_LEVELS:
+            raise ValueError(f"Unknown model level {level!r} in LLM_MODEL_POLICY, expected one of {MODEL_LEVELS}")
+        policy[key] = level
+    return policy
+
+# Model level per subscription tier, optionally per command ("premium:thread=strong");
+# the most specific entry wins and anything unmatched gets the strong model
+MODEL_POLICY = _parse_policy(os.getenv('LLM_MODEL_POLICY', 'free=fast,premium=strong'))
+
+# p95 seconds per completion, queue wait included, above which every request
+# steps down one model level (0 disables); checked once per LLM_SLO_WINDOW seconds
+LLM_LATENCY_SLO = float(os.getenv('LLM_LATENCY_SLO', '10'))
+LLM_SLO_WINDOW = float(os.getenv('LLM_SLO_WINDOW', '60'))
+SLO_MIN_SAMPLES = 20
+
+# Step back up once p95 is below this share of the SLO
+SLO_RECOVERY = 0.6
+
+MODEL_SELECTIONS = Counter(
+    'llm_model_selections_total', 'Completions per chosen model level, subscription tier and command',
+    ['level', 'tier', 'command'])
+MODEL_STEP_DOWN = Gauge(
+    'llm_model_step_down', 'Model levels every request is currently stepped down by to meet the latency SLO')
+
+class ModelSelector:
+    """Choose the model level for each completion.
+
+    The policy gives the level for the request's subscription tier and
+    command. A request that already spent over half the SLO waiting in the
+    scheduler queue gets the next faster level to make up time. When the
+    p95 of recent completions (queue wait included) breaches the SLO, every
+    request is stepped down one more level, at most once per window, and
+    stepped back up once p95 is comfortably below it again.
+    """
+
+    def __init__(self, policy: Dict[str, str] = MODEL_POLICY, slo: float = LLM_LATENCY_SLO,
+                 window: float = LLM_SLO_WINDOW):
+        self.policy = policy
+        self.slo = slo
+        self.window = window
+        self.step_down = 0
+        self.selections: Dict[str, int] = {level: 0 for level in MODEL_LEVELS}
+        self._samples = deque()
+        self._evaluated_at = time.monotonic()
+
+    def choose(self, tier: SubscriptionTier, command: Optional[str] = None, queue_wait: float = 0.0) -> str:
+        """Return the model level for a completion that waited queue_wait seconds for its slot."""
+        level = (
+            self.policy.get(f'{tier.value}:{command}')
+            or self.policy.get(tier.value)
+            or MODEL_LEVELS[0]
+        )
+        index = MODEL_LEVELS.index(level) + self.step_down
+        if self.slo and queue_wait > self.slo / 2:
+            index += 1
+        level = MODEL_LEVELS[min(index, len(MODEL_LEVELS) - 1)]
+        self.selections[level] += 1
+        MODEL_SELECTIONS.labels(level, tier.value, command or 'other').inc()
+        return level
+
+    def observe(self, seconds: float) -> None:
+        """Record how long a completion took, queue wait included."""
+        if not self.slo:
+            return
+        now = time.monotonic()
+        self._samples.append((now, seconds))
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+        if now - self._evaluated_at >= self.window and len(self._samples) >= SLO_MIN_SAMPLES:
+            self._evaluate(now)
+
+    def p95(self) -> float:
+        ordered = sorted(seconds for _, seconds in self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0
+
+    def _evaluate(self, now: float) -> None:
+        p95 = self.p95()
+        step_down = self.step_down
+        if p95 > self.slo and step_down < len(MODEL_LEVELS) - 1:
+            step_down += 1
+        elif p95 < self.slo * SLO_RECOVERY and step_down > 0:
+            step_down -= 1
+        if step_down > self.step_down:
+            logger.warning(
+                f"Completion p95 is {p95:.1f}s against a {self.slo:.1f}s SLO, "
+                f"stepping models down {step_down} level(s)"
+            )
+        elif step_down < self.step_down:
+            logger.info(f"Completion p95 is down to {p95:.1f}s, stepping models down {step_down} level(s)")
+        if step_down != self.step_down:
+            self.step_down = step_down
+            MODEL_STEP_DOWN.set(step_down)
+            # Judge the new level on its own samples
+            self._samples.clear()
+        self._evaluated_at = now
+
+    def stats(self) -> Dict:
+        return {
+            'step_down': self.step_down,
+            'p95_seconds': round(self.p95(), 3),
+            'slo_seconds': self.slo,
+            'selections': dict(self.selections)
+        }
+
+# Shared selector for all upstream completion requests
+model_selector = ModelSelector()
@@ -1,15 +1,11 @@
 from telegram import LabeledPrice, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, PreCheckoutQueryHandler
 import os
-from models.subscription import SubscriptionManager, SubscriptionTier
-from models.database import Database
+from models.subscription import SubscriptionTier
 
 PREMIUM_MONTHLY_PRICE = 999  # $9.99 in cents
 PREMIUM_YEARLY_PRICE = 9999  # $99.99 in cents
 
-db = Database()
-subscription_manager = SubscriptionManager(db)
-
 async def send_payment_options(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send subscription payment options to user."""
     keyboard = [
@@ -98,7 +94,7 @@ async def handle_successful_payment(update: Update, context: ContextTypes.DEFAUL
     duration = int(update.message.successful_payment.invoice_payload.split('_')[1])
     
     # Activate premium subscription
-    subscription_manager.set_premium_subscription(user_id, duration)
+    await context.bot_data['subscription_manager'].set_premium_subscription(user_id, duration)
     
     await update.message.reply_text(
         "🎉 *Welcome to Premium!*\n\n"
@@ -0,0 +1,272 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from openai import AsyncOpenAI
+from utils.exceptions import OpenAIError
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the latency and error averages
+EWMA_ALPHA = float(os.getenv('LLM_ROUTER_EWMA_ALPHA', '0.2'))
+
+# Share of requests sent to a random provider so recovering or idle ones get re-measured
+EXPLORE_RATE = float(os.getenv('LLM_ROUTER_EXPLORE_RATE', '0.05'))
+
+# Model levels from strongest (slowest, most expensive) to fastest and cheapest
+MODEL_LEVELS = ('strong', 'balanced', 'fast')
+
+# Settings for well-known providers; anything else must set LLM_<NAME>_BASE_URL.
+# Models are (name, USD per 1000 prompt tokens, per 1000 completion tokens) per
+# level; a level left out uses the next stronger one's model.
+PROVIDER_DEFAULTS = {
+    'openai': {
+        'base_url': os.getenv('OPENAI_BASE_URL') or None,
+        'api_key': os.getenv('OPENAI_API_KEY'),
+        'concurrency': 8,
+        'models': {
+            'strong': (
+                'gpt-4',
+                float(os.getenv('PROMPT_TOKEN_PRICE', '0.03')),
+                float(os.getenv('COMPLETION_TOKEN_PRICE', '0.06'))
+            ),
+            'balanced': ('gpt-4-1106-preview', 0.01, 0.03),
+            'fast': ('gpt-3.5-turbo-1106', 0.001, 0.002)
+        }
+    },
+    'deepseek': {
+        'base_url': 'https://api.deepseek.com/v1',
+        'api_key': os.getenv('DEEPSEEK_API_KEY'),
+        'concurrency': 8,
+        'models': {'strong': ('deepseek-chat', 0.00014, 0.00028)}
+    },
+    'local': {
+        'base_url': 'http://127.0.0.1:8080/v1',
+        'api_key': 'local',
+        'concurrency': 4,
+        'models': {'strong': ('local-model', 0.0, 0.0)}
+    }
+}
+
+# Command the current generation serves ("generate", "category", "thread"),
+# for per-command routing overrides
+current_command: ContextVar[Optional[str]] = ContextVar('current_command', default=None)
+
+PROVIDER_REQUESTS = Counter(
+    'llm_provider_requests_total', 'Completion requests per provider, model and outcome',
+    ['provider', 'model', 'outcome'])
+PROVIDER_LATENCY = Gauge(
+    'llm_provider_latency_ewma_seconds', 'Smoothed response time per provider and model (streams: until the response starts)',
+    ['provider', 'model', 'mode'])
+PROVIDER_ERRORS = Gauge(
+    'llm_provider_error_ewma', 'Smoothed share of failed requests per provider', ['provider'])
+
+class Provider:
+    """One OpenAI-compatible endpoint with its models, concurrency limit and prices.
+
+    models maps each model level to (model name, prompt price, completion
+    price). Response times are averaged per level, separately for plain and
+    streamed requests, since a stream only counts until its first bytes
+    arrive.
+    """
+
+    def __init__(self, name: str, base_url: Optional[str], api_key: Optional[str],
+                 models: Dict[str, Tuple[str, float, float]], concurrency: int = 8, timeout: float = None):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.models = {level: model for level, (model, _, _) in models.items()}
+        self.prices = {level: (prompt, completion) for level, (_, prompt, completion) in models.items()}
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.active = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency: Dict[Tuple[str, bool], float] = {}
+        self.error_rate = 0.0
+        self._client: Optional[AsyncOpenAI] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            # Retries and timeouts are handled by services.resilience, not the SDK
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=self.timeout
+            )
+        return self._client
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def cost(self, prompt_tokens: int, completion_tokens: int, level: str = MODEL_LEVELS[0]) -> float:
+        """Spend in USD for the given token counts on the level's model."""
+        prompt_price, completion_price = self.prices[level]
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+    def score(self, stream: bool, level: str = MODEL_LEVELS[0]) -> float:
+        """Expected seconds until a successful response; lower is better.
+
+        Unmeasured providers score 0 so they get tried.
+        """
+        latency = self.latency.get((level, stream))
+        if latency is None:
+            return 0.0
+        return latency / max(0.05, 1 - self.error_rate)
+
+    def observe(self, seconds: float, stream: bool, ok: bool, level: str = MODEL_LEVELS[0]) -> None:
+        """Fold one request's outcome into the averages."""
+        self.requests += 1
+        model = self.models[level]
+        if ok:
+            previous = self.latency.get((level, stream))
+            latency = seconds if previous is None else previous + EWMA_ALPHA * (seconds - previous)
+            self.latency[(level, stream)] = latency
+            PROVIDER_LATENCY.labels(self.name, model, 'stream' if stream else 'plain').set(latency)
+        else:
+            self.failures += 1
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        PROVIDER_ERRORS.labels(self.name).set(self.error_rate)
+        PROVIDER_REQUESTS.labels(self.name, model, 'ok' if ok else 'error').inc()
+
+    def stats(self) -> Dict:
+        return {
+            'models': self.models,
+            'active': self.active,
+            'requests': self.requests,
+            'failures': self.failures,
+            'latency_ewma': {
+                f"{level}_{'stream' if stream else 'plain'}": round(latency, 3)
+                for (level, stream), latency in sorted(self.latency.items())
+            },
+            'error_ewma': round(self.error_rate, 3)
+        }
+
+def routes_from_env(providers: List[str]) -> Dict[str, List[str]]:
+    """Read LLM_ROUTE_<COMMAND>=name,name overrides for the configured providers."""
+    routes = {}
+    for key, value in os.environ.items():
+        if key.startswith('LLM_ROUTE_') and value.strip():
+            names = [name.strip().lower() for name in value.split(',') if name.strip()]
+            unknown = [name for name in names if name not in providers]
+            if unknown:
+                logger.warning(f"{key} names unknown providers {unknown}, ignoring them")
+            routes[key[len('LLM_ROUTE_'):].lower()] = [name for name in names if name in providers]
+    return routes
+
+def providers_from_env(timeout: float = None) -> List[Provider]:
+    """Build the providers named in LLM_PROVIDERS (default: just openai).
+
+    Each can be configured with LLM_<NAME>_BASE_URL, _API_KEY, _CONCURRENCY,
+    and _MODEL, _PROMPT_PRICE and _COMPLETION_PRICE (USD per 1000 tokens)
+    for its strong model. Weaker levels take the same settings with the
+    level appended (LLM_OPENAI_MODEL_FAST) and default to the next stronger
+    level's model.
+    """
+    providers = []
+    for name in os.getenv('LLM_PROVIDERS', 'openai').split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        defaults = PROVIDER_DEFAULTS.get(name, {})
+        prefix = f'LLM_{name.upper()}_'
+        base_url = os.getenv(prefix + 'BASE_URL', defaults.get('base_url'))
+        if name not in PROVIDER_DEFAULTS and not base_url:
+            logger.error(f"Provider {name} has no {prefix}BASE_URL, skipping it")
+            continue
+        models = {}
+        model, prompt_price, completion_price = 'gpt-4', 0.0, 0.0
+        for level in MODEL_LEVELS:
+            suffix = '' if level == MODEL_LEVELS[0] else f'_{level.upper()}'
+            model, prompt_price, completion_price = defaults.get('models', {}).get(
+                level, (model, prompt_price, completion_price))
+            model = os.getenv(f'{prefix}MODEL{suffix}', model)
+            prompt_price = float(os.getenv(f'{prefix}PROMPT_PRICE{suffix}', prompt_price))
+            completion_price = float(os.getenv(f'{prefix}COMPLETION_PRICE{suffix}', completion_price))
+            models[level] = (model, prompt_price, completion_price)
+        providers.append(Provider(
+            name,
+            base_url=base_url,
+            api_key=os.getenv(prefix + 'API_KEY', defaults.get('api_key')),
+            models=models,
+            concurrency=int(os.getenv(prefix + 'CONCURRENCY', defaults.get('concurrency', 8))),
+            timeout=timeout
+        ))
+    return providers
+
+class ProviderRouter:
+    """Send each request to the healthiest, fastest provider with spare capacity.
+
+    Providers are ranked by score() (latency EWMA inflated by the error
+    EWMA); a small share of requests goes to a random provider so the
+    averages of ones that were slow or failing catch up once they recover.
+    Per-command routes (LLM_ROUTE_THREAD=openai) restrict which providers a
+    command may use. When every candidate is at its concurrency limit the
+    request waits for one to free up.
+    """
+
+    def __init__(self, providers: List[Provider], routes: Dict[str, List[str]] = None,
+                 explore_rate: float = EXPLORE_RATE):
+        self.providers = [provider for provider in providers if provider.configured]
+        for provider in providers:
+            if not provider.configured:
+                logger.warning(f"Provider {provider.name} has no API key, not routing to it")
+        self.routes = routes or {}
+        self.explore_rate = explore_rate
+        self._released: Optional[asyncio.Condition] = None
+
+    def candidates(self, command: Optional[str] = None) -> List[Provider]:
+        names = self.routes.get(command or '')
+        if not names:
+            return self.providers
+        return [provider for provider in self.providers if provider.name in names] or self.providers
+
+    def choose(self, stream: bool = False, command: Optional[str] = None,
+               level: str = MODEL_LEVELS[0]) -> Optional[Provider]:
+        """Pick a provider with spare capacity for the level's model, or None if all candidates are busy."""
+        available = [p for p in self.candidates(command) if p.active < p.concurrency]
+        if not available:
+            return None
+        if len(available) > 1 and random.random() < self.explore_rate:
+            return random.choice(available)
+        # min() keeps configuration order on ties
+        return min(available, key=lambda provider: provider.score(stream, level))
+
+    async def acquire(self, stream: bool = False, command: Optional[str] = None,
+                      level: str = MODEL_LEVELS[0]) -> Provider:
+        """Reserve a concurrency slot on the chosen provider; pair with release()."""
+        if not self.providers:
+            raise OpenAIError("No LLM provider configured")
+        if self._released is None:
+            self._released = asyncio.Condition()
+        async with self._released:
+            while True:
+                provider = self.choose(stream, command, level)
+                if provider:
+                    provider.active += 1
+                    return provider
+                await self._released.wait()
+
+    async def release(self, provider: Provider) -> None:
+        provider.active -= 1
+        async with self._released:
+            # Waiters may be limited to other providers, so wake them all
+            self._released.notify_all()
+
+    def stats(self) -> Dict:
+        return {
+            'providers': {provider.name: provider.stats() for provider in self.providers},
+            'routes': self.routes
+        }
+
+def router_from_env(timeout: float = None) -> ProviderRouter:
+    """Build the router from LLM_PROVIDERS and the LLM_ROUTE_<COMMAND> overrides."""
+    providers = providers_from_env(timeout)
+    return ProviderRouter(providers, routes_from_env([provider.name for provider in providers]))
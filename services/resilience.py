@@ -0,0 +1,296 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncContextManager, Awaitable, Callable, Dict, Optional, TypeVar
+import openai
+from utils.exceptions import UpstreamUnavailableError
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Seconds before a single upstream attempt is abandoned (for streams: until the response starts)
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '30'))
+
+# Attempts per request, with full-jitter exponential backoff between them
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '3'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '8'))
+
+# Send a duplicate of a request still running after the observed p95 latency,
+# for at most this share of requests (0 disables hedging)
+LLM_HEDGE_RATIO = float(os.getenv('LLM_HEDGE_RATIO', '0.1'))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '0.5'))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_BURST = 5
+
+# Open the circuit after this many failed attempts in a row, for LLM_BREAKER_COOLDOWN seconds
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+
+UPSTREAM_RETRIES = Counter(
+    'llm_retries_total', 'Upstream attempts retried after a failure', ['reason'])
+UPSTREAM_HEDGES = Counter(
+    'llm_hedges_total', 'Hedged duplicate requests sent, and how many answered first', ['result'])
+BREAKER_STATE = Gauge(
+    'llm_circuit_state', 'Upstream circuit breaker state (0 closed, 1 half-open, 2 open)')
+BREAKER_REJECTIONS = Counter(
+    'llm_circuit_rejections_total', 'Requests failed fast because the circuit was open')
+
+# Errors worth retrying; anything else (bad request, auth) fails immediately
+RETRIABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+def is_retriable(error: Exception) -> bool:
+    if isinstance(error, RETRIABLE_ERRORS):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the upstream asked us to wait in a 429's Retry-After header, if any."""
+    if not isinstance(error, openai.RateLimitError):
+        return None
+    try:
+        return max(0.0, float(error.response.headers.get('retry-after')))
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt: int, error: Exception, base: float = LLM_BACKOFF_BASE,
+                cap: float = LLM_BACKOFF_MAX) -> float:
+    """Backoff before retry number attempt: Retry-After if given, else full jitter."""
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        # A little jitter so everyone told to wait 1s doesn't come back at once
+        return retry_after + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+class LatencyTracker:
+    """Recent successful request latencies, for the hedging threshold."""
+
+    def __init__(self, window: int = 500):
+        self._samples = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, share: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+class CircuitBreaker:
+    """Fail fast while the upstream keeps failing.
+
+    After failure_threshold failed attempts in a row the circuit opens and
+    allow() refuses requests for cooldown seconds. Then a single probe is let
+    through (half-open): its success closes the circuit, its failure opens
+    it for another cooldown, and if it is cancelled the next request probes
+    instead.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a probe through (0 unless open)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+    @property
+    def is_open(self) -> bool:
+        """Whether requests are currently being refused."""
+        if self.state == self.HALF_OPEN:
+            return self._probing
+        return self.state == self.OPEN and self.retry_after > 0
+
+    def allow(self) -> bool:
+        """Return True if a request may go upstream now."""
+        if self.state == self.OPEN:
+            if self.retry_after > 0:
+                return False
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def abandon_probe(self) -> None:
+        """Forget a half-open probe that ended without an answer, so another can be sent."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        if self.state != self.CLOSED:
+            logger.info("Upstream recovered, closing circuit")
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            logger.warning(
+                f"Opening upstream circuit for {self.cooldown:.0f}s after {self.failures} failures in a row"
+            )
+            self.opened += 1
+            self._opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        BREAKER_STATE.set({self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[state])
+
+class UpstreamGuard:
+    """Timeouts, retries, hedging and a circuit breaker around upstream LLM calls.
+
+    call() runs a request factory (each call must send a fresh request) with
+    a timeout per attempt, retrying retriable failures with backoff. Hedged
+    calls that are still running after the observed p95 latency get one
+    duplicate, and whichever answers first wins; hedges are limited to
+    hedge_ratio of requests so a slow upstream isn't sent twice the load.
+    Hedges bypass the scheduler's concurrency limit, which that cap bounds.
+    The optional backoff context manager wraps each wait between attempts,
+    so the caller can give up its scheduler slot meanwhile.
+    """
+
+    def __init__(
+        self,
+        timeout: float = LLM_REQUEST_TIMEOUT,
+        max_attempts: int = LLM_MAX_ATTEMPTS,
+        hedge_ratio: float = LLM_HEDGE_RATIO,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+        breaker: CircuitBreaker = None
+    ):
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.hedge_ratio = hedge_ratio
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self._hedge_tokens = float(HEDGE_BURST)
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rejected = 0
+
+    async def call(self, request: Callable[[], Awaitable[T]], hedge: bool = True,
+                   backoff: Callable[[], AsyncContextManager] = None) -> T:
+        """Run request() until it succeeds, the attempts run out or the circuit opens."""
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.breaker.allow():
+                self.rejected += 1
+                BREAKER_REJECTIONS.inc()
+                raise UpstreamUnavailableError(
+                    "AI provider unavailable", retry_after=self.breaker.retry_after
+                )
+            probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+            try:
+                result = await (self._hedged(request) if hedge else self._attempt(request))
+            except asyncio.CancelledError:
+                # Cancelled from outside: nothing was learned about the upstream
+                if probe:
+                    self.breaker.abandon_probe()
+                raise
+            except Exception as e:
+                if not is_retriable(e):
+                    # The upstream answered; the request itself was at fault
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_attempts:
+                    raise
+                delay = retry_delay(attempt, e)
+                self.retries += 1
+                UPSTREAM_RETRIES.labels(type(e).__name__).inc()
+                logger.warning(f"Upstream attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                if backoff:
+                    async with backoff():
+                        await asyncio.sleep(delay)
+                else:
+                    await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def _attempt(self, request: Callable[[], Awaitable[T]], track: bool = False) -> T:
+        started = time.monotonic()
+        result = await asyncio.wait_for(request(), self.timeout)
+        if track:
+            self.latency.observe(time.monotonic() - started)
+        return result
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which to hedge, or None while there are too few samples."""
+        if self.hedge_ratio <= 0 or len(self.latency) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.hedge_min_delay, self.latency.percentile(0.95))
+
+    async def _hedged(self, request: Callable[[], Awaitable[T]]) -> T:
+        self._hedge_tokens = min(HEDGE_BURST, self._hedge_tokens + self.hedge_ratio)
+        delay = self.hedge_delay()
+        first = asyncio.ensure_future(self._attempt(request, track=True))
+        if delay is None:
+            return await first
+
+        pending = {first}
+        error = None
+        try:
+            # asyncio.wait doesn't cancel what it waits for, so the finally must
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or self._hedge_tokens < 1:
+                return await first
+
+            self._hedge_tokens -= 1
+            self.hedges += 1
+            UPSTREAM_HEDGES.labels('sent').inc()
+            second = asyncio.ensure_future(self._attempt(request, track=True))
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                            UPSTREAM_HEDGES.labels('won').inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            'circuit': self.breaker.state,
+            'circuit_opened': self.breaker.opened,
+            'rejected': self.rejected,
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'p95_seconds': round(self.latency.percentile(0.95), 3)
+        }
+
+# Shared guard for all upstream completion requests
+upstream = UpstreamGuard()
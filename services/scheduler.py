@@ -0,0 +1,178 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List
+from models.subscription import SubscriptionTier
+from utils.exceptions import OpenAIError
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+TIER_PRIORITIES = {
+    SubscriptionTier.PREMIUM: 0,
+    SubscriptionTier.FREE: 1
+}
+
+class LLMScheduler:
+    """Global admission point for upstream LLM requests.
+
+    Callers wait in a bounded priority queue (premium ahead of free, FIFO within
+    a tier) until both a concurrency slot and enough of the tokens-per-minute
+    budget are available. The slot is held for the duration of the ``async
+    with`` block, so a streamed completion keeps it until the stream ends.
+    """
+
+    def __init__(self, max_concurrency: int = 8, tokens_per_minute: int = 40000, max_queue: int = 100):
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = max(1, tokens_per_minute)
+        self.max_queue = max_queue
+        self.active = 0
+        self._tokens = float(self.tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._queue: List = []
+        self._counter = itertools.count()
+        self._retry_handle = None
+        self._waits: Dict[SubscriptionTier, deque] = {tier: deque(maxlen=1000) for tier in TIER_PRIORITIES}
+        self._rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, tier: SubscriptionTier = SubscriptionTier.FREE, tokens: int = 0):
+        """Wait for a concurrency slot and token budget, holding the slot inside the block.
+
+        Yields the SchedulerSlot, whose paused() hands the slot back for a while.
+        """
+        slot = SchedulerSlot(self, tier, tokens)
+        await slot.acquire()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    async def acquire(self, tier: SubscriptionTier = SubscriptionTier.FREE, tokens: int = 0):
+        """Queue the request and wait until it is admitted."""
+        if len(self._queue) >= self.max_queue:
+            self._rejected += 1
+            logger.warning(f"LLM queue full ({len(self._queue)} waiting), rejecting {tier.value} request")
+            raise OpenAIError("Generation queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        # Requests larger than the whole budget could never be admitted
+        cost = min(max(tokens, 0), self.tokens_per_minute)
+        heapq.heappush(
+            self._queue,
+            (TIER_PRIORITIES.get(tier, 1), next(self._counter), future, cost, tier, time.monotonic())
+        )
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Give the slot back if we were admitted just as we got cancelled
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """Free a concurrency slot and admit the next request."""
+        self.active -= 1
+        self._dispatch()
+
+    def stats(self) -> Dict:
+        """Return queue depth and wait-time statistics per tier."""
+        waiting = {tier.value: 0 for tier in TIER_PRIORITIES}
+        for item in self._queue:
+            if not item[2].done():
+                waiting[item[4].value] += 1
+
+        wait_times = {}
+        for tier, waits in self._waits.items():
+            ordered = sorted(waits)
+            wait_times[tier.value] = {
+                'avg': sum(ordered) / len(ordered) if ordered else 0.0,
+                'p95': ordered[int(len(ordered) * 0.95)] if ordered else 0.0
+            }
+
+        self._refill()
+        return {
+            'active': self.active,
+            'queued': waiting,
+            'rejected': self._rejected,
+            'tokens_available': int(self._tokens),
+            'wait_seconds': wait_times
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.tokens_per_minute),
+            self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60
+        )
+        self._refilled_at = now
+
+    def _dispatch(self):
+        """Admit queued requests while slots and token budget allow."""
+        if self._retry_handle:
+            self._retry_handle.cancel()
+            self._retry_handle = None
+
+        while self._queue and self.active < self.max_concurrency:
+            _, _, future, cost, tier, enqueued_at = self._queue[0]
+            if future.done():
+                # Cancelled while waiting
+                heapq.heappop(self._queue)
+                continue
+
+            self._refill()
+            if self._tokens < cost:
+                # Try again once the budget has refilled enough for the head request
+                delay = (cost - self._tokens) * 60 / self.tokens_per_minute
+                self._retry_handle = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+
+            heapq.heappop(self._queue)
+            self._tokens -= cost
+            self.active += 1
+            self._waits[tier].append(time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+class SchedulerSlot:
+    """A slot held in an LLMScheduler, which can be given up while its holder waits."""
+
+    def __init__(self, scheduler: LLMScheduler, tier: SubscriptionTier, tokens: int = 0):
+        self.scheduler = scheduler
+        self.tier = tier
+        self.tokens = tokens
+        self.held = False
+
+    async def acquire(self):
+        await self.scheduler.acquire(self.tier, self.tokens)
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.scheduler.release()
+
+    @asynccontextmanager
+    async def paused(self):
+        """Free the slot inside the block (a retry backoff) and queue for it again after.
+
+        Re-admission charges the token estimate again, since the retry is a new request.
+        """
+        self.release()
+        try:
+            yield
+        finally:
+            await self.acquire()
+
+# Shared scheduler for every generation request in the process
+scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("OPENAI_GLOBAL_CONCURRENCY", "8")),
+    tokens_per_minute=int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "40000")),
+    max_queue=int(os.getenv("LLM_QUEUE_SIZE", "100"))
+)
@@ -0,0 +1,271 @@
+import json
+import queue
+import signal
+import asyncio
+import logging
+import multiprocessing
+from typing import Callable, Dict, List, Optional
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter
+from telegram.ext import Application
+from services.webhook_server import SECRET_TOKEN_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Updates buffered per worker before the dispatcher blocks
+WORKER_QUEUE_SIZE = 1000
+
+# Seconds Telegram holds a getUpdates long poll open
+POLL_TIMEOUT = 30
+
+def update_user_id(data: Dict) -> int:
+    """Pick the id an update is routed by straight from its JSON.
+
+    Every update type carries its payload under a single key next to
+    update_id. The sender (``from``, or ``user`` for member/poll updates) is
+    preferred so a user's flows stay on one worker; updates without one fall
+    back to the chat id.
+    """
+    for key, payload in data.items():
+        if key == 'update_id' or not isinstance(payload, dict):
+            continue
+        for field in ('from', 'user', 'chat'):
+            if isinstance(payload.get(field), dict):
+                return payload[field].get('id', 0)
+        message = payload.get('message')
+        if isinstance(message, dict) and isinstance(message.get('chat'), dict):
+            return message['chat'].get('id', 0)
+    return 0
+
+def shard_for(user_id: int, workers: int) -> int:
+    """Return the worker index that owns a user."""
+    return abs(user_id) % workers
+
+async def _feed_updates(application: Application, updates: multiprocessing.Queue) -> None:
+    """Move update JSON from the dispatcher queue into the application."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await loop.run_in_executor(None, updates.get)]
+        # Take whatever else is already waiting without another thread hop
+        try:
+            while len(batch) < WORKER_QUEUE_SIZE:
+                batch.append(updates.get_nowait())
+        except queue.Empty:
+            pass
+        for raw in batch:
+            if raw is None:
+                return
+            update = Update.de_json(json.loads(raw), application.bot)
+            if update:
+                await application.update_queue.put(update)
+
+async def _run_worker(application: Application, updates: multiprocessing.Queue) -> None:
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await _feed_updates(application, updates)
+        # stop() only awaits updates it has started, so let the queue drain first
+        await application.update_queue.join()
+    finally:
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+def _worker_main(index: int, workers: int, factory: Callable[[int, int], Application],
+                 updates: multiprocessing.Queue) -> None:
+    """Entry point of a worker process."""
+    # The dispatcher owns shutdown; it sends a sentinel down the queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    application = factory(index, workers)
+    asyncio.run(_run_worker(application, updates))
+
+class ShardedDispatcher:
+    """Receive updates in one process and route them to N worker processes.
+
+    Updates are routed by sender id, so every update from a user is handled
+    by the same worker and ConversationHandler state, per-user caches and
+    rate limits stay process-local. ``factory(index, workers)`` runs in each worker
+    and must return an Application built without an updater; it has to be a
+    module-level function so it can be sent to a spawned process.
+
+    Every update still passes through this one process, so sharding only helps
+    when handlers are CPU-heavy; see benchmarks/sharded_dispatch.py.
+    """
+
+    def __init__(self, factory: Callable[[int, int], Application], workers: int,
+                 queue_size: int = WORKER_QUEUE_SIZE):
+        self.factory = factory
+        self.workers = workers
+        self._context = multiprocessing.get_context('spawn')
+        self._queues: List[multiprocessing.Queue] = []
+        self._processes: List[multiprocessing.Process] = []
+        self.queue_size = queue_size
+        self.routed = [0] * workers
+        self._locks = [asyncio.Lock() for _ in range(workers)]
+
+    def start(self) -> None:
+        """Spawn the worker processes."""
+        for index in range(self.workers):
+            updates = self._context.Queue(self.queue_size)
+            process = self._context.Process(
+                target=_worker_main,
+                args=(index, self.workers, self.factory, updates),
+                name=f'bot-worker-{index}',
+                daemon=False
+            )
+            process.start()
+            self._queues.append(updates)
+            self._processes.append(process)
+        logger.info(f"Started {self.workers} worker processes")
+
+    def stop(self, timeout: float = 30) -> None:
+        """Let workers drain their queues, then wait for them to exit."""
+        for updates in self._queues:
+            updates.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in time, terminating")
+                process.terminate()
+        logger.info("All worker processes stopped")
+
+    @property
+    def alive(self) -> int:
+        return sum(process.is_alive() for process in self._processes)
+
+    def _route(self, data: Dict, raw: Optional[str]):
+        index = shard_for(update_user_id(data), self.workers)
+        return index, raw if raw is not None else json.dumps(data)
+
+    def dispatch(self, data: Dict, raw: Optional[str] = None) -> int:
+        """Route one update (decoded JSON) to its worker; returns the worker index."""
+        index, raw = self._route(data, raw)
+        self._queues[index].put(raw)
+        self.routed[index] += 1
+        return index
+
+    async def dispatch_async(self, data: Dict, raw: Optional[str] = None) -> int:
+        """dispatch() without blocking the event loop when a worker queue is full."""
+        index, raw = self._route(data, raw)
+        # Hold the worker's lock while waiting for room so its updates keep their order
+        async with self._locks[index]:
+            try:
+                self._queues[index].put_nowait(raw)
+            except queue.Full:
+                await asyncio.get_running_loop().run_in_executor(None, self._queues[index].put, raw)
+        self.routed[index] += 1
+        return index
+
+    async def poll(self, bot: Bot, stop: asyncio.Event) -> None:
+        """Long-poll Telegram and route every update until stop is set."""
+        await bot.delete_webhook()
+        offset = None
+        while not stop.is_set():
+            try:
+                updates = await bot.get_updates(
+                    offset=offset,
+                    timeout=POLL_TIMEOUT,
+                    read_timeout=POLL_TIMEOUT + 10,
+                    allowed_updates=Update.ALL_TYPES
+                )
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except NetworkError as e:
+                logger.error(f"Polling failed: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self.dispatch_async(update.to_dict())
+                offset = update.update_id + 1
+
+    async def serve_webhook(self, bot: Bot, stop: asyncio.Event, listen: str = '0.0.0.0',
+                            port: int = 8443, url_path: str = 'telegram',
+                            webhook_url: Optional[str] = None, secret_token: Optional[str] = None,
+                            max_connections: int = 40) -> None:
+        """Accept webhook calls and route every update until stop is set."""
+        if webhook_url:
+            await bot.set_webhook(
+                url=f"{webhook_url.rstrip('/')}/{url_path.strip('/')}",
+                secret_token=secret_token,
+                max_connections=max_connections,
+                allowed_updates=Update.ALL_TYPES
+            )
+        server = HTTPServer(tornado.web.Application([
+            (rf'/{url_path.strip("/")}/?', ShardedWebhookHandler,
+             {'dispatcher': self, 'secret_token': secret_token}),
+            (r'/health/?', ShardedHealthHandler, {'dispatcher': self}),
+        ]))
+        server.listen(port, address=listen)
+        logger.info(f"Dispatching webhook on {listen}:{port}/{url_path.strip('/')} to {self.workers} workers")
+        try:
+            await stop.wait()
+        finally:
+            server.stop()
+
+    def run(self, bot: Bot, mode: str = 'polling', **webhook_options) -> None:
+        """Start the workers and feed them until SIGINT/SIGTERM."""
+        self.start()
+        try:
+            asyncio.run(self._receive(bot, mode, webhook_options))
+        finally:
+            self.stop()
+
+    async def _receive(self, bot: Bot, mode: str, webhook_options: Dict) -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+
+        async with bot:
+            if mode == 'webhook':
+                await self.serve_webhook(bot, stop, **webhook_options)
+            else:
+                poller = asyncio.create_task(self.poll(bot, stop))
+                await stop.wait()
+                poller.cancel()
+
+class ShardedWebhookHandler(tornado.web.RequestHandler):
+    """Route webhook updates to workers without building Update objects."""
+
+    def initialize(self, dispatcher: ShardedDispatcher, secret_token: Optional[str]):
+        self.dispatcher = dispatcher
+        self.secret_token = secret_token
+
+    async def post(self):
+        if self.secret_token and self.request.headers.get(SECRET_TOKEN_HEADER) != self.secret_token:
+            logger.warning("Rejected webhook call with a missing or wrong secret token")
+            raise tornado.web.HTTPError(403)
+        raw = self.request.body.decode('utf-8')
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+        await self.dispatcher.dispatch_async(data, raw)
+        self.set_status(200)
+
+class ShardedHealthHandler(tornado.web.RequestHandler):
+    """Report healthy only while every worker process is alive."""
+
+    def initialize(self, dispatcher: ShardedDispatcher):
+        self.dispatcher = dispatcher
+
+    def get(self):
+        alive = self.dispatcher.alive
+        self.set_status(200 if alive == self.dispatcher.workers else 503)
+        self.write({
+            'status': 'ok' if alive == self.dispatcher.workers else 'degraded',
+            'workers': self.dispatcher.workers,
+            'workers_alive': alive,
+            'routed': self.dispatcher.routed
+        })
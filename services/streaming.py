@@ -0,0 +1,107 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional
+from telegram import Message, Update
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between progress edits in the same chat (Telegram flood limits)
+EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+# Time of the last progress edit per chat, shared by all replies in that chat,
+# oldest first; entries older than EDIT_INTERVAL no longer throttle anything
+_last_edit: "OrderedDict[int, float]" = OrderedDict()
+
+def _mark_edited(chat_id: int, now: float) -> None:
+    _last_edit[chat_id] = now
+    _last_edit.move_to_end(chat_id)
+    while _last_edit:
+        chat, edited_at = next(iter(_last_edit.items()))
+        if now - edited_at < EDIT_INTERVAL:
+            break
+        del _last_edit[chat]
+
+class StreamingReply:
+    """A single reply message that is edited in place as a generation streams in.
+
+    The placeholder sent by start() is progressively edited by update(), at most
+    once per EDIT_INTERVAL per chat, and finish() turns it into the final
+    message instead of deleting it and sending a new one.
+    """
+
+    def __init__(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        message: Optional[Message] = None,
+        placeholder: str = "🤔 Generating tweets..."
+    ):
+        self.update = update
+        self.context = context
+        self.chat_id = update.effective_chat.id
+        self.message = message
+        self.placeholder = placeholder
+        # Text and edit options (reply_markup, parse_mode) last shown
+        self._last_text = None
+        self._last_options = {}
+
+    async def start(self):
+        """Show the placeholder and a typing indicator."""
+        if self.message:
+            await self._edit(self.placeholder)
+        else:
+            self.message = await self.update.effective_message.reply_text(self.placeholder)
+            self._last_text = self.placeholder
+        await self.context.bot.send_chat_action(chat_id=self.chat_id, action="typing")
+
+    async def update_text(self, text: str):
+        """Show partial output, skipping the edit if this chat was edited too recently."""
+        if not self.message or not text:
+            return
+        now = time.monotonic()
+        if now - _last_edit.get(self.chat_id, 0.0) < EDIT_INTERVAL:
+            return
+        _mark_edited(self.chat_id, now)
+        await self._edit(text[:MAX_MESSAGE_LENGTH - 1] + "▌")
+
+    async def finish(self, text: str, **kwargs):
+        """Replace the placeholder with the final text, or send it if nothing was shown."""
+        if not self.message:
+            self.message = await self.update.effective_message.reply_text(text, **kwargs)
+            return
+        _mark_edited(self.chat_id, time.monotonic())
+        await self._edit(text, raise_errors=True, **kwargs)
+
+    async def fail(self):
+        """Remove the placeholder after an error."""
+        if self.message:
+            try:
+                await self.message.delete()
+            except BadRequest as e:
+                logger.warning(f"Could not delete placeholder: {e}")
+            self.message = None
+
+    async def _edit(self, text: str, raise_errors: bool = False, **kwargs):
+        # The same text with new buttons or formatting still needs the edit
+        if text == self._last_text and kwargs == self._last_options:
+            return
+        try:
+            await self.message.edit_text(text, **kwargs)
+            self._last_text = text
+            self._last_options = kwargs
+        except RetryAfter as e:
+            logger.warning(f"Flood limit hit in chat {self.chat_id}, retry after {e.retry_after}s")
+            if raise_errors:
+                raise
+        except BadRequest as e:
+            # "Message is not modified" and friends are harmless for progress edits
+            if raise_errors and "not modified" not in str(e):
+                raise
+            logger.debug(f"Skipped message edit: {e}")
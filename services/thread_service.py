@@ -0,0 +1,199 @@
+import os
+import re
+import asyncio
+import logging
+from typing import List, Optional
+from utils.exceptions import OpenAIError
+from services.deepseek_service import complete, run_generation
+from services.streaming import StreamingReply
+from models.subscription import SubscriptionTier
+
+logger = logging.getLogger(__name__)
+
+# Expansions in flight at once for one thread; the default runs a 10-tweet
+# thread in a single wave so it takes about two round trips
+THREAD_MAX_CONCURRENT_REQUESTS = int(os.getenv("THREAD_MAX_CONCURRENT_REQUESTS", "10"))
+
+# Attempts at an outline with the requested number of points
+OUTLINE_ATTEMPTS = 2
+
+MAX_TWEET_LENGTH = 280
+
+OUTLINE_SYSTEM_PROMPT = """You plan Twitter threads. Given a topic and a number of tweets, reply with a numbered outline: exactly that many lines, each formatted as "N. <point>", one short sentence per point, in the order the thread should read.
+The first point is a hook that makes people want to read on; the last one wraps up with a takeaway or call to action. Every point in between adds something new.
+Reply with the outline only, no title or other text."""
+
+TWEET_SYSTEM_PROMPT = """You are an expert social media writer drafting a Twitter thread one tweet at a time.
+You get the thread's topic, the position of the tweet to write, its outline point and the points around it.
+Write only that tweet:
+- Cover its own point, following on naturally from the previous one without repeating it
+- Leave the next point for the next tweet
+- Sound like a real person: conversational, contractions, emojis and hashtags only where natural
+- No numbering, no "Tweet N:" label, no quotes around it
+- Under 260 characters"""
+
+_OUTLINE_LINE = re.compile(r'^\s*(\d+)\s*[.):]\s*(.+?)\s*$')
+# Numbering or labels the model may prepend despite the instructions: "Tweet 3:", "3/10", "(3/10)", "3."
+_TWEET_PREFIX = re.compile(
+    r'^\s*(?:tweet\s*\d+\s*(?:/\s*\d+)?\s*[.):-]?|\(?\d+\s*/\s*\d+\)?|\d+\s*[.)](?!\d))\s*',
+    re.IGNORECASE
+)
+
+def _parse_outline(text: Optional[str], length: int) -> Optional[List[str]]:
+    """Return the outline's points in order, or None unless they are numbered 1..length."""
+    points = {}
+    for line in (text or '').splitlines():
+        match = _OUTLINE_LINE.match(line)
+        if match:
+            points.setdefault(int(match.group(1)), match.group(2))
+    if sorted(points) != list(range(1, length + 1)):
+        return None
+    return [points[number] for number in range(1, length + 1)]
+
+def _outline_prompt(topic: str, length: int) -> str:
+    return f"Topic: {topic}\nNumber of tweets: {length}\n\nWrite the {length}-point outline."
+
+def _tweet_prompt(topic: str, points: List[str], index: int) -> str:
+    """Prompt for tweet index, with its own point and the neighbouring ones as context."""
+    lines = [
+        f"Thread topic: {topic}",
+        f"Write tweet {index + 1} of {len(points)}.",
+        f"This tweet's point: {points[index]}"
+    ]
+    if index > 0:
+        lines.append(f"Previous tweet's point: {points[index - 1]}")
+    else:
+        lines.append("This is the opening tweet: hook the reader.")
+    if index < len(points) - 1:
+        lines.append(f"Next tweet's point: {points[index + 1]}")
+    else:
+        lines.append("This is the closing tweet: land the takeaway.")
+    return "\n".join(lines)
+
+def _clean_thread_tweet(content: Optional[str]) -> Optional[str]:
+    """Strip labels and numbering the model added, since positions are set by the outline."""
+    if not content:
+        return None
+    tweet = _TWEET_PREFIX.sub('', content.strip().strip('"'), count=1).strip()
+    return tweet or None
+
+def _shorten(tweet: str) -> str:
+    """Cut a tweet at a word boundary so it fits the length limit."""
+    if len(tweet) <= MAX_TWEET_LENGTH:
+        return tweet
+    return tweet[:MAX_TWEET_LENGTH - 1].rsplit(' ', 1)[0].rstrip(' ,;:-') + "…"
+
+def validate_thread(tweets: List[Optional[str]], length: int) -> List[str]:
+    """Check the assembled thread has every position filled, in order, within the length limit."""
+    if len(tweets) != length:
+        raise OpenAIError(f"Thread has {len(tweets)} tweets, expected {length}")
+    missing = [i + 1 for i, tweet in enumerate(tweets) if not tweet]
+    if missing:
+        raise OpenAIError(f"Could not write tweets {missing} of the thread")
+    too_long = [i + 1 for i, tweet in enumerate(tweets) if len(tweet) > MAX_TWEET_LENGTH]
+    if too_long:
+        raise OpenAIError(f"Tweets {too_long} of the thread are over {MAX_TWEET_LENGTH} characters")
+    return list(tweets)
+
+async def _outline(topic: str, length: int, semaphore: asyncio.Semaphore,
+                   tier: SubscriptionTier) -> List[str]:
+    """Ask for the numbered outline, retrying once if it has the wrong shape."""
+    for attempt in range(1, OUTLINE_ATTEMPTS + 1):
+        text = await complete(
+            OUTLINE_SYSTEM_PROMPT,
+            _outline_prompt(topic, length),
+            semaphore,
+            tier,
+            # Short points keep this call fast
+            max_tokens=40 * length + 20,
+            temperature=0.7
+        )
+        points = _parse_outline(text, length)
+        if points:
+            return points
+        logger.warning(f"Unusable {length}-point outline (attempt {attempt}): {text!r}")
+    raise OpenAIError("Could not outline the thread")
+
+async def _expand(topic: str, points: List[str], index: int, semaphore: asyncio.Semaphore,
+                  tier: SubscriptionTier) -> Optional[str]:
+    """Write the tweet for one outline point, asking once for a shorter draft if it is too long."""
+    prompt = _tweet_prompt(topic, points, index)
+    tweet = _clean_thread_tweet(await complete(TWEET_SYSTEM_PROMPT, prompt, semaphore, tier))
+    if tweet and len(tweet) > MAX_TWEET_LENGTH:
+        logger.info(f"Tweet {index + 1} is {len(tweet)} characters, asking for a shorter one")
+        retry = _clean_thread_tweet(await complete(
+            TWEET_SYSTEM_PROMPT,
+            f"{prompt}\n\nYour draft was {len(tweet)} characters:\n{tweet}\n\n"
+            f"Rewrite it in under 240 characters.",
+            semaphore,
+            tier
+        ))
+        tweet = _shorten(retry or tweet)
+    return tweet
+
+def _progress(points: List[str], tweets: List[Optional[str]]) -> str:
+    """Partial thread for the reply: finished tweets, and outline points for the rest."""
+    return "\n\n".join(
+        f"{i}. {tweet}" if tweet else f"{i}. ✍️ {point}"
+        for i, (point, tweet) in enumerate(zip(points, tweets), 1)
+    )
+
+async def _write_thread(topic: str, length: int, reply: Optional[StreamingReply],
+                        tier: SubscriptionTier) -> List[str]:
+    """Outline the thread, then expand every point concurrently."""
+    semaphore = asyncio.Semaphore(max(1, THREAD_MAX_CONCURRENT_REQUESTS))
+    points = await _outline(topic, length, semaphore, tier)
+    logger.info(f"Outlined {length}-tweet thread, expanding")
+
+    tweets: List[Optional[str]] = [None] * length
+
+    async def expand(index: int):
+        try:
+            tweets[index] = await _expand(topic, points, index, semaphore, tier)
+        except Exception as e:
+            logger.error(f"Error writing tweet {index + 1} of thread: {str(e)}")
+            return
+        if reply:
+            await reply.update_text(_progress(points, tweets))
+
+    if reply:
+        await reply.update_text(_progress(points, tweets))
+    await asyncio.gather(*(expand(i) for i in range(length)))
+
+    # One more try for positions whose request failed, still in parallel
+    missing = [i for i, tweet in enumerate(tweets) if not tweet]
+    if missing:
+        logger.info(f"Retrying {len(missing)} of {length} thread tweets")
+        await asyncio.gather(*(expand(i) for i in missing))
+
+    return validate_thread(tweets, length)
+
+async def generate_thread(
+    topic: str,
+    length: int,
+    reply: StreamingReply = None,
+    cache_key: str = None,
+    tier: SubscriptionTier = SubscriptionTier.PREMIUM,
+    user_id: int = None
+) -> List[str]:
+    """Generate a coherent thread of length tweets about topic.
+
+    One short completion produces a numbered outline; then every tweet is
+    written concurrently from its outline point, with the neighbouring points
+    as context, so the thread takes about two round trips whatever its
+    length. The assembled thread is checked by validate_thread().
+
+    The reply shows the outline and the tweets as they are written. Caching,
+    degraded answers, budgets and billing work as in generate_tweets, as the
+    "thread" command.
+    """
+    return await run_generation(
+        lambda: _write_thread(topic, length, reply, tier),
+        f"{length}-tweet thread",
+        command='thread',
+        reply=reply,
+        cache_key=cache_key,
+        tier=tier,
+        user_id=user_id,
+        source='thread'
+    )
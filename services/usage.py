@@ -0,0 +1,139 @@
+import os
+import logging
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from models.subscription import SubscriptionTier
+from models.write_buffer import usage_day
+from utils.exceptions import BudgetExceededError
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+def _parse_budget(value: str) -> Tuple[int, int]:
+    """Parse a "daily:monthly" token budget setting; 0 means unlimited."""
+    daily, monthly = value.split(':')
+    return int(daily), int(monthly)
+
+# Tokens (prompt + completion) each tier may spend: (per UTC day, per UTC month)
+TOKEN_BUDGETS = {
+    SubscriptionTier.FREE: _parse_budget(os.getenv('TOKEN_BUDGET_FREE', '20000:200000')),
+    SubscriptionTier.PREMIUM: _parse_budget(os.getenv('TOKEN_BUDGET_PREMIUM', '200000:3000000'))
+}
+
+# Number of users whose current spend is kept in memory
+SPEND_CACHE_SIZE = int(os.getenv('SPEND_CACHE_SIZE', '10000'))
+
+# (user_id, command) that completions made by the current task are billed to;
+# a context variable so concurrent sub-requests of one generation inherit it
+billing_account: ContextVar[Optional[Tuple[int, str]]] = ContextVar('billing_account', default=None)
+
+BUDGET_REJECTIONS = Counter(
+    'llm_budget_rejections_total', 'Generations refused because a token budget was used up',
+    ['tier', 'period'])
+
+class UsageMeter:
+    """Token accounting per user and command, with per-tier spend budgets.
+
+    Usage is handed to the database's write-behind buffer, which sums it per
+    (user, day, command) and upserts the totals on flush. Each user's spend
+    for the current day and month is kept in a bounded LRU once loaded, so
+    checking a budget doesn't cost a query per generation. Without a database
+    nothing is recorded or enforced.
+    """
+
+    def __init__(self, budgets: Dict[SubscriptionTier, Tuple[int, int]] = TOKEN_BUDGETS, db=None,
+                 max_users: int = SPEND_CACHE_SIZE):
+        self.budgets = budgets
+        self.db = db
+        self.max_users = max_users
+        # user_id -> [day, tokens today, month, tokens this month]
+        self._spend: "OrderedDict[int, list]" = OrderedDict()
+
+    def attach_database(self, db) -> None:
+        """Record usage in the given database and enforce budgets from it."""
+        self.db = db
+        self._spend.clear()
+
+    async def _current_spend(self, user_id: int) -> list:
+        day = usage_day()
+        month = day[:7]
+        spend = self._spend.get(user_id)
+        if spend is None or spend[2] != month:
+            # First check this month: load both totals from the aggregate table
+            spend = [
+                day,
+                await self.db.get_token_spend(user_id, day),
+                month,
+                await self.db.get_token_spend(user_id, f'{month}-01')
+            ]
+            self._spend[user_id] = spend
+            # An evicted user's totals are simply reloaded, unflushed usage included
+            while len(self._spend) > self.max_users:
+                self._spend.popitem(last=False)
+        elif spend[0] != day:
+            spend[0] = day
+            spend[1] = 0
+        self._spend.move_to_end(user_id)
+        return spend
+
+    async def check(self, user_id: int, tier: SubscriptionTier) -> None:
+        """Raise BudgetExceededError if the user has no tokens left today or this month."""
+        if self.db is None:
+            return
+        daily, monthly = self.budgets.get(tier, self.budgets[SubscriptionTier.FREE])
+        _, today, _, this_month = await self._current_spend(user_id)
+
+        if daily and today >= daily:
+            BUDGET_REJECTIONS.labels(tier.value, 'day').inc()
+            logger.info(f"User {user_id} reached the daily token budget ({today}/{daily})")
+            raise BudgetExceededError(
+                "You've reached today's generation limit. It resets at midnight UTC."
+            )
+        if monthly and this_month >= monthly:
+            BUDGET_REJECTIONS.labels(tier.value, 'month').inc()
+            logger.info(f"User {user_id} reached the monthly token budget ({this_month}/{monthly})")
+            raise BudgetExceededError(
+                "You've reached this month's generation limit. It resets on the 1st (UTC)."
+            )
+
+    def record(self, user_id: int, command: str, prompt_tokens: int, completion_tokens: int,
+               cost: float = 0.0) -> None:
+        """Count a completion's tokens and its cost in USD against the user and command."""
+        if self.db is None:
+            return
+        self.db.add_token_usage(user_id, command, prompt_tokens, completion_tokens, cost)
+        spend = self._spend.get(user_id)
+        if spend is not None:
+            spend[1] += prompt_tokens + completion_tokens
+            spend[3] += prompt_tokens + completion_tokens
+
+    async def report(self, since_day: str, limit: int = 10) -> Dict[str, List[Dict]]:
+        """Top spenders and cost per command since since_day (YYYY-MM-DD)."""
+        await self.db.flush()
+        top_spenders = [
+            {
+                'user_id': user_id,
+                'requests': requests,
+                'tokens': prompt_tokens + completion_tokens,
+                'cost_usd': round(cost, 4)
+            }
+            for user_id, requests, prompt_tokens, completion_tokens, cost
+            in await self.db.get_top_spenders(since_day, limit)
+        ]
+        commands = [
+            {
+                'command': command,
+                'users': users,
+                'requests': requests,
+                'tokens': prompt_tokens + completion_tokens,
+                'cost_usd': round(cost, 4),
+                'cost_per_request_usd': round(cost / requests, 5)
+            }
+            for command, users, requests, prompt_tokens, completion_tokens, cost
+            in await self.db.get_command_usage(since_day)
+        ]
+        return {'top_spenders': top_spenders, 'commands': commands}
+
+# Shared meter for all generation entry points
+usage_meter = UsageMeter()
@@ -0,0 +1,112 @@
+import json
+import signal
+import asyncio
+import logging
+from typing import List, Optional
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Header Telegram sends with every webhook call when a secret token is set
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class TelegramWebhookHandler(tornado.web.RequestHandler):
+    """Receive updates POSTed by Telegram and queue them for the application."""
+
+    # tornado reserves self.application for its own app, hence bot_app
+    def initialize(self, bot_app: Application, secret_token: Optional[str]):
+        self.bot_app = bot_app
+        self.secret_token = secret_token
+
+    async def post(self):
+        if self.secret_token and self.request.headers.get(SECRET_TOKEN_HEADER) != self.secret_token:
+            logger.warning("Rejected webhook call with a missing or wrong secret token")
+            raise tornado.web.HTTPError(403)
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+
+        update = Update.de_json(data, self.bot_app.bot)
+        if update:
+            await self.bot_app.update_queue.put(update)
+        self.set_status(200)
+
+class HealthHandler(tornado.web.RequestHandler):
+    """Report liveness for load balancers and orchestrators."""
+
+    def initialize(self, bot_app: Application):
+        self.bot_app = bot_app
+
+    def get(self):
+        healthy = self.bot_app.running
+        self.set_status(200 if healthy else 503)
+        self.write({
+            'status': 'ok' if healthy else 'stopping',
+            'pending_updates': self.bot_app.update_queue.qsize()
+        })
+
+def build_web_app(application: Application, url_path: str, secret_token: Optional[str] = None,
+                  extra_handlers: List = None) -> tornado.web.Application:
+    """Build the tornado app serving the webhook and health endpoints."""
+    return tornado.web.Application([
+        (rf'/{url_path.strip("/")}/?', TelegramWebhookHandler,
+         {'bot_app': application, 'secret_token': secret_token}),
+        (r'/health/?', HealthHandler, {'bot_app': application}),
+        *(extra_handlers or [])
+    ])
+
+async def serve_webhook(
+    application: Application,
+    listen: str = '0.0.0.0',
+    port: int = 8443,
+    url_path: str = 'telegram',
+    webhook_url: Optional[str] = None,
+    secret_token: Optional[str] = None,
+    max_connections: int = 40,
+    extra_handlers: List = None
+) -> None:
+    """Run the application behind a webhook until SIGINT/SIGTERM.
+
+    If webhook_url is given it is registered with Telegram; leave it out to
+    run locally and POST recorded Update JSON to the listen address instead.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows event loops don't support signal handlers
+            pass
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    if webhook_url:
+        await application.bot.set_webhook(
+            url=f"{webhook_url.rstrip('/')}/{url_path.strip('/')}",
+            secret_token=secret_token,
+            max_connections=max_connections,
+            allowed_updates=Update.ALL_TYPES
+        )
+
+    server = HTTPServer(build_web_app(application, url_path, secret_token, extra_handlers))
+    server.listen(port, address=listen)
+    logger.info(f"Serving webhook on {listen}:{port}/{url_path.strip('/')}")
+
+    try:
+        await stop.wait()
+    finally:
+        server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
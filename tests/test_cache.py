@@ -0,0 +1,19 @@
+from services.cache import make_cache_key
+
+def test_topic_case_punctuation_and_whitespace_are_normalized():
+    assert make_cache_key('Remote  Work!') == make_cache_key('remote work')
+    assert make_cache_key('  "remote work?" ') == make_cache_key('remote work')
+
+def test_niche_tone_and_category_are_case_insensitive():
+    assert make_cache_key('ai', 'Tech', 'Casual', 'TIPS') == make_cache_key('ai', 'tech', 'casual', 'tips')
+
+def test_parameters_that_change_the_output_change_the_key():
+    base = make_cache_key('ai', 'tech', 'casual')
+    assert make_cache_key('ai', 'tech', 'formal') != base
+    assert make_cache_key('ai', 'tech', 'casual', 'tips') != base
+    assert make_cache_key('ai', 'tech', 'casual', length=5) != base
+
+def test_tiers_do_not_share_entries():
+    # Tiers get different models, so free output must never be served to premium or the reverse
+    assert make_cache_key('ai', tier='free') != make_cache_key('ai', tier='premium')
+    assert make_cache_key('ai', tier='Premium') == make_cache_key('ai', tier='premium')
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from models.database import Database
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    yield db
+    asyncio.run(db.close())
+
+def test_writes_wait_for_an_open_transaction(db):
+    async def scenario():
+        await db.register_user(1, first_name='a')
+        order = []
+
+        async def failing_batch():
+            async with db.transaction() as conn:
+                await conn.execute("UPDATE users SET username = 'batch' WHERE user_id = 1")
+                order.append('batch')
+                await asyncio.sleep(0.01)
+                raise ValueError('half done')
+
+        async def handler():
+            await asyncio.sleep(0)
+            await db.execute("UPDATE users SET first_name = 'handler' WHERE user_id = 1")
+            order.append('handler')
+
+        results = await asyncio.gather(failing_batch(), handler(), return_exceptions=True)
+        row = await db.fetchone('SELECT username, first_name FROM users WHERE user_id = 1')
+        return order, results, row
+
+    order, results, row = asyncio.run(scenario())
+    assert order == ['batch', 'handler']
+    assert isinstance(results[0], ValueError)
+    # The batch was rolled back on its own; the handler's write neither
+    # committed it early nor was lost with it
+    assert row == (None, 'handler')
+
+def test_failed_flush_is_retried_without_duplicating_rows(db):
+    async def scenario():
+        await db.register_user(1, first_name='a')
+        await db.execute('ALTER TABLE token_usage RENAME TO token_usage_away')
+        await db.add_tweet_history(1, {'topic': 'cats'}, ['tweet'])
+        db.add_token_usage(1, 'generate', 10, 10)
+        # A handler writing while the flush is underway must not commit its history rows
+        await asyncio.gather(
+            db.flush(),
+            db.execute("UPDATE users SET username = 'handler' WHERE user_id = 1")
+        )
+        failed = await db.fetchone('SELECT COUNT(*) FROM tweet_history')
+        await db.execute('ALTER TABLE token_usage_away RENAME TO token_usage')
+        await db.flush()
+        return failed[0], await db.fetchone('SELECT COUNT(*) FROM tweet_history'), \
+            await db.fetchone('SELECT username FROM users')
+
+    failed, history, user = asyncio.run(scenario())
+    assert failed == 0
+    assert history == (1,)
+    assert user == ('handler',)
@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+from services import deepseek_service
+from models.subscription import SubscriptionTier
+from services.cache import GenerationCache
+from services.deepseek_service import run_generation
+from services.providers import current_command
+from services.resilience import CircuitBreaker, UpstreamGuard
+from services.usage import billing_account
+from utils.exceptions import OpenAIError, UpstreamUnavailableError
+
+class FakeReply:
+    def __init__(self):
+        self.started = False
+        self.failed = False
+
+    async def start(self):
+        self.started = True
+
+    async def fail(self):
+        self.failed = True
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setattr(deepseek_service, 'generation_cache', GenerationCache(variants=1))
+    monkeypatch.setattr(deepseek_service, 'upstream', UpstreamGuard(breaker=CircuitBreaker(failure_threshold=1)))
+    monkeypatch.setattr(deepseek_service.router, 'providers', [object()])
+
+def test_produces_caches_and_serves_from_cache():
+    calls = []
+
+    async def produce():
+        calls.append((current_command.get(), billing_account.get()))
+        return ['tweet']
+
+    async def scenario():
+        first = await run_generation(produce, '1 tweet', command='generate', cache_key='k', user_id=7)
+        second = await run_generation(produce, '1 tweet', command='generate', cache_key='k', user_id=7)
+        return first, second
+
+    assert asyncio.run(scenario()) == (['tweet'], ['tweet'])
+    # Routed and billed as the command while producing, and only once
+    assert calls == [('generate', (7, 'generate'))]
+    assert current_command.get() is None
+    assert billing_account.get() is None
+
+def test_incomplete_results_are_not_cached():
+    async def produce():
+        return ['only one']
+
+    async def scenario():
+        await run_generation(produce, '3 tweets', cache_key='k', cacheable=lambda tweets: len(tweets) == 3)
+        return await deepseek_service.generation_cache.get('k')
+
+    assert asyncio.run(scenario()) is None
+
+def test_failure_wraps_the_error_and_clears_the_reply():
+    reply = FakeReply()
+
+    async def produce():
+        raise ValueError('boom')
+
+    with pytest.raises(OpenAIError, match='boom'):
+        asyncio.run(run_generation(produce, '1 tweet', reply=reply))
+    assert reply.started and reply.failed
+
+def test_serves_stale_results_when_the_circuit_opens_mid_generation():
+    async def produce():
+        deepseek_service.upstream.breaker.record_failure()
+        raise UpstreamUnavailableError('down')
+
+    async def scenario():
+        # One variant short of a cache hit, but good enough to serve while degraded
+        deepseek_service.generation_cache.variants = 2
+        await deepseek_service.generation_cache.put('k', ['old tweet'])
+        return await run_generation(produce, '1 tweet', cache_key='k')
+
+    assert asyncio.run(scenario()) == ['old tweet']
+
+def test_open_circuit_without_stale_results_fails_fast():
+    deepseek_service.upstream.breaker.record_failure()
+    produced = []
+
+    async def produce():
+        produced.append(1)
+        return ['tweet']
+
+    with pytest.raises(UpstreamUnavailableError):
+        asyncio.run(run_generation(produce, '1 tweet', cache_key='k'))
+    assert not produced
+
+class FakeStream:
+    """A streamed completion that breaks off after its first chunk."""
+
+    def __init__(self):
+        self.closed = False
+        self.response = self
+
+    async def aclose(self):
+        self.closed = True
+
+    async def __aiter__(self):
+        delta = type('Delta', (), {'content': 'partial'})()
+        yield type('Chunk', (), {'choices': [type('Choice', (), {'index': 0, 'delta': delta, 'finish_reason': None})()]})()
+        raise ConnectionError('connection reset')
+
+class FakeRouter:
+    def __init__(self):
+        self.providers = [object()]
+        self.released = []
+
+    async def release(self, provider):
+        self.released.append(provider)
+
+def test_broken_stream_is_closed_and_its_provider_released(monkeypatch):
+    stream, router = FakeStream(), FakeRouter()
+    monkeypatch.setattr(deepseek_service, 'router', router)
+
+    async def create_completion(*args, **kwargs):
+        return 'provider', stream
+
+    monkeypatch.setattr(deepseek_service, '_create_completion', create_completion)
+
+    class Reply(FakeReply):
+        async def update_text(self, text):
+            pass
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(deepseek_service._stream_batch(
+            'prompt', 1, asyncio.Semaphore(1), SubscriptionTier.FREE, Reply()))
+    assert stream.closed
+    assert router.released == ['provider']
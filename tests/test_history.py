@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from models.database import Database
+
+USER_ID = 1
+
+def _topics(entries):
+    return [entry['input_data']['topic'] for entry in entries]
+
+@pytest.fixture
+def db(tmp_path):
+    """A database with ten entries for USER_ID, topic0 (oldest) .. topic9, the oldest six archived."""
+    async def setup():
+        db = Database(str(tmp_path / 'bot.db'))
+        await db.register_user(USER_ID, first_name='a')
+        await db.register_user(2, first_name='b')
+        for i in range(10):
+            await db.add_tweet_history(USER_ID, {'topic': f'topic{i}'}, [f'tweet {i}'])
+        await db.add_tweet_history(2, {'topic': 'other'}, ['other'])
+        await db.flush()
+        conn = await db.connect()
+        for i in range(10):
+            await conn.execute(
+                "UPDATE tweet_history SET created_at = datetime('now', ?) WHERE topic = ?",
+                (f'-{100 - i} days' if i < 6 else f'-{10 - i} days', f'topic{i}')
+            )
+        await conn.commit()
+        assert await db.archive_history(free_days=30, premium_days=365) == 6
+        return db
+
+    db = asyncio.run(setup())
+    yield db
+    asyncio.run(db.close())
+
+def test_pages_run_from_hot_into_archived_entries(db):
+    async def scenario():
+        first = await db.get_user_history(USER_ID, limit=4)
+        second = await db.get_user_history(USER_ID, limit=4, before_id=first[-1]['id'])
+        third = await db.get_user_history(USER_ID, limit=4, before_id=second[-1]['id'])
+        back = await db.get_user_history(USER_ID, limit=4, after_id=second[0]['id'])
+        return first, second, third, back
+
+    first, second, third, back = asyncio.run(scenario())
+    assert _topics(first) == ['topic9', 'topic8', 'topic7', 'topic6']
+    assert _topics(second) == ['topic5', 'topic4', 'topic3', 'topic2']
+    assert _topics(third) == ['topic1', 'topic0']
+    assert back == first
+
+def test_cursor_entry_archived_after_the_page_was_shown(db):
+    async def scenario():
+        conn = await db.connect()
+        # topic6 was the last entry on a page; it is archived before the user taps "Older"
+        await conn.execute("UPDATE tweet_history SET created_at = datetime('now', '-50 days') WHERE topic = 'topic6'")
+        await conn.commit()
+        entry_id = (await db.fetchone("SELECT id FROM tweet_history WHERE topic = 'topic6'"))[0]
+        await db.archive_history(free_days=30, premium_days=365)
+        return (
+            await db.get_user_history(USER_ID, limit=2, before_id=entry_id),
+            await db.get_user_history(USER_ID, limit=2, start_id=entry_id),
+            await db.get_user_history(USER_ID, limit=5, after_id=entry_id)
+        )
+
+    older, start, newer = asyncio.run(scenario())
+    assert _topics(older) == ['topic5', 'topic4']
+    assert _topics(start) == ['topic6', 'topic5']
+    assert _topics(newer) == ['topic9', 'topic8', 'topic7']
+
+def test_archived_entries_can_be_opened_by_their_owner_only(db):
+    async def scenario():
+        oldest = (await db.get_user_history(USER_ID, limit=10))[-1]
+        return (
+            await db.get_history_entry(USER_ID, oldest['id']),
+            await db.get_history_entry(2, oldest['id'])
+        )
+
+    entry, other = asyncio.run(scenario())
+    assert entry['input_data']['topic'] == 'topic0'
+    assert entry['generated_tweets'] == ['tweet 0']
+    assert other is None
+
+def test_unknown_cursor_gives_an_empty_page(db):
+    assert asyncio.run(db.get_user_history(USER_ID, before_id=10_000)) == []
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from bot_commands.history_commands import back_to_history, view_history_entry
+from models.database import Database
+
+class FakeMessage:
+    def __init__(self):
+        self.text = None
+        self.reply_markup = None
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        self.text = text
+        self.reply_markup = reply_markup
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.answered = False
+        self.message = FakeMessage()
+
+    async def answer(self, *args):
+        self.answered = True
+
+@pytest.fixture
+def db(tmp_path):
+    async def setup():
+        db = Database(str(tmp_path / 'bot.db'))
+        await db.register_user(1, first_name='a')
+        for i in range(3):
+            await db.add_tweet_history(1, {'topic': f'topic{i}'}, [f'tweet {i}'])
+        await db.flush()
+        return db
+
+    db = asyncio.run(setup())
+    yield db
+    asyncio.run(db.close())
+
+def _press(handler, db, data):
+    query = FakeQuery(data)
+    update = SimpleNamespace(callback_query=query, effective_user=SimpleNamespace(id=1))
+    asyncio.run(handler(update, SimpleNamespace(bot_data={'db': db})))
+    assert query.answered
+    return query.message
+
+def _callbacks(message):
+    return [button.callback_data for row in message.reply_markup.inline_keyboard for button in row]
+
+def test_entry_and_back_buttons_carry_ids(db):
+    page = _press(back_to_history, db, 'history_page_3')
+    view = _callbacks(page)[0]
+    assert view == 'history_view_3_3'
+    entry = _press(view_history_entry, db, view)
+    assert 'topic2' in entry.text
+    assert _callbacks(entry) == ['history_page_3']
+
+def test_buttons_sent_before_ids_still_work(db):
+    entry = _press(view_history_entry, db, 'history_view_1')
+    assert 'topic1' in entry.text
+    assert _callbacks(entry) == ['history_page_3']
+    assert _press(view_history_entry, db, 'history_view_4').text == 'Entry not found.'
+    page = _press(back_to_history, db, 'history_back')
+    assert 'topic2' in page.text and 'topic0' in page.text
@@ -0,0 +1,64 @@
+import asyncio
+import sqlite3
+from models.database import Database
+from models.maintenance import convert_to_incremental_vacuum, run_maintenance
+
+def _auto_vacuum(path) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+
+def test_new_databases_use_incremental_vacuum(tmp_path):
+    async def scenario():
+        db = Database(str(tmp_path / 'bot.db'))
+        await db.connect()
+        await db.close()
+
+    asyncio.run(scenario())
+    assert _auto_vacuum(tmp_path / 'bot.db') == 2
+    assert _auto_vacuum(tmp_path / 'archive.db') == 2
+
+def test_startup_leaves_existing_databases_alone(tmp_path):
+    path = tmp_path / 'bot.db'
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE leftover (x)')
+
+    async def scenario():
+        db = Database(str(path))
+        await db.connect()
+        await db.close()
+
+    asyncio.run(scenario())
+    # No full VACUUM at startup; that is left to the offline conversion
+    assert _auto_vacuum(path) == 0
+    assert asyncio.run(convert_to_incremental_vacuum(str(path)))
+    assert _auto_vacuum(path) == 2
+    assert not asyncio.run(convert_to_incremental_vacuum(str(path)))
+
+def test_maintenance_archives_and_prunes_alongside_other_writes(tmp_path):
+    async def scenario():
+        db = Database(str(tmp_path / 'bot.db'))
+        await db.register_user(1, first_name='a')
+        for i in range(3):
+            await db.add_tweet_history(1, {'topic': f'topic{i}'}, ['tweet'])
+        await db.flush()
+        await db.execute("UPDATE tweet_history SET created_at = datetime('now', '-400 days') WHERE topic = 'topic0'")
+        await db.execute("UPDATE tweet_history SET created_at = datetime('now', '-60 days') WHERE topic = 'topic1'")
+        report, _ = await asyncio.gather(
+            run_maintenance(db, free_retention_days=90, premium_retention_days=365,
+                            free_archive_days=30, premium_archive_days=90),
+            db.execute("UPDATE users SET username = 'handler' WHERE user_id = 1")
+        )
+        rows = (
+            await db.fetchall('SELECT topic FROM main.tweet_history'),
+            await db.fetchall('SELECT topic FROM archive.tweet_history'),
+            await db.fetchone('SELECT username FROM users')
+        )
+        await db.close()
+        return report, rows
+
+    report, (hot, archived, user) = asyncio.run(scenario())
+    assert report['archived_rows'] == 2
+    assert report['deleted_rows']['archive.tweet_history'] == 1
+    assert hot == [('topic2',)]
+    assert archived == [('topic1',)]
+    assert user == ('handler',)
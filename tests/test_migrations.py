@@ -0,0 +1,76 @@
+import asyncio
+import json
+import aiosqlite
+import pytest
+from models import migrations
+from models.database import Database
+from models.migrations import SCHEMA_VERSION, migrate
+
+def _version(conn):
+    async def read():
+        async with conn.execute('PRAGMA user_version') as cursor:
+            return (await cursor.fetchone())[0]
+    return read()
+
+def test_fresh_database_is_migrated_once(tmp_path):
+    async def scenario():
+        async with aiosqlite.connect(str(tmp_path / 'bot.db'), isolation_level=None) as conn:
+            assert await migrate(conn) == SCHEMA_VERSION
+            assert await migrate(conn) == SCHEMA_VERSION
+            return await _version(conn)
+
+    assert asyncio.run(scenario()) == SCHEMA_VERSION
+
+def test_newer_schema_is_left_alone(tmp_path):
+    async def scenario():
+        async with aiosqlite.connect(str(tmp_path / 'bot.db'), isolation_level=None) as conn:
+            await conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+            assert await migrate(conn) == SCHEMA_VERSION + 1
+            async with conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'") as cursor:
+                return await cursor.fetchall()
+
+    assert asyncio.run(scenario()) == []
+
+def test_failed_migration_is_rolled_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [
+        ['CREATE TABLE a (x)'],
+        ['CREATE TABLE b (x)', 'INSERT INTO missing VALUES (1)'],
+    ])
+
+    async def scenario():
+        async with aiosqlite.connect(str(tmp_path / 'bot.db'), isolation_level=None) as conn:
+            with pytest.raises(aiosqlite.Error):
+                await migrate(conn, 2)
+            async with conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'") as cursor:
+                return await _version(conn), await cursor.fetchall()
+
+    assert asyncio.run(scenario()) == (1, [('a',)])
+
+def test_old_history_and_usage_rows_are_upgraded(tmp_path):
+    path = str(tmp_path / 'bot.db')
+
+    async def scenario():
+        async with aiosqlite.connect(path, isolation_level=None) as conn:
+            # History as stored before compaction, usage as stored before costs
+            await migrate(conn, 2)
+            await conn.execute("INSERT INTO users (user_id, first_name) VALUES (1, 'a')")
+            await conn.execute(
+                'INSERT INTO tweet_history (user_id, input_data, generated_tweets) VALUES (?, ?, ?)',
+                (1, json.dumps({'topic': 'cats', 'tone': 'witty'}), json.dumps(['one', 'two']))
+            )
+            await migrate(conn, 5)
+            await conn.execute(
+                "INSERT INTO token_usage (user_id, day, command, requests, prompt_tokens, completion_tokens) "
+                "VALUES (1, '2026-01-01', 'generate', 1, 1000, 1000)"
+            )
+
+        db = Database(path)
+        history = await db.get_user_history(1)
+        cost = await db.fetchone('SELECT cost_usd FROM token_usage')
+        await db.close()
+        return history, cost[0]
+
+    history, cost = asyncio.run(scenario())
+    assert [(entry['input_data']['topic'], entry['input_data']['tone']) for entry in history] == [('cats', 'witty')]
+    assert history[0]['generated_tweets'] == ['one', 'two']
+    assert cost == pytest.approx(0.09)
@@ -0,0 +1,69 @@
+import pytest
+from models.subscription import SubscriptionTier
+from services import model_selection
+from services.model_selection import SLO_MIN_SAMPLES, ModelSelector, _parse_policy
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_selection.time, 'monotonic', lambda: now[0])
+    return now
+
+def _selector(**kwargs):
+    policy = _parse_policy('free=fast, premium=balanced, premium:thread=strong')
+    return ModelSelector(policy, slo=10, window=60, **kwargs)
+
+def test_policy_picks_the_most_specific_level():
+    selector = _selector()
+    assert selector.choose(SubscriptionTier.FREE, 'thread') == 'fast'
+    assert selector.choose(SubscriptionTier.PREMIUM, 'generate') == 'balanced'
+    assert selector.choose(SubscriptionTier.PREMIUM, 'thread') == 'strong'
+    assert ModelSelector({}, slo=10).choose(SubscriptionTier.FREE) == 'strong'
+
+def test_unknown_policy_level_is_rejected():
+    with pytest.raises(ValueError):
+        _parse_policy('free=tiny')
+
+def test_long_queue_wait_picks_a_faster_model():
+    selector = _selector()
+    assert selector.choose(SubscriptionTier.PREMIUM, 'thread', queue_wait=6) == 'balanced'
+    # Already the fastest level
+    assert selector.choose(SubscriptionTier.FREE, queue_wait=6) == 'fast'
+
+def _observe(selector, clock, seconds):
+    for _ in range(SLO_MIN_SAMPLES):
+        selector.observe(seconds)
+    clock[0] += 60
+    selector.observe(seconds)
+
+def test_steps_down_on_slo_breach_and_back_up_after_recovery(clock):
+    selector = _selector()
+    _observe(selector, clock, 12)
+    assert selector.step_down == 1
+    assert selector.choose(SubscriptionTier.PREMIUM, 'thread') == 'balanced'
+    _observe(selector, clock, 12)
+    assert selector.step_down == 2
+    assert selector.choose(SubscriptionTier.PREMIUM, 'thread') == 'fast'
+    # Between the recovery threshold and the SLO nothing changes
+    _observe(selector, clock, 8)
+    assert selector.step_down == 2
+    _observe(selector, clock, 1)
+    assert selector.step_down == 1
+    assert selector.choose(SubscriptionTier.PREMIUM, 'thread') == 'balanced'
+
+def test_steps_at_most_once_per_window(clock):
+    selector = _selector()
+    _observe(selector, clock, 12)
+    for _ in range(SLO_MIN_SAMPLES):
+        selector.observe(12)
+    clock[0] += 30
+    selector.observe(12)
+    assert selector.step_down == 1
+
+def test_too_few_samples_change_nothing(clock):
+    selector = _selector()
+    for _ in range(SLO_MIN_SAMPLES - 2):
+        selector.observe(30)
+    clock[0] += 60
+    selector.observe(30)
+    assert selector.step_down == 0
@@ -0,0 +1,72 @@
+import asyncio
+import pickle
+from copy import deepcopy
+import pytest
+from models.database import Database
+from models.persistence import BotData, SQLitePersistence
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    yield db
+    asyncio.run(db.close())
+
+async def _updated_at(db, user_id):
+    return (await db.fetchone('SELECT updated_at FROM user_data WHERE user_id = ?', (user_id,)))[0]
+
+def test_unchanged_data_is_not_rewritten(db):
+    async def scenario():
+        persistence = SQLitePersistence(db)
+        await persistence.update_user_data(1, {'niche': 'SaaS'})
+        await db.execute("UPDATE user_data SET updated_at = 'marker'")
+        await persistence.update_user_data(1, {'niche': 'SaaS'})
+        unchanged = await _updated_at(db, 1)
+
+        # A fresh process that loaded the row doesn't write it back either
+        restarted = SQLitePersistence(db)
+        user_data = {}
+        await restarted.refresh_user_data(1, user_data)
+        await restarted.update_user_data(1, user_data)
+        reloaded = await _updated_at(db, 1)
+
+        user_data['tone'] = 'Casual'
+        await restarted.update_user_data(1, user_data)
+        row = await db.fetchone('SELECT data, updated_at FROM user_data WHERE user_id = 1')
+        return unchanged, user_data, reloaded, row
+
+    unchanged, user_data, reloaded, (data, updated_at) = asyncio.run(scenario())
+    assert unchanged == reloaded == 'marker'
+    assert pickle.loads(data) == {'niche': 'SaaS', 'tone': 'Casual'}
+    assert updated_at != 'marker'
+
+def test_each_shard_loads_only_its_users_conversations(db):
+    async def scenario():
+        writer = SQLitePersistence(db)
+        for user_id in (1, 2, 3, -5):
+            await writer.update_conversation('thread', (user_id, user_id), 1)
+        await writer.update_conversation('other', (7, 7), 1)
+        return (
+            await SQLitePersistence(db, shard=0, shards=2).get_conversations('thread'),
+            await SQLitePersistence(db, shard=1, shards=2).get_conversations('thread')
+        )
+
+    even, odd = asyncio.run(scenario())
+    assert even == {(2, 2): 1}
+    assert odd == {(1, 1): 1, (3, 3): 1, (-5, -5): 1}
+
+def test_finished_conversations_are_deleted(db):
+    async def scenario():
+        persistence = SQLitePersistence(db)
+        await persistence.update_conversation('thread', (1, 1), 2)
+        await persistence.update_conversation('thread', (1, 1), None)
+        return await SQLitePersistence(db).get_conversations('thread')
+
+    assert asyncio.run(scenario()) == {}
+
+def test_bot_data_copies_leave_out_process_services():
+    bot_data = BotData(db=object(), subscription_manager=object(), stats={'runs': [1]})
+    copy = deepcopy(bot_data)
+    assert isinstance(copy, BotData)
+    assert copy == {'stats': {'runs': [1]}}
+    assert copy['stats'] is not bot_data['stats']
+    pickle.dumps(copy)
@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from services.providers import Provider, ProviderRouter, providers_from_env, routes_from_env
+
+def _provider(name, concurrency=2, api_key='key'):
+    return Provider(name, base_url=None, api_key=api_key, models={'strong': (f'{name}-model', 0.01, 0.02)},
+                    concurrency=concurrency)
+
+def test_unconfigured_providers_are_not_routed_to():
+    router = ProviderRouter([_provider('a', api_key=None), _provider('b')])
+    assert [provider.name for provider in router.providers] == ['b']
+
+def test_chooses_the_best_scoring_provider():
+    slow, fast = _provider('slow'), _provider('fast')
+    router = ProviderRouter([slow, fast], explore_rate=0)
+    # Unmeasured providers score 0 and keep configuration order on ties
+    assert router.choose() is slow
+    slow.observe(2.0, stream=False, ok=True)
+    fast.observe(0.5, stream=False, ok=True)
+    assert router.choose() is fast
+    # Streams are measured separately
+    assert router.choose(stream=True) is slow
+    for _ in range(10):
+        fast.observe(0.5, stream=False, ok=False)
+    assert router.choose() is slow
+
+def test_routes_restrict_a_command_to_its_providers():
+    a, b = _provider('a'), _provider('b')
+    router = ProviderRouter([a, b], routes={'thread': ['b']}, explore_rate=0)
+    assert router.choose(command='thread') is b
+    assert router.choose(command='generate') is a
+    b.active = b.concurrency
+    assert router.choose(command='thread') is None
+
+def test_busy_providers_make_requests_wait_for_a_release():
+    provider = _provider('a', concurrency=1)
+    router = ProviderRouter([provider])
+
+    async def scenario():
+        first = await router.acquire()
+        waiting = asyncio.ensure_future(router.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        await router.release(first)
+        assert await asyncio.wait_for(waiting, 1) is provider
+        assert provider.active == 1
+
+    asyncio.run(scenario())
+
+def test_providers_from_env_fill_weaker_levels(monkeypatch):
+    monkeypatch.setenv('LLM_PROVIDERS', 'deepseek, custom, nourl')
+    monkeypatch.setenv('LLM_CUSTOM_BASE_URL', 'http://custom/v1')
+    monkeypatch.setenv('LLM_CUSTOM_API_KEY', 'key')
+    monkeypatch.setenv('LLM_CUSTOM_MODEL', 'big')
+    monkeypatch.setenv('LLM_CUSTOM_MODEL_FAST', 'small')
+    monkeypatch.setenv('LLM_CUSTOM_PROMPT_PRICE_FAST', '0.5')
+    deepseek, custom = providers_from_env()
+    assert deepseek.models == {'strong': 'deepseek-chat', 'balanced': 'deepseek-chat', 'fast': 'deepseek-chat'}
+    assert custom.base_url == 'http://custom/v1'
+    assert custom.models == {'strong': 'big', 'balanced': 'big', 'fast': 'small'}
+    assert custom.cost(1000, 1000, 'fast') == pytest.approx(0.5)
+
+def test_routes_from_env_drop_unknown_providers(monkeypatch):
+    monkeypatch.setenv('LLM_ROUTE_THREAD', 'openai, nowhere')
+    assert routes_from_env(['openai', 'local']) == {'thread': ['openai']}
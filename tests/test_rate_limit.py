@@ -0,0 +1,42 @@
+import pytest
+from models.subscription import SubscriptionTier
+from utils import rate_limit
+from utils.rate_limit import UserRateLimiter
+
+LIMITS = {
+    SubscriptionTier.FREE: (2, 3600),
+    SubscriptionTier.PREMIUM: (10, 36000)
+}
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: now[0])
+    return now
+
+def test_bucket_refills_over_time(clock):
+    limiter = UserRateLimiter(LIMITS)
+    assert limiter.consume(1, SubscriptionTier.FREE) == 0
+    assert limiter.consume(1, SubscriptionTier.FREE) == 0
+    assert limiter.consume(1, SubscriptionTier.FREE) == pytest.approx(1)
+    clock[0] += 1
+    assert limiter.consume(1, SubscriptionTier.FREE) == 0
+
+def test_buckets_idle_long_enough_to_refill_are_dropped(clock):
+    limiter = UserRateLimiter(LIMITS)
+    assert limiter.idle_ttl == 2
+    limiter.consume(1, SubscriptionTier.FREE)
+    clock[0] += 1
+    limiter.consume(2, SubscriptionTier.PREMIUM)
+    clock[0] += 1.5
+    limiter.consume(3, SubscriptionTier.FREE)
+    assert list(limiter._buckets) == [2, 3]
+    # The dropped user starts again from a full bucket, as they would have anyway
+    limiter.consume(1, SubscriptionTier.FREE)
+    assert limiter._buckets[1][0] == 1
+
+def test_loaded_buckets_that_have_refilled_are_not_kept(clock):
+    limiter = UserRateLimiter(LIMITS)
+    limiter.load([(1, 0.0, clock[0] - 1), (2, 0.0, clock[0] - 60)])
+    assert list(limiter._buckets) == [1]
+    assert limiter.consume(1, SubscriptionTier.FREE) == 0
@@ -0,0 +1,185 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+import pytest
+from services import resilience
+from services.resilience import CircuitBreaker, UpstreamGuard
+from services.scheduler import LLMScheduler
+from models.subscription import SubscriptionTier
+from utils.exceptions import UpstreamUnavailableError
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, 'retry_delay', lambda attempt, error: 0)
+
+def _expire_cooldown(breaker: CircuitBreaker) -> None:
+    breaker._opened_at = time.monotonic() - breaker.cooldown - 1
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.is_open
+    assert not breaker.allow()
+    assert breaker.retry_after > 0
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+    breaker.record_failure()
+    _expire_cooldown(breaker)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Others are refused, and told so, while the probe is out
+    assert not breaker.allow()
+    assert breaker.is_open
+
+def test_probe_success_closes_and_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+    breaker.record_failure()
+    _expire_cooldown(breaker)
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+    breaker.record_failure()
+    _expire_cooldown(breaker)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 3
+
+def test_cancelled_probe_does_not_wedge_the_breaker():
+    guard = UpstreamGuard(timeout=5, max_attempts=1, hedge_ratio=0,
+                          breaker=CircuitBreaker(failure_threshold=1, cooldown=60))
+    guard.breaker.record_failure()
+    _expire_cooldown(guard.breaker)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def ok():
+        return 'ok'
+
+    async def scenario():
+        probe = asyncio.ensure_future(guard.call(hang, hedge=False))
+        await asyncio.sleep(0.01)
+        assert guard.breaker.is_open
+        with pytest.raises(UpstreamUnavailableError):
+            await guard.call(ok, hedge=False)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not guard.breaker.is_open
+        # The next request probes instead, and closes the circuit
+        assert await guard.call(ok, hedge=False) == 'ok'
+
+    asyncio.run(scenario())
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+def test_retries_retriable_errors_and_records_success():
+    guard = UpstreamGuard(timeout=5, max_attempts=3, hedge_ratio=0)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise asyncio.TimeoutError()
+        return 'ok'
+
+    assert asyncio.run(guard.call(flaky, hedge=False)) == 'ok'
+    assert len(attempts) == 3
+    assert guard.retries == 2
+    assert guard.breaker.failures == 0
+
+def test_non_retriable_errors_fail_immediately():
+    guard = UpstreamGuard(timeout=5, max_attempts=3, hedge_ratio=0)
+    attempts = []
+
+    async def bad():
+        attempts.append(1)
+        raise ValueError('bad request')
+
+    with pytest.raises(ValueError):
+        asyncio.run(guard.call(bad, hedge=False))
+    assert len(attempts) == 1
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+def test_backoff_wraps_only_the_waits_between_attempts():
+    guard = UpstreamGuard(timeout=5, max_attempts=3, hedge_ratio=0)
+    backoffs = []
+
+    @asynccontextmanager
+    async def backoff():
+        backoffs.append(1)
+        yield
+
+    async def failing():
+        raise asyncio.TimeoutError()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(guard.call(failing, hedge=False, backoff=backoff))
+    assert len(backoffs) == 2
+
+def test_hedge_answers_first_when_the_original_is_slow():
+    guard = UpstreamGuard(timeout=5, max_attempts=1, hedge_ratio=1, hedge_min_delay=0.01)
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        guard.latency.observe(0.01)
+    calls = []
+
+    async def request():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+            return 'slow'
+        return 'hedge'
+
+    assert asyncio.run(guard.call(request)) == 'hedge'
+    assert guard.hedges == 1
+    assert guard.hedge_wins == 1
+
+def test_paused_slot_is_free_for_others_and_reacquired():
+    scheduler = LLMScheduler(max_concurrency=1)
+
+    async def scenario():
+        async with scheduler.slot(SubscriptionTier.FREE) as slot:
+            async with slot.paused():
+                assert scheduler.active == 0
+                async with scheduler.slot(SubscriptionTier.PREMIUM):
+                    assert scheduler.active == 1
+            assert slot.held
+            assert scheduler.active == 1
+        assert scheduler.active == 0
+
+    asyncio.run(scenario())
+
+def test_cancelling_during_the_hedge_delay_cancels_the_attempt():
+    guard = UpstreamGuard(timeout=5, max_attempts=1, hedge_ratio=1, hedge_min_delay=5)
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        guard.latency.observe(5)
+    cancelled = []
+
+    async def request():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def scenario():
+        call = asyncio.ensure_future(guard.call(request))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+        # Checked before asyncio.run cancels whatever is left over
+        assert cancelled == [1]
+
+    asyncio.run(scenario())
+    assert guard.hedges == 0
@@ -0,0 +1,89 @@
+import asyncio
+import time
+import pytest
+from models.subscription import SubscriptionTier
+from services.scheduler import LLMScheduler
+from utils.exceptions import OpenAIError
+
+def test_premium_requests_are_admitted_first_then_fifo():
+    scheduler = LLMScheduler(max_concurrency=1)
+    admitted = []
+
+    async def request(name, tier):
+        async with scheduler.slot(tier):
+            admitted.append(name)
+            await asyncio.sleep(0)
+
+    async def scenario():
+        async with scheduler.slot(SubscriptionTier.FREE):
+            tasks = [
+                asyncio.ensure_future(request('free 1', SubscriptionTier.FREE)),
+                asyncio.ensure_future(request('free 2', SubscriptionTier.FREE)),
+                asyncio.ensure_future(request('premium', SubscriptionTier.PREMIUM))
+            ]
+            await asyncio.sleep(0.01)
+            assert scheduler.stats()['queued'] == {'premium': 1, 'free': 2}
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert admitted == ['premium', 'free 1', 'free 2']
+    assert scheduler.active == 0
+
+def test_requests_wait_for_the_token_budget_to_refill():
+    scheduler = LLMScheduler(max_concurrency=4, tokens_per_minute=6000)
+
+    async def scenario():
+        async with scheduler.slot(tokens=6000):
+            started = time.monotonic()
+            # 100 tokens a second, so 10 more tokens take about 0.1s
+            async with scheduler.slot(tokens=10):
+                return time.monotonic() - started
+
+    assert 0.08 <= asyncio.run(scenario()) < 1
+
+def test_cancelled_waiters_give_up_their_place():
+    scheduler = LLMScheduler(max_concurrency=1)
+
+    async def scenario():
+        async with scheduler.slot():
+            waiting = asyncio.ensure_future(scheduler.acquire())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            await asyncio.sleep(0)
+        assert scheduler.active == 0
+        async with scheduler.slot():
+            assert scheduler.active == 1
+
+    asyncio.run(scenario())
+
+def test_full_queue_rejects_new_requests():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+
+    async def scenario():
+        async with scheduler.slot():
+            waiting = asyncio.ensure_future(scheduler.acquire())
+            await asyncio.sleep(0)
+            with pytest.raises(OpenAIError):
+                await scheduler.acquire()
+            waiting.cancel()
+
+    asyncio.run(scenario())
+    assert scheduler.stats()['rejected'] == 1
+
+def test_resuming_after_a_pause_charges_the_retry_again():
+    scheduler = LLMScheduler(max_concurrency=1, tokens_per_minute=1000)
+
+    async def scenario():
+        async with scheduler.slot(tokens=400) as slot:
+            after_first = scheduler.stats()['tokens_available']
+            async with slot.paused():
+                # The paused slot costs nothing while it waits
+                assert scheduler.active == 0
+                assert scheduler.stats()['tokens_available'] == pytest.approx(after_first, abs=5)
+            assert scheduler.active == 1
+            return after_first, scheduler.stats()['tokens_available']
+
+    after_first, after_retry = asyncio.run(scenario())
+    assert after_first == pytest.approx(600, abs=5)
+    assert after_retry == pytest.approx(200, abs=5)
+    assert scheduler.active == 0
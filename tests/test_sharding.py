@@ -0,0 +1,72 @@
+import os
+import json
+import queue
+import asyncio
+import pytest
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder, ContextTypes, MessageHandler, filters
+from services.sharding import ShardedDispatcher, shard_for, update_user_id
+from loadtest.telegram_stub import RecordingRequest
+
+USER = {'id': 42, 'is_bot': False, 'first_name': 'a'}
+
+@pytest.mark.parametrize('update, user_id', [
+    ({'update_id': 1, 'message': {'from': USER, 'chat': {'id': -100}}}, 42),
+    ({'update_id': 1, 'callback_query': {'id': 'q', 'from': USER, 'message': {'chat': {'id': -100}}}}, 42),
+    ({'update_id': 1, 'poll_answer': {'poll_id': 'p', 'user': USER}}, 42),
+    # Channel posts have no sender, only the chat
+    ({'update_id': 1, 'channel_post': {'chat': {'id': -100}}}, -100),
+    ({'update_id': 1, 'poll': {'id': 'p', 'question': 'q'}}, 0),
+])
+def test_updates_are_routed_by_sender_then_chat(update, user_id):
+    assert update_user_id(update) == user_id
+
+def test_each_user_always_goes_to_the_same_worker():
+    dispatcher = ShardedDispatcher(factory=None, workers=3)
+    dispatcher._queues = [queue.Queue() for _ in range(3)]
+
+    def message(user_id, text):
+        return {'update_id': 1, 'message': {'from': {'id': user_id}, 'chat': {'id': user_id}, 'text': text}}
+
+    assert dispatcher.dispatch(message(4, 'a')) == shard_for(4, 3) == 1
+    assert asyncio.run(dispatcher.dispatch_async(message(4, 'b'))) == 1
+    assert dispatcher.dispatch(message(-4, 'c')) == 1
+    # Updates without any user or chat all land on the first worker
+    assert dispatcher.dispatch({'update_id': 2, 'poll': {'id': 'p'}}) == 0
+    assert dispatcher.routed == [1, 3, 0]
+    assert [json.loads(raw)['message']['text'] for raw in dispatcher._queues[1].queue] == ['a', 'b', 'c']
+
+async def _record(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    with open(context.bot_data['output'], 'a') as output:
+        output.write(f"{update.effective_user.id} {update.message.text}\n")
+
+def build_recording_application(index: int, workers: int) -> Application:
+    """Worker factory that appends every message it handles to a file per worker."""
+    app = ApplicationBuilder().token('1:test').request(RecordingRequest(record=False)).updater(None).build()
+    app.bot_data['output'] = os.path.join(os.environ['SHARDING_TEST_OUTPUT'], f'worker{index}.txt')
+    app.add_handler(MessageHandler(filters.TEXT, _record))
+    return app
+
+def test_stop_drains_every_queued_update(tmp_path, monkeypatch):
+    monkeypatch.setenv('SHARDING_TEST_OUTPUT', str(tmp_path))
+    dispatcher = ShardedDispatcher(build_recording_application, workers=2)
+    dispatcher.start()
+    try:
+        for i in range(40):
+            user = {'id': i % 5, 'is_bot': False, 'first_name': 'a'}
+            dispatcher.dispatch({'update_id': i, 'message': {
+                'message_id': i, 'date': 0, 'chat': {'id': i % 5, 'type': 'private'}, 'from': user, 'text': str(i)
+            }})
+    finally:
+        # Called right away: workers must still handle everything already queued
+        dispatcher.stop(timeout=60)
+
+    assert dispatcher.alive == 0
+    handled = {}
+    for index in range(2):
+        with open(tmp_path / f'worker{index}.txt') as output:
+            for line in output:
+                user_id, text = line.split()
+                assert shard_for(int(user_id), 2) == index
+                handled.setdefault(int(user_id), []).append(int(text))
+    assert handled == {user_id: list(range(user_id, 40, 5)) for user_id in range(5)}
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from services import streaming
+from services.streaming import StreamingReply
+
+class FakeMessage:
+    def __init__(self):
+        self.edits = []
+        self.options = []
+
+    async def edit_text(self, text, **kwargs):
+        self.edits.append(text)
+        self.options.append(kwargs)
+
+class FakeUpdate:
+    def __init__(self, chat_id):
+        self.effective_chat = type('Chat', (), {'id': chat_id})()
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(streaming.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(streaming, 'EDIT_INTERVAL', 1.0)
+    monkeypatch.setattr(streaming, '_last_edit', streaming.OrderedDict())
+    return now
+
+def _reply(chat_id):
+    return StreamingReply(FakeUpdate(chat_id), context=None, message=FakeMessage())
+
+def test_progress_edits_are_throttled_per_chat(clock):
+    first, second, other = _reply(1), _reply(1), _reply(2)
+
+    async def scenario():
+        await first.update_text('a')
+        await second.update_text('b')
+        await other.update_text('c')
+        clock[0] += 1
+        await second.update_text('d')
+
+    asyncio.run(scenario())
+    assert first.message.edits == ['a▌']
+    assert second.message.edits == ['d▌']
+    assert other.message.edits == ['c▌']
+
+def test_chats_drop_out_once_their_last_edit_stops_throttling(clock):
+    async def scenario():
+        await _reply(1).update_text('a')
+        clock[0] += 0.5
+        await _reply(2).update_text('b')
+        clock[0] += 0.6
+        await _reply(3).update_text('c')
+
+    asyncio.run(scenario())
+    assert list(streaming._last_edit) == [2, 3]
+
+def test_final_text_is_edited_again_to_add_buttons(clock):
+    reply = _reply(1)
+
+    async def scenario():
+        await reply.finish('done')
+        await reply.finish('done', reply_markup='buttons')
+        await reply.finish('done', reply_markup='buttons')
+
+    asyncio.run(scenario())
+    assert reply.message.edits == ['done', 'done']
+    assert reply.message.options == [{}, {'reply_markup': 'buttons'}]
@@ -0,0 +1,51 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+import aiosqlite
+import pytest
+from models.database import Database
+from models.maintenance import ACTIVE_PREMIUM_USERS_SQL
+from models.migrations import migrate
+from models.profile_cache import UserProfileCache
+from models.subscription import SubscriptionManager, SubscriptionTier
+
+@pytest.fixture
+def behind_utc(monkeypatch):
+    """Run with the host clock ten hours behind UTC."""
+    monkeypatch.setenv('TZ', 'Etc/GMT+10')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_expiry_is_stored_and_compared_in_utc(tmp_path, behind_utc):
+    async def scenario():
+        db = Database(str(tmp_path / 'bot.db'))
+        await db.register_user(1, first_name='a')
+        subscriptions = SubscriptionManager(db)
+        await subscriptions.set_premium_subscription(1, duration_days=1)
+        stored = datetime.fromisoformat((await db.fetchone('SELECT expires_at FROM subscriptions'))[0])
+        active = await db.fetchall(ACTIVE_PREMIUM_USERS_SQL)
+        # Load the tier from the database rather than the write-through cache
+        db.profiles = UserProfileCache()
+        tier = await subscriptions.get_user_subscription(1)
+        await db.close()
+        return stored, active, tier
+
+    stored, active, tier = asyncio.run(scenario())
+    assert abs(stored - (datetime.utcnow() + timedelta(days=1))) < timedelta(minutes=1)
+    assert active == [(1,)]
+    assert tier == SubscriptionTier.PREMIUM
+
+def test_migration_converts_local_expiry_to_utc(tmp_path, behind_utc):
+    async def scenario():
+        async with aiosqlite.connect(str(tmp_path / 'bot.db'), isolation_level=None) as conn:
+            await migrate(conn, 6)
+            await conn.execute(
+                "INSERT INTO subscriptions (user_id, tier, expires_at) VALUES (1, 'premium', '2026-01-01 08:00:00.5')"
+            )
+            await migrate(conn)
+            async with conn.execute('SELECT expires_at FROM subscriptions') as cursor:
+                return (await cursor.fetchone())[0]
+
+    assert asyncio.run(scenario()) == '2026-01-01 18:00:00'
@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from models.subscription import SubscriptionTier
+from services.usage import UsageMeter
+from utils.exceptions import BudgetExceededError
+
+class FakeDatabase:
+    """Keeps every user's usage in one total, for today and this month alike."""
+
+    def __init__(self):
+        self.tokens = {}
+        self.loads = 0
+
+    async def get_token_spend(self, user_id, since_day):
+        self.loads += 1
+        return self.tokens.get(user_id, 0)
+
+    def add_token_usage(self, user_id, command, prompt_tokens, completion_tokens, cost):
+        self.tokens[user_id] = self.tokens.get(user_id, 0) + prompt_tokens + completion_tokens
+
+def test_spend_is_kept_for_a_bounded_number_of_users():
+    db = FakeDatabase()
+    meter = UsageMeter({SubscriptionTier.FREE: (100, 0)}, db=db, max_users=2)
+
+    async def scenario():
+        await meter.check(1, SubscriptionTier.FREE)
+        meter.record(1, 'generate', 60, 40)
+        await meter.check(2, SubscriptionTier.FREE)
+        await meter.check(3, SubscriptionTier.FREE)
+        assert list(meter._spend) == [2, 3]
+        # User 1 was evicted; their spend is reloaded rather than forgotten
+        with pytest.raises(BudgetExceededError):
+            await meter.check(1, SubscriptionTier.FREE)
+
+    asyncio.run(scenario())
+    assert list(meter._spend) == [3, 1]
+    assert db.loads == 8
+
+def test_recently_checked_users_stay_cached():
+    db = FakeDatabase()
+    meter = UsageMeter({SubscriptionTier.FREE: (100, 0)}, db=db, max_users=2)
+
+    async def scenario():
+        await meter.check(1, SubscriptionTier.FREE)
+        await meter.check(2, SubscriptionTier.FREE)
+        await meter.check(1, SubscriptionTier.FREE)
+        await meter.check(3, SubscriptionTier.FREE)
+
+    asyncio.run(scenario())
+    assert list(meter._spend) == [1, 3]
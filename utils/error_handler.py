@@ -1,6 +1,13 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from utils.exceptions import TweetBotError, OpenAIError, DatabaseError, ValidationError
+from utils.exceptions import (
+    TweetBotError,
+    OpenAIError,
+    DatabaseError,
+    ValidationError,
+    BudgetExceededError,
+    UpstreamUnavailableError
+)
 import logging
 
 # Set up logging
@@ -18,32 +25,44 @@ async def handle_error(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Get the original error
     error = context.error
+    # Callback query updates (inline buttons) carry the message in the query
+    message = update.effective_message
     
     try:
         raise error
+    except UpstreamUnavailableError as e:
+        await message.reply_text(
+            "🛠 Our AI provider is having trouble right now. "
+            f"Please try again in {int(e.retry_after) + 5} seconds."
+        )
     except OpenAIError:
-        await update.message.reply_text(
+        await message.reply_text(
             "😕 Sorry, there was an error generating your tweets. "
             "Please try again in a moment."
         )
     except DatabaseError:
-        await update.message.reply_text(
+        await message.reply_text(
             "😕 There was an error accessing your data. "
             "Please try again later."
         )
     except ValidationError as e:
-        await update.message.reply_text(
+        await message.reply_text(
             f"⚠️ {str(e)}\n\n"
             "Please check your input and try again."
         )
+    except BudgetExceededError as e:
+        await message.reply_text(
+            f"🪫 {str(e)}\n\n"
+            "Premium members get a much larger budget: /subscribe"
+        )
     except TweetBotError as e:
-        await update.message.reply_text(
+        await message.reply_text(
             f"❌ {str(e)}\n\n"
             "If this persists, please contact support."
         )
     except Exception as e:
         # For unexpected errors
-        await update.message.reply_text(
+        await message.reply_text(
             "😔 An unexpected error occurred. "
             "Please try again later."
         )
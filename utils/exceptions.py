@@ -6,6 +6,13 @@ class OpenAIError(TweetBotError):
     """Raised when there's an error with OpenAI API."""
     pass
 
+class UpstreamUnavailableError(OpenAIError):
+    """Raised when the LLM upstream is failing and requests are refused for a while."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 class DatabaseError(TweetBotError):
     """Raised when there's a database error."""
     pass
@@ -16,4 +23,8 @@ class ValidationError(TweetBotError):
 
 class SubscriptionError(TweetBotError):
     """Raised when there's an error with subscription handling."""
+    pass
+
+class BudgetExceededError(TweetBotError):
+    """Raised when a user has used up their token budget."""
     pass 
\ No newline at end of file
@@ -0,0 +1,172 @@
+import time
+import functools
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+# Seconds; spans fast cache hits through slow GPT-4 generations
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0
+)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    """Base for metrics with optional labels, rendered in Prometheus text format."""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: List['_Metric'] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        (REGISTRY if registry is None else registry).append(self)
+
+    def labels(self, *values):
+        """Return the child for these label values, creating it on first use."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {child.value}']
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: List[_Metric] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {child.sum}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+REGISTRY: List[_Metric] = []
+
+def render(registry: List[_Metric] = None) -> str:
+    """Render every registered metric in Prometheus text exposition format."""
+    lines = []
+    for metric in (REGISTRY if registry is None else registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+def timed(histogram: Histogram, *label_values: str):
+    """Decorator recording how long each call of an async function takes."""
+    child = histogram.labels(*label_values)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+# Handlers (see services/instrumentation.instrument_handlers)
+HANDLER_DURATION = Histogram(
+    'bot_handler_duration_seconds', 'Time spent in each update handler', ['handler'])
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total', 'Exceptions raised by each update handler', ['handler'])
+
+# LLM calls
+GENERATION_DURATION = Histogram(
+    'llm_generate_duration_seconds', 'Total time of generate_tweets calls', ['source'])
+LLM_QUEUE_WAIT = Histogram(
+    'llm_queue_wait_seconds', 'Time a request waited for a concurrency and token slot', ['tier'])
+LLM_UPSTREAM_DURATION = Histogram(
+    'llm_upstream_duration_seconds', 'Time from sending a completion request to its last token', ['mode'])
+LLM_REQUESTS = Counter(
+    'llm_requests_total', 'Completion requests sent upstream', ['mode', 'outcome'])
+LLM_TOKENS = Counter(
+    'llm_tokens_total', 'Tokens reported in completion usage', ['kind'])
+
+# Database
+DB_DURATION = Histogram(
+    'db_operation_duration_seconds', 'Time of Database and SubscriptionManager calls', ['operation'])
+
+# Telegram Bot API
+TELEGRAM_DURATION = Histogram(
+    'telegram_api_duration_seconds', 'Bot API request latency', ['method'])
+TELEGRAM_ERRORS = Counter(
+    'telegram_api_errors_total', 'Failed Bot API requests', ['method', 'status'])
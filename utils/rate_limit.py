@@ -0,0 +1,144 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+from telegram import Update
+from telegram.ext import ContextTypes
+from models.subscription import SubscriptionTier
+
+logger = logging.getLogger(__name__)
+
+def _parse_limit(value: str) -> Tuple[float, float]:
+    """Parse a "burst:per_hour" limit setting."""
+    burst, per_hour = value.split(':')
+    return float(burst), float(per_hour)
+
+# Generation requests each tier may make: (burst size, sustained requests per hour)
+TIER_LIMITS = {
+    SubscriptionTier.FREE: _parse_limit(os.getenv('RATE_LIMIT_FREE', '5:20')),
+    SubscriptionTier.PREMIUM: _parse_limit(os.getenv('RATE_LIMIT_PREMIUM', '20:200'))
+}
+
+class UserRateLimiter:
+    """Per-user token buckets plus tracking of in-flight generation requests.
+
+    A bucket left idle long enough to refill completely is indistinguishable
+    from a new one, so it is dropped and recreated full on the user's next
+    request.
+    """
+
+    def __init__(self, limits: Dict[SubscriptionTier, Tuple[float, float]] = TIER_LIMITS):
+        self.limits = limits
+        # Seconds after which an untouched bucket is full under every tier
+        self.idle_ttl = max(
+            burst * 3600 / per_hour if per_hour else float('inf')
+            for burst, per_hour in limits.values()
+        )
+        # user_id -> [tokens, last refill time], least recently refilled first
+        self._buckets: "OrderedDict[int, List[float]]" = OrderedDict()
+        self._dirty = set()
+        self._in_flight = set()
+
+    def consume(self, user_id: int, tier: SubscriptionTier) -> float:
+        """Take one token from the user's bucket.
+
+        Returns 0 if the request is allowed, otherwise the number of seconds
+        until the next token becomes available.
+        """
+        burst, per_hour = self.limits.get(tier, self.limits[SubscriptionTier.FREE])
+        now = time.time()
+        self._evict_idle(now)
+        bucket = self._buckets.setdefault(user_id, [burst, now])
+        self._buckets.move_to_end(user_id)
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * per_hour / 3600)
+        bucket[1] = now
+        self._dirty.add(user_id)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) * 3600 / per_hour if per_hour else float('inf')
+
+    def begin(self, user_id: int, key: str) -> bool:
+        """Mark a request as in flight, returning False if an identical one already is."""
+        if (user_id, key) in self._in_flight:
+            return False
+        self._in_flight.add((user_id, key))
+        return True
+
+    def end(self, user_id: int, key: str) -> None:
+        """Mark a request as finished."""
+        self._in_flight.discard((user_id, key))
+
+    def load(self, rows: List[Tuple[int, float, float]]) -> None:
+        """Restore bucket state from persisted (user_id, tokens, updated_at) rows."""
+        for user_id, tokens, updated_at in sorted(rows, key=lambda row: row[2]):
+            self._buckets[user_id] = [tokens, updated_at]
+            self._buckets.move_to_end(user_id)
+        self._evict_idle(time.time())
+
+    def pop_dirty(self) -> List[Tuple[int, float, float]]:
+        """Return buckets changed since the last call, for persistence."""
+        rows = [
+            (user_id, *self._buckets[user_id])
+            for user_id in self._dirty if user_id in self._buckets
+        ]
+        self._dirty.clear()
+        return rows
+
+    def _evict_idle(self, now: float) -> None:
+        while self._buckets:
+            user_id, (_, updated_at) = next(iter(self._buckets.items()))
+            if now - updated_at < self.idle_ttl:
+                break
+            del self._buckets[user_id]
+
+# Shared limiter for all generation entry points
+rate_limiter = UserRateLimiter()
+
+def rate_limited(when: Optional[Callable] = None):
+    """Apply per-user rate limiting and duplicate suppression to a generation handler.
+
+    Requests over the user's tier limit are answered with a short notice
+    without running the handler, and an update identical to one the same
+    user already has in flight (a double tap) is dropped.
+    ``when(update, context)`` can restrict limiting to updates that will
+    actually generate.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            if when and not when(update, context):
+                return await handler(update, context)
+
+            user_id = update.effective_user.id
+            query = update.callback_query
+            key = f"{handler.__name__}:{query.data if query else update.message.text}"
+            if not rate_limiter.begin(user_id, key):
+                logger.info(f"Dropping duplicate in-flight request from user {user_id}")
+                if query:
+                    await query.answer()
+                return
+
+            try:
+                subscription_manager = context.bot_data['subscription_manager']
+                tier = await subscription_manager.get_user_subscription(user_id)
+                retry_after = rate_limiter.consume(user_id, tier)
+                if retry_after:
+                    notice = (
+                        f"⏳ You're generating too fast. "
+                        f"Please try again in {int(retry_after) + 1} seconds."
+                    )
+                    if query:
+                        await query.answer(notice)
+                    else:
+                        await update.message.reply_text(notice)
+                    return
+
+                return await handler(update, context)
+            finally:
+                rate_limiter.end(user_id, key)
+        return wrapper
+    return decorator